@@ -0,0 +1,487 @@
+"""
+Admissão de execuções de RPA por memória.
+
+Cada RPA abre um Chrome com interface, que ocupa algumas centenas de MB. Antes
+de iniciar um script, o servidor reserva a memória estimada para aquele sistema
+e só admite a execução se a memória projetada couber no orçamento e deixar a
+margem mínima livre no host (ou no cgroup do contêiner). O restante espera em
+fila, por ordem de chegada.
+
+A estimativa de cada sistema parte de RPA_MEMORIA_PADRAO_MB e é ajustada pelo
+pico de RSS medido na árvore de processos (shell, python e Chrome) das
+execuções anteriores. Sem /proc (ex.: Windows) vale apenas o orçamento sobre as
+estimativas e o limite de execuções simultâneas.
+
+O orçamento é do host, não do processo. Com um banco SQLite (RPA_ADMISSAO_DB),
+as reservas de todos os processos do host (workers do gunicorn, trabalhadores
+da fila) ficam nele, e cada admissão soma as reservas dos outros processos às
+próprias. A fila por ordem de chegada continua valendo dentro de cada processo.
+Reservas de processos que morreram, ou que pararam de ser atualizadas, são
+descartadas.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import closing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Reserva de outro processo sem atualização há mais tempo que isso é descartada
+_RESERVA_ABANDONADA = 30
+
+try:
+    _TAMANHO_PAGINA = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _TAMANHO_PAGINA = 4096
+
+
+def _ler_arquivo(caminho):
+    try:
+        with open(caminho) as arquivo:
+            return arquivo.read().strip()
+    except OSError:
+        return None
+
+
+def _ler_estatisticas_cgroup(caminho, campo):
+    conteudo = _ler_arquivo(caminho)
+    if not conteudo:
+        return 0
+    for linha in conteudo.splitlines():
+        nome, _, valor = linha.partition(' ')
+        if nome == campo:
+            return int(valor)
+    return 0
+
+
+def _memoria_cgroup():
+    """Retorna (limite, em_uso) em bytes do cgroup atual, ou None se não houver limite."""
+    # cgroup v2
+    limite = _ler_arquivo('/sys/fs/cgroup/memory.max')
+    if limite and limite != 'max':
+        uso = int(_ler_arquivo('/sys/fs/cgroup/memory.current') or 0)
+        # Cache de arquivos inativo é recuperável e não conta como uso
+        uso -= _ler_estatisticas_cgroup('/sys/fs/cgroup/memory.stat', 'inactive_file')
+        return int(limite), max(uso, 0)
+
+    # cgroup v1 (sem limite, o valor é um número enorme)
+    limite = _ler_arquivo('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+    if limite and int(limite) < 1 << 60:
+        uso = int(_ler_arquivo('/sys/fs/cgroup/memory/memory.usage_in_bytes') or 0)
+        uso -= _ler_estatisticas_cgroup('/sys/fs/cgroup/memory/memory.stat', 'total_inactive_file')
+        return int(limite), max(uso, 0)
+
+    return None
+
+
+def memoria_sistema():
+    """Memória total e disponível (MB) do host, limitada pelo cgroup; None se indisponível."""
+    conteudo = _ler_arquivo('/proc/meminfo')
+    if not conteudo:
+        return None
+
+    valores = {}
+    for linha in conteudo.splitlines():
+        nome, _, resto = linha.partition(':')
+        valores[nome] = int(resto.split()[0]) * 1024
+
+    total = valores.get('MemTotal', 0)
+    disponivel = valores.get('MemAvailable', valores.get('MemFree', 0))
+    fonte = 'host'
+
+    cgroup = _memoria_cgroup()
+    if cgroup and cgroup[0] < total:
+        limite, uso = cgroup
+        total = limite
+        disponivel = min(disponivel, limite - uso)
+        fonte = 'cgroup'
+
+    return {
+        'total_mb': round(total / MB),
+        'disponivel_mb': round(max(disponivel, 0) / MB),
+        'fonte': fonte
+    }
+
+
+def _mapa_filhos():
+    filhos = {}
+    try:
+        pids = [nome for nome in os.listdir('/proc') if nome.isdigit()]
+    except OSError:
+        return filhos
+
+    for pid in pids:
+        stat = _ler_arquivo(f'/proc/{pid}/stat')
+        if not stat:
+            continue
+        # O nome do processo (campo 2) pode conter espaços e parênteses
+        campos = stat.rsplit(')', 1)[-1].split()
+        if len(campos) > 1:
+            filhos.setdefault(int(campos[1]), []).append(int(pid))
+    return filhos
+
+
+def rss_arvore_mb(pid, filhos=None):
+    """RSS (MB) do processo e de todos os descendentes; None se não for possível medir."""
+    if filhos is None:
+        filhos = _mapa_filhos()
+
+    total = 0
+    medido = False
+    pendentes = [pid]
+    while pendentes:
+        atual = pendentes.pop()
+        statm = _ler_arquivo(f'/proc/{atual}/statm')
+        if statm:
+            total += int(statm.split()[1]) * _TAMANHO_PAGINA
+            medido = True
+        pendentes.extend(filhos.get(atual, []))
+
+    return round(total / MB, 1) if medido else None
+
+
+def _processo_vivo(pid):
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class _Reserva:
+    """Execução admitida: memória reservada e RSS medido da árvore de processos."""
+
+    def __init__(self, sistema, estimativa_mb):
+        self.id = uuid.uuid4().hex
+        self.sistema = sistema
+        self.estimativa_mb = estimativa_mb
+        self.pid = None
+        self.rss_mb = 0.0
+        self.pico_mb = 0.0
+
+    def monitorar(self, pid):
+        """Associa o processo do RPA para amostragem de RSS."""
+        self.pid = pid
+
+    def memoria_projetada(self):
+        return max(self.estimativa_mb, self.rss_mb)
+
+    def memoria_pendente(self):
+        # O que ainda deve crescer além do que já aparece como memória em uso
+        return max(self.estimativa_mb - self.rss_mb, 0)
+
+
+class AdmissaoMemoria:
+    """Fila de admissão de RPAs limitada pela memória projetada.
+
+    Com caminho, as reservas ficam em um banco SQLite compartilhado pelos
+    processos do host; sem ele, o orçamento vale só para este processo.
+    """
+
+    def __init__(self, orcamento_mb=0, margem_mb=512, padrao_mb=400,
+                 maximo_simultaneos=0, intervalo_amostragem=2.0, caminho=None):
+        self.caminho = caminho
+        self.margem_mb = margem_mb
+        self.padrao_mb = padrao_mb
+        self.maximo_simultaneos = maximo_simultaneos
+        self.intervalo_amostragem = intervalo_amostragem
+
+        memoria = memoria_sistema()
+        if orcamento_mb:
+            self.orcamento_mb = orcamento_mb
+        elif memoria:
+            # Sem orçamento configurado: 75% da memória do host/cgroup
+            self.orcamento_mb = int(memoria['total_mb'] * 0.75)
+        else:
+            self.orcamento_mb = 0
+
+        self._estimativas = {}
+        self._em_execucao = []
+        self._fila = deque()
+        self._condicao = threading.Condition()
+        self._amostrador = None
+        self._ultima_memoria = memoria
+        self.admitidos = 0
+        self.adiados = 0
+        self.expirados = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.ultimo_motivo = None
+
+        if caminho:
+            diretorio = os.path.dirname(caminho)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            with closing(self._conectar()) as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS reservas ('
+                    ' id TEXT PRIMARY KEY,'
+                    ' pid INTEGER NOT NULL,'
+                    ' sistema TEXT NOT NULL,'
+                    ' estimativa_mb REAL NOT NULL,'
+                    ' rss_mb REAL NOT NULL,'
+                    ' atualizado_em REAL NOT NULL)'
+                )
+
+    def _conectar(self):
+        """Abre uma conexão nova (seguro após fork e entre threads)."""
+        return sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+
+    def estimativa(self, sistema):
+        """Memória (MB) esperada para uma execução do sistema."""
+        return self._estimativas.get(sistema, {}).get('estimativa_mb', self.padrao_mb)
+
+    def _motivo_recusa(self, estimativa_mb, externas=()):
+        """Retorna por que a execução não cabe agora, ou None se pode ser admitida.
+
+        externas: reservas dos outros processos do host (_Reserva sem pid).
+        """
+        reservas = self._em_execucao + list(externas)
+        if not reservas:
+            # Sempre admite ao menos uma execução no host, mesmo acima do orçamento
+            return None
+
+        if self.maximo_simultaneos and len(reservas) >= self.maximo_simultaneos:
+            return 'limite_simultaneos'
+
+        projetada = sum(r.memoria_projetada() for r in reservas) + estimativa_mb
+        if self.orcamento_mb and projetada > self.orcamento_mb:
+            return 'orcamento'
+
+        memoria = self._ultima_memoria
+        if memoria:
+            pendente = sum(r.memoria_pendente() for r in reservas)
+            if memoria['disponivel_mb'] - pendente - estimativa_mb < self.margem_mb:
+                return 'memoria_disponivel'
+
+        return None
+
+    def _tentar_admitir(self, reserva):
+        """Decide a admissão e, se admitida, grava a reserva no banco na mesma transação."""
+        if not self.caminho:
+            return self._motivo_recusa(reserva.estimativa_mb)
+
+        try:
+            with closing(self._conectar()) as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    motivo = self._motivo_recusa(reserva.estimativa_mb, self._reservas_externas(conn))
+                    if motivo is None:
+                        conn.execute(
+                            'INSERT INTO reservas (id, pid, sistema, estimativa_mb, rss_mb, atualizado_em)'
+                            ' VALUES (?, ?, ?, ?, 0, ?)',
+                            (reserva.id, os.getpid(), reserva.sistema, reserva.estimativa_mb, time.time())
+                        )
+                    conn.execute('COMMIT')
+                    return motivo
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as erro:
+            # Banco indisponível não trava os RPAs: vale o orçamento deste processo
+            logger.warning(f"[ADMISSAO] Falha no banco de reservas, decidindo só com este processo: {erro}")
+            return self._motivo_recusa(reserva.estimativa_mb)
+
+    def _reservas_externas(self, conn):
+        """Reservas ativas dos outros processos; descarta as de processos mortos ou abandonadas."""
+        agora = time.time()
+        conn.execute('DELETE FROM reservas WHERE atualizado_em < ?', (agora - _RESERVA_ABANDONADA,))
+
+        externas = []
+        mortos = set()
+        linhas = conn.execute(
+            'SELECT pid, sistema, estimativa_mb, rss_mb FROM reservas WHERE pid != ?', (os.getpid(),)
+        ).fetchall()
+        for pid, sistema, estimativa_mb, rss_mb in linhas:
+            if pid in mortos or not _processo_vivo(pid):
+                mortos.add(pid)
+                continue
+            externa = _Reserva(sistema, estimativa_mb)
+            externa.rss_mb = rss_mb
+            externas.append(externa)
+
+        for pid in mortos:
+            conn.execute('DELETE FROM reservas WHERE pid = ?', (pid,))
+        return externas
+
+    def _remover_reserva(self, reserva):
+        if not self.caminho:
+            return
+        try:
+            with closing(self._conectar()) as conn:
+                conn.execute('DELETE FROM reservas WHERE id = ?', (reserva.id,))
+        except sqlite3.Error as erro:
+            # Sem a remoção, a reserva expira por _RESERVA_ABANDONADA
+            logger.warning(f"[ADMISSAO] Falha ao liberar a reserva de {reserva.sistema}: {erro}")
+
+    @contextmanager
+    def reservar(self, sistema, timeout=None):
+        """Aguarda a vez e a memória para executar um RPA do sistema.
+
+        Levanta TimeoutError se não for admitido dentro do prazo.
+        """
+        inicio = time.monotonic()
+        ficha = object()
+        estimativa_mb = self.estimativa(sistema)
+        reserva = _Reserva(sistema, estimativa_mb)
+        adiado = False
+
+        with self._condicao:
+            self._fila.append(ficha)
+            try:
+                while True:
+                    if self._fila[0] is ficha:
+                        self._ultima_memoria = memoria_sistema() or self._ultima_memoria
+                        motivo = self._tentar_admitir(reserva)
+                        if motivo is None:
+                            break
+                        self.ultimo_motivo = motivo
+                    else:
+                        motivo = 'fila'
+
+                    if not adiado:
+                        adiado = True
+                        self.adiados += 1
+                        logger.info(
+                            f"[ADMISSAO] {sistema} aguardando ({motivo}): "
+                            f"{len(self._em_execucao)} em execução, estimativa {estimativa_mb} MB"
+                        )
+
+                    restante = None if timeout is None else timeout - (time.monotonic() - inicio)
+                    if restante is not None and restante <= 0:
+                        self.expirados += 1
+                        raise TimeoutError(f"RPA {sistema} não admitido em {timeout}s ({motivo})")
+
+                    # Acorda periodicamente: a memória livre muda sem aviso
+                    espera = self.intervalo_amostragem
+                    self._condicao.wait(espera if restante is None else min(espera, restante))
+            finally:
+                self._fila.remove(ficha)
+                self._condicao.notify_all()
+
+            self._em_execucao.append(reserva)
+            esperou = time.monotonic() - inicio
+            self.admitidos += 1
+            self.espera_total += esperou
+            self.espera_maxima = max(self.espera_maxima, esperou)
+            self._garantir_amostrador()
+
+        if adiado:
+            logger.info(f"[ADMISSAO] {sistema} admitido após {esperou:.1f}s")
+
+        try:
+            yield reserva
+        finally:
+            self._remover_reserva(reserva)
+            with self._condicao:
+                self._em_execucao.remove(reserva)
+                self._atualizar_estimativa(reserva)
+                self._condicao.notify_all()
+
+    def _atualizar_estimativa(self, reserva):
+        if not reserva.pico_mb:
+            return
+
+        registro = self._estimativas.setdefault(reserva.sistema, {
+            'estimativa_mb': self.padrao_mb, 'pico_mb': 0.0, 'execucoes': 0
+        })
+        anterior = registro['estimativa_mb'] if registro['execucoes'] else reserva.pico_mb
+        # Sobe imediatamente com um pico maior; desce devagar
+        if reserva.pico_mb >= anterior:
+            registro['estimativa_mb'] = round(reserva.pico_mb)
+        else:
+            registro['estimativa_mb'] = round(0.8 * anterior + 0.2 * reserva.pico_mb)
+        registro['pico_mb'] = max(registro['pico_mb'], reserva.pico_mb)
+        registro['execucoes'] += 1
+
+    def _garantir_amostrador(self):
+        if self._amostrador is None:
+            self._amostrador = threading.Thread(target=self._amostrar, name='admissao-rss', daemon=True)
+            self._amostrador.start()
+
+    def _amostrar(self):
+        while True:
+            time.sleep(self.intervalo_amostragem)
+
+            with self._condicao:
+                reservas = list(self._em_execucao)
+            if not reservas:
+                continue
+
+            monitoradas = [r for r in reservas if r.pid]
+            filhos = _mapa_filhos() if monitoradas else {}
+            for reserva in monitoradas:
+                rss = rss_arvore_mb(reserva.pid, filhos)
+                if rss is not None:
+                    reserva.rss_mb = rss
+                    reserva.pico_mb = max(reserva.pico_mb, rss)
+
+            self._publicar(reservas)
+
+    def _publicar(self, reservas):
+        """Atualiza no banco o RSS das reservas deste processo (e mostra que seguem vivas)."""
+        if not self.caminho:
+            return
+        agora = time.time()
+        try:
+            with closing(self._conectar()) as conn:
+                conn.executemany(
+                    'UPDATE reservas SET rss_mb = ?, atualizado_em = ? WHERE id = ?',
+                    [(r.rss_mb, agora, r.id) for r in reservas]
+                )
+        except sqlite3.Error as erro:
+            logger.warning(f"[ADMISSAO] Falha ao atualizar as reservas no banco: {erro}")
+
+    def _estatisticas_externas(self):
+        if not self.caminho:
+            return None
+        try:
+            with closing(self._conectar()) as conn:
+                processos, projetada = conn.execute(
+                    'SELECT COUNT(DISTINCT pid), COALESCE(SUM(MAX(estimativa_mb, rss_mb)), 0) FROM reservas'
+                    ' WHERE pid != ? AND atualizado_em >= ?',
+                    (os.getpid(), time.time() - _RESERVA_ABANDONADA)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        return {'processos': processos, 'memoria_projetada_mb': round(projetada)}
+
+    def estatisticas(self):
+        """Decisões de admissão, memória reservada e estimativas por sistema."""
+        outros_processos = self._estatisticas_externas()
+        with self._condicao:
+            memoria = memoria_sistema() or self._ultima_memoria
+            return {
+                'banco': self.caminho,
+                'outros_processos': outros_processos,
+                'orcamento_mb': self.orcamento_mb,
+                'margem_mb': self.margem_mb,
+                'maximo_simultaneos': self.maximo_simultaneos,
+                'memoria': memoria,
+                'em_execucao': [
+                    {'sistema': r.sistema, 'estimativa_mb': r.estimativa_mb, 'rss_mb': r.rss_mb}
+                    for r in self._em_execucao
+                ],
+                'memoria_projetada_mb': round(sum(r.memoria_projetada() for r in self._em_execucao)),
+                'aguardando': len(self._fila),
+                'admitidos': self.admitidos,
+                'adiados': self.adiados,
+                'expirados': self.expirados,
+                'ultimo_motivo_adiamento': self.ultimo_motivo,
+                'espera_media_segundos': round(self.espera_total / self.admitidos, 3) if self.admitidos else 0.0,
+                'espera_maxima_segundos': round(self.espera_maxima, 3),
+                'estimativas': {
+                    sistema: dict(registro) for sistema, registro in self._estimativas.items()
+                }
+            }
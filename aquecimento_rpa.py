@@ -0,0 +1,247 @@
+"""
+Aquecimento dos RPAs em paralelo com a etapa do AD.
+
+Abrir o navegador, fazer login e (no Tasy) navegar até a tela de usuários não
+dependem do colaborador. Quando o job entra na etapa do AD, o servidor inicia
+cada RPA com --aguardar: o script faz essa parte, imprime SINAL_PRONTO e fica
+estacionado lendo o stdin. Quando a faixa RPA assume o job, o servidor entrega os
+argumentos do usuário (email, nome, CPF) como uma linha JSON e o script segue
+do ponto em que parou. Se o AD não encontra o usuário, as sessões que
+dependem do AD recebem {"cancelar": true} e encerram com CANCELADO, sem
+alterar nada.
+
+Lado do script: receber_argumentos() e VariaveisAdiadas (fluxos).
+Lado do servidor: AquecimentoRPA.iniciar() -> SessaoAquecida.
+
+A sessão aquecida só é iniciada se os limites do sistema e a admissão por
+memória a aceitarem na hora; caso contrário o RPA roda normalmente depois.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+
+from processos_rpa import encerrar_arvore, iniciar_processo
+from rastreio import ativar, iniciar_span
+from registro_log import variaveis_contexto
+from resultado_rpa import SINAL_PRONTO, CapturaSaida
+
+logger = logging.getLogger(__name__)
+
+RPA_AQUECIMENTO = os.getenv('RPA_AQUECIMENTO', '1').lower() in ('1', 'true')
+# Tempo máximo que um RPA aquecido aguarda o resultado do AD antes de desistir
+RPA_AQUECIMENTO_ESPERA = int(os.getenv('RPA_AQUECIMENTO_ESPERA', 600))
+
+AGUARDAR = '--aguardar'
+CANCELADO = 5
+
+# Prazo para o script encerrar sozinho após o cancelamento
+_ESPERA_CANCELAMENTO = 15
+
+
+class Cancelado(Exception):
+    """O servidor cancelou o RPA aquecido (usuário não encontrado no AD, job encerrado)."""
+
+
+# Lado do script
+
+def receber_argumentos(perfil=None, espera=RPA_AQUECIMENTO_ESPERA):
+    """Informa que o RPA está pronto e aguarda os argumentos do usuário no stdin.
+
+    Levanta Cancelado se o servidor cancelar, fechar o stdin ou não responder a tempo.
+    """
+    if perfil is not None:
+        perfil.etapa('aguardando_usuario')
+    print(SINAL_PRONTO, flush=True)
+
+    linha = {}
+    leitor = threading.Thread(target=lambda: linha.update(valor=sys.stdin.readline()), daemon=True)
+    leitor.start()
+    leitor.join(espera)
+
+    try:
+        mensagem = json.loads(linha.get('valor') or '{}')
+    except ValueError:
+        raise Cancelado()
+    if mensagem.get('cancelar') or not mensagem.get('argumentos'):
+        raise Cancelado()
+    return mensagem['argumentos']
+
+
+class VariaveisAdiadas(dict):
+    """Variáveis do fluxo cujas variáveis do usuário podem chegar depois do login.
+
+    gerar(*argumentos) retorna as variáveis do usuário. Sem argumentos, o motor
+    chama resolver() após o login, que os recebe do servidor.
+    """
+
+    def __init__(self, variaveis, gerar, argumentos=None):
+        super().__init__(variaveis)
+        self.gerar = gerar
+        self.pendente = argumentos is None
+        if not self.pendente:
+            self.update(gerar(*argumentos))
+
+    def resolver(self, perfil=None):
+        if self.pendente:
+            self.update(self.gerar(*receber_argumentos(perfil)))
+            self.pendente = False
+
+
+# Lado do servidor
+
+class SessaoAquecida:
+    """RPA iniciado antes do AD, com os limites do sistema e a admissão já obtidos."""
+
+    def __init__(self, aquecimento, sistema, processo, recursos, prazo, rastro):
+        self.aquecimento = aquecimento
+        self.sistema = sistema
+        self.processo = processo
+        self.rastro = rastro
+        self.captura = CapturaSaida(processo)
+        self.recursos = recursos
+        self.iniciada_em = time.monotonic()
+        self.entregue = False
+        self.viva_na_entrega = False
+        self._lock = threading.Lock()
+        self._liberada = False
+
+        # Libera limites e admissão assim que o processo termina, mesmo antes do resultado ser lido
+        threading.Thread(
+            target=self._vigiar, args=(prazo,), name=f"aquecimento-{sistema}", daemon=True
+        ).start()
+
+    def _vigiar(self, prazo):
+        try:
+            self.processo.wait(timeout=prazo)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[AQUECIMENTO] {self.sistema} excedeu {prazo}s; encerrando")
+            self.rastro.falhar(f"Prazo de {prazo}s excedido")
+        encerrar_arvore(self.processo)
+        self._liberar()
+        self.rastro.definir(codigo=self.processo.returncode, entregue=self.entregue)
+        self.rastro.encerrar()
+
+    def _liberar(self):
+        with self._lock:
+            if self._liberada:
+                return
+            self._liberada = True
+        self.recursos.close()
+
+    def _enviar(self, mensagem):
+        try:
+            self.processo.stdin.write(json.dumps(mensagem, ensure_ascii=False) + '\n')
+            self.processo.stdin.flush()
+            self.processo.stdin.close()
+        except (OSError, ValueError):
+            # O script já terminou (falha no login, por exemplo): o resultado dirá
+            pass
+
+    def entregar(self, argumentos):
+        """Entrega os argumentos do usuário; o script segue a partir do ponto estacionado."""
+        self.viva_na_entrega = self.processo.poll() is None
+        pronta = self.captura.pronto.is_set()
+        self._enviar({'argumentos': argumentos})
+        self.entregue = True
+        self.aquecimento._registrar('entregues', pronta=pronta, espera=time.monotonic() - self.iniciada_em)
+
+    def aproveitavel(self):
+        """False se o script terminou antes de receber o usuário (login falhou): o RPA roda de novo."""
+        return self.entregue and self.viva_na_entrega
+
+    def descartar(self):
+        """Registra a sessão que terminou antes da entrega (o RPA é executado do zero)."""
+        self._liberar()
+        self.aquecimento._registrar('descartadas')
+
+    def aguardar(self, timeout):
+        """Aguarda o resultado do RPA; TimeoutExpired encerra o processo."""
+        return self.captura.aguardar(timeout)
+
+    def cancelar(self):
+        """Cancela a sessão: o script encerra sem alterar nada e os recursos são liberados."""
+        self.rastro.definir(cancelada=True)
+        if self.processo.poll() is None:
+            self._enviar({'cancelar': True})
+            try:
+                self.processo.wait(timeout=_ESPERA_CANCELAMENTO)
+            except subprocess.TimeoutExpired:
+                encerrar_arvore(self.processo)
+        self._liberar()
+        self.aquecimento._registrar('canceladas')
+
+
+class AquecimentoRPA:
+    """Inicia sessões aquecidas dentro dos limites dos sistemas e da admissão por memória."""
+
+    def __init__(self, admissao, limites, espera=RPA_AQUECIMENTO_ESPERA):
+        self.admissao = admissao
+        self.limites = limites
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._contadores = {
+            'iniciadas': 0, 'sem_vaga': 0, 'entregues': 0, 'prontas_na_entrega': 0,
+            'canceladas': 0, 'descartadas': 0
+        }
+        self._espera_total = 0.0
+
+    def iniciar(self, sistema, script, limites, timeout):
+        """Inicia o RPA em modo --aguardar; None se não houver vaga agora."""
+        recursos = ExitStack()
+        try:
+            recursos.enter_context(self.limites.adquirir(
+                sistema, limites, duracao_maxima=self.espera + timeout + 60, timeout=0
+            ))
+            reserva = recursos.enter_context(self.admissao.reservar(sistema, timeout=0))
+        except TimeoutError:
+            recursos.close()
+            self._registrar('sem_vaga')
+            return None
+
+        # Span da sessão: o script do RPA o recebe como pai pelo TRACEPARENT
+        rastro = iniciar_span('rpa.aquecido', sistema=sistema)
+        try:
+            with ativar(rastro):
+                processo = iniciar_processo(
+                    f'python {script} {AGUARDAR}',
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    cwd=os.getcwd(),
+                    env={**os.environ, **variaveis_contexto()},
+                    shell=True
+                )
+        except Exception as erro:
+            recursos.close()
+            rastro.falhar(erro)
+            rastro.encerrar()
+            raise
+
+        reserva.monitorar(processo.pid)
+        self._registrar('iniciadas')
+        logger.info(f"[AQUECIMENTO] {sistema} iniciado enquanto o AD é processado")
+        return SessaoAquecida(self, sistema, processo, recursos, self.espera + timeout, rastro)
+
+    def _registrar(self, contador, pronta=None, espera=None):
+        with self._lock:
+            self._contadores[contador] += 1
+            if pronta:
+                self._contadores['prontas_na_entrega'] += 1
+            if espera is not None:
+                self._espera_total += espera
+
+    def estatisticas(self):
+        with self._lock:
+            entregues = self._contadores['entregues']
+            return {
+                'ativo': RPA_AQUECIMENTO,
+                **self._contadores,
+                'antecedencia_media': round(self._espera_total / entregues, 2) if entregues else 0.0
+            }
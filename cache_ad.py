@@ -0,0 +1,100 @@
+"""
+Cache TTL de leitura para consultas ao Active Directory.
+
+Mantém em memória os atributos retornados pelas consultas por login e por CPF,
+com tamanho máximo (LRU) e tempo de expiração, evitando um bind LDAPS
+completo a cada consulta repetida.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    """Cache LRU com expiração por tempo e contadores de uso."""
+
+    def __init__(self, tamanho_maximo=1000, ttl=300):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.expulsoes = 0
+        self.expirados = 0
+        self.invalidacoes = 0
+
+    def obter(self, chave):
+        """Retorna o valor em cache ou None se ausente/expirado."""
+        agora = time.monotonic()
+
+        with self._lock:
+            item = self._itens.get(chave)
+
+            if item is None:
+                self.faltas += 1
+                return None
+
+            valor, expira_em = item
+            if expira_em <= agora:
+                del self._itens[chave]
+                self.expirados += 1
+                self.faltas += 1
+                return None
+
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def definir(self, chave, valor):
+        """Armazena um valor, expulsando o menos usado se o cache estiver cheio."""
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + self.ttl)
+            self._itens.move_to_end(chave)
+
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+                self.expulsoes += 1
+
+    def invalidar(self, *chaves):
+        """Remove as chaves informadas do cache."""
+        with self._lock:
+            for chave in chaves:
+                if self._itens.pop(chave, None) is not None:
+                    self.invalidacoes += 1
+
+    def obter_ou_carregar(self, chave, carregar):
+        """Leitura com carga automática: consulta a origem apenas em caso de falta.
+
+        Resultados None (usuário não encontrado) não são armazenados.
+        """
+        valor = self.obter(chave)
+        if valor is not None:
+            return valor
+
+        valor = carregar()
+        if valor is not None:
+            self.definir(chave, valor)
+        return valor
+
+    def limpar(self):
+        """Remove todos os itens do cache."""
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        """Retorna os contadores de uso do cache."""
+        with self._lock:
+            total = self.acertos + self.faltas
+            return {
+                'itens': len(self._itens),
+                'tamanho_maximo': self.tamanho_maximo,
+                'ttl_segundos': self.ttl,
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+                'expulsoes': self.expulsoes,
+                'expirados': self.expirados,
+                'invalidacoes': self.invalidacoes,
+                'taxa_acerto': round(self.acertos / total, 4) if total else 0.0
+            }
@@ -0,0 +1,519 @@
+"""
+Gerador de carga e replay de webhooks de demissão.
+
+Envia rajadas de webhooks `demissao_colaborador` ao /webhook/solides, numa taxa
+e concorrência configuráveis. Os payloads podem ser sintéticos, no formato do
+Solides, ou capturados de um arquivo. A ferramenta mede a latência de aceite,
+o tempo de cada job do recebimento à conclusão e os picos de threads, memória
+e backlog.
+
+Por padrão o servidor roda no próprio processo, com simulações no lugar do AD
+(ldap3 MOCK_SYNC), do SMTP e dos RPAs. Cada simulação tem uma distribuição de
+latência configurável. Com --url os webhooks vão para um servidor real, e a
+conclusão dos jobs é acompanhada por /pipeline/status.
+
+Distribuições de latência (segundos):
+  2.5 | const:2.5 | uniforme:1:5 | normal:40:10 | lognormal:30:0.5 | exp:20
+
+Exemplos:
+  python carga_webhook.py --total 100 --taxa 0 --escala 0.05
+  python carga_webhook.py --total 100 --taxa 10 --latencia-rpa normal:40:10 --latencia-rpa-sistema tasy=normal:90:20
+  python carga_webhook.py --replay capturados.ndjson --novos-cpfs --url http://localhost:3000
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fábio', 'Gabriela', 'Hugo', 'Íris', 'João',
+         'Karina', 'Lucas', 'Marina', 'Nicolas', 'Otávio', 'Paula', 'Rafael', 'Sílvia', 'Tiago', 'Vânia']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Ferreira',
+              'Almeida', 'Ribeiro', 'Carvalho', 'Gomes', 'Martins', 'Araújo', 'Barbosa']
+DEPARTAMENTOS = ['Atendimento', 'Financeiro', 'Regulação', 'Tecnologia da Informação',
+                 'Comercial', 'Auditoria Médica', 'Recursos Humanos', 'Faturamento']
+CARGOS = ['Assistente Administrativo', 'Analista', 'Coordenador', 'Enfermeiro Auditor',
+          'Atendente', 'Auxiliar de Faturamento', 'Consultor Comercial']
+
+
+def distribuicao(texto, escala=1.0, rnd=random):
+    """Converte 'tipo:parâmetros' em uma função que sorteia uma latência (segundos)."""
+    partes = str(texto).split(':')
+    tipo = partes[0].lower()
+
+    try:
+        if len(partes) == 1:
+            valor = float(tipo)
+            amostrar = lambda: valor
+        else:
+            numeros = [float(p) for p in partes[1:]]
+            if tipo == 'const':
+                amostrar = lambda: numeros[0]
+            elif tipo == 'uniforme':
+                amostrar = lambda: rnd.uniform(numeros[0], numeros[1])
+            elif tipo == 'normal':
+                amostrar = lambda: rnd.gauss(numeros[0], numeros[1])
+            elif tipo == 'lognormal':
+                # Parâmetros: mediana e sigma (cauda longa, como RPAs reais)
+                mu = math.log(numeros[0])
+                amostrar = lambda: rnd.lognormvariate(mu, numeros[1])
+            elif tipo == 'exp':
+                amostrar = lambda: rnd.expovariate(1 / numeros[0])
+            else:
+                raise ValueError
+    except (ValueError, IndexError, ZeroDivisionError):
+        raise argparse.ArgumentTypeError(f"Distribuição inválida: {texto}")
+
+    return lambda: max(amostrar(), 0.0) * escala
+
+
+def gerar_cpf(rnd):
+    """CPF sintético com dígitos verificadores válidos, formatado."""
+    numeros = [rnd.randint(0, 9) for _ in range(9)]
+    for tamanho in (9, 10):
+        soma = sum(n * (tamanho + 1 - i) for i, n in enumerate(numeros[:tamanho]))
+        digito = (soma * 10) % 11
+        numeros.append(0 if digito == 10 else digito)
+    texto = ''.join(map(str, numeros))
+    return f"{texto[:3]}.{texto[3:6]}.{texto[6:9]}-{texto[9:]}"
+
+
+def gerar_payload(rnd, indice):
+    """Webhook de demissão sintético no formato enviado pelo Solides."""
+    nome = f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {rnd.choice(SOBRENOMES)}"
+    login = nome.lower().split()[0] + '.' + nome.lower().split()[-1] + str(indice)
+
+    return {
+        'acao': 'demissao_colaborador',
+        'dados': {
+            'nome': nome,
+            'email': f"{login}@carga.local",
+            'matricula': str(100000 + indice),
+            'data_demissao': time.strftime('%Y-%m-%d'),
+            'documentos': {'cpf': gerar_cpf(rnd)},
+            'departamento': {'nome': rnd.choice(DEPARTAMENTOS)},
+            'cargo': {'nome': rnd.choice(CARGOS)}
+        }
+    }
+
+
+def carregar_replay(caminho):
+    """Lê payloads capturados: lista JSON ou um JSON por linha (NDJSON)."""
+    with open(caminho, encoding='utf-8') as arquivo:
+        conteudo = arquivo.read().strip()
+
+    if conteudo.startswith('['):
+        return json.loads(conteudo)
+    return [json.loads(linha) for linha in conteudo.splitlines() if linha.strip()]
+
+
+def percentis(valores):
+    """p50/p90/p99/máximo de uma lista de valores."""
+    if not valores:
+        return {'n': 0}
+
+    ordenados = sorted(valores)
+
+    def p(q):
+        return ordenados[min(len(ordenados) - 1, int(round(q * (len(ordenados) - 1))))]
+
+    return {
+        'n': len(ordenados),
+        'media': round(sum(ordenados) / len(ordenados), 3),
+        'p50': round(p(0.5), 3),
+        'p90': round(p(0.9), 3),
+        'p99': round(p(0.99), 3),
+        'max': round(ordenados[-1], 3)
+    }
+
+
+def _rss_processo_mb():
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            return 0.0
+
+
+class SimuladorLocal:
+    """Servidor no próprio processo com AD, SMTP e RPAs simulados."""
+
+    def __init__(self, args, rnd):
+        self.args = args
+        self.rnd = rnd
+        self.concluidos = {}
+        self.emails_enviados = 0
+        self._lock = threading.Lock()
+
+        diretorio = tempfile.mkdtemp(prefix='carga-webhook-')
+        os.environ.update({
+            'LOG_NIVEL': os.getenv('LOG_NIVEL', 'INFO' if args.verboso else 'WARNING'),
+            'LOG_ARQUIVO': os.path.join(diretorio, 'integracao.jsonl'),
+            'DUPLICATAS_BACKEND': 'memoria',
+            'DUPLICATAS_SNAPSHOT': os.path.join(diretorio, 'duplicatas.json'),
+            'RPA_CACHE_DIR': os.path.join(diretorio, 'rpa'),
+            'HISTORICO_DB': os.path.join(diretorio, 'historico.db'),
+            # Locks de sessão, tokens de login, reservas de memória e fila distribuída do host ficam intocados
+            'RPA_LIMITES_DB': os.path.join(diretorio, 'limites_rpa.db'),
+            'RPA_FILA_DB': os.path.join(diretorio, 'fila_rpa.db'),
+            'RPA_ADMISSAO_DB': os.path.join(diretorio, 'admissao_rpa.db'),
+            'RPA_DISTRIBUIDO': '0',
+            'RASTREIO_ARQUIVO': os.path.join(diretorio, 'rastreio.jsonl'),
+            # Os RPAs são simulados: nada de sessões aquecidas com os scripts reais
+            'RPA_AQUECIMENTO': '0',
+            'BASE_DN': 'DC=carga,DC=local',
+            'WEBHOOK_SECRET': ''
+        })
+
+        import server
+        self.server = server
+
+        self._preparar_ad()
+        self._preparar_smtp()
+        self._preparar_rpas()
+
+        finalizar_original = server._finalizar_job
+
+        def finalizar(job):
+            finalizar_original(job)
+            with self._lock:
+                self.concluidos[job['job_id']] = time.monotonic()
+
+        server._finalizar_job = finalizar
+
+    def _preparar_ad(self):
+        from ldap3 import MOCK_SYNC, Connection, Server
+
+        self._servidor_ad = Server('carga-ad')
+        self._usuario_bind = 'cn=integracao,DC=carga,DC=local'
+        conexao = Connection(self._servidor_ad, user=self._usuario_bind, password='carga',
+                             client_strategy=MOCK_SYNC)
+        conexao.strategy.add_entry(self._usuario_bind, {'userPassword': 'carga', 'objectClass': ['person']})
+        self._conexao_dit = conexao
+        latencia = distribuicao(self.args.latencia_ad, self.args.escala, self.rnd)
+
+        def criar_conexao():
+            time.sleep(latencia())
+            conexao = Connection(self._servidor_ad, user=self._usuario_bind, password='carga',
+                                 client_strategy=MOCK_SYNC)
+            conexao.bind()
+            return conexao
+
+        self.server._criar_conexao_ad = criar_conexao
+
+    def cadastrar_no_ad(self, dados):
+        """Cria a conta do colaborador no AD simulado (exceto a fração 'não encontrados')."""
+        if self.rnd.random() < self.args.ad_nao_encontrado:
+            return
+
+        cpf = self.server.limpar_cpf(dados.get('documentos', {}).get('cpf'))
+        nome = dados.get('nome') or 'Colaborador Carga'
+        login = (dados.get('email') or f"{cpf}@carga.local").split('@')[0]
+        self._conexao_dit.strategy.add_entry(f"cn={login},DC=carga,DC=local", {
+            'objectClass': ['top', 'person', 'user'],
+            'cn': login,
+            'displayName': nome,
+            'sAMAccountName': login,
+            'employeeID': cpf,
+            'mail': f"{login}@carga.local",
+            'userPrincipalName': f"{login}@carga.local",
+            'userAccountControl': 512
+        })
+
+    def _preparar_smtp(self):
+        latencia = distribuicao(self.args.latencia_smtp, self.args.escala, self.rnd)
+        simulador = self
+
+        class SMTPSimulado:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def starttls(self):
+                pass
+
+            def login(self, *args):
+                pass
+
+            def send_message(self, msg):
+                time.sleep(latencia())
+                with simulador._lock:
+                    simulador.emails_enviados += 1
+
+            def quit(self):
+                pass
+
+        self.server.smtplib.SMTP = SMTPSimulado
+
+    def _preparar_rpas(self):
+        from resultado_rpa import ExecucaoRPA
+
+        padrao = distribuicao(self.args.latencia_rpa, self.args.escala, self.rnd)
+        por_sistema = {
+            sistema: distribuicao(texto, self.args.escala, self.rnd)
+            for sistema, texto in self.args.latencia_rpa_sistema
+        }
+        admissao = self.server.admissao_rpa
+
+        def executar(sistema_id, cmd, timeout, espera_admissao=None):
+            with admissao.reservar(sistema_id, timeout=espera_admissao):
+                duracao = por_sistema.get(sistema_id, padrao)()
+                if duracao > timeout:
+                    time.sleep(timeout)
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                time.sleep(duracao)
+
+            if self.rnd.random() < self.args.rpa_erros:
+                return ExecucaoRPA(1, erro_saida='Erro simulado')
+            return ExecucaoRPA(self.rnd.choice([0, 0, 0, 2, 3]))
+
+        self.server._executar_subprocesso_rpa = executar
+
+    def enviar(self, payload):
+        resposta = self.server.app.test_client().post('/webhook/solides', json=payload)
+        return resposta.status_code, resposta.get_json() or {}
+
+    def amostra(self):
+        return {
+            'threads': threading.active_count(),
+            'memoria_mb': _rss_processo_mb(),
+            'backlog': self.server.backlog_pipeline()
+        }
+
+    def pendentes(self, aceitos):
+        with self._lock:
+            return {job_id for job_id in aceitos if job_id not in self.concluidos}
+
+    def conclusoes(self):
+        with self._lock:
+            return dict(self.concluidos)
+
+
+class ClienteRemoto:
+    """Servidor real: envia por HTTP e acompanha os jobs por /pipeline/status."""
+
+    def __init__(self, args):
+        import requests
+
+        self.requests = requests
+        self.url = args.url.rstrip('/')
+        self.cabecalhos = {}
+        if os.getenv('WEBHOOK_SECRET'):
+            self.cabecalhos['X-Webhook-Secret'] = os.getenv('WEBHOOK_SECRET')
+        self.concluidos = {}
+        self._em_andamento = set()
+
+    def cadastrar_no_ad(self, dados):
+        pass
+
+    def enviar(self, payload):
+        resposta = self.requests.post(f"{self.url}/webhook/solides", json=payload,
+                                      headers=self.cabecalhos, timeout=60)
+        try:
+            return resposta.status_code, resposta.json()
+        except ValueError:
+            return resposta.status_code, {}
+
+    def amostra(self):
+        try:
+            status = self.requests.get(f"{self.url}/pipeline/status", timeout=10).json()
+        except Exception:
+            return {}
+        self._em_andamento = {job['job_id'] for job in status.get('jobs_em_andamento', [])}
+        return {'backlog': status.get('backlog', 0)}
+
+    def pendentes(self, aceitos):
+        agora = time.monotonic()
+        for job_id in aceitos:
+            if job_id not in self._em_andamento and job_id not in self.concluidos:
+                # Resolução limitada ao intervalo de consulta do /pipeline/status
+                self.concluidos[job_id] = agora
+        return {job_id for job_id in aceitos if job_id not in self.concluidos}
+
+    def conclusoes(self):
+        return dict(self.concluidos)
+
+
+def executar_carga(args):
+    rnd = random.Random(args.semente)
+
+    if args.replay:
+        base = carregar_replay(args.replay)
+        if not base:
+            raise SystemExit(f"Nenhum payload em {args.replay}")
+        payloads = [json.loads(json.dumps(base[i % len(base)])) for i in range(args.total or len(base))]
+        if args.novos_cpfs:
+            for payload in payloads:
+                payload.setdefault('dados', {}).setdefault('documentos', {})['cpf'] = gerar_cpf(rnd)
+    else:
+        payloads = [gerar_payload(rnd, i) for i in range(args.total)]
+
+    # Reentregas: o Solides pode reenviar o mesmo webhook
+    for i in range(1, len(payloads)):
+        if rnd.random() < args.duplicatas:
+            payloads[i] = payloads[rnd.randrange(i)]
+
+    alvo = ClienteRemoto(args) if args.url else SimuladorLocal(args, rnd)
+    for payload in payloads:
+        alvo.cadastrar_no_ad(payload.get('dados', {}))
+
+    enviados = {}
+    respostas = {}
+    latencias_aceite = []
+    picos = {'threads': 0, 'memoria_mb': 0.0, 'backlog': 0}
+    lock = threading.Lock()
+    encerrar_monitor = threading.Event()
+
+    def monitorar():
+        while not encerrar_monitor.is_set():
+            for chave, valor in alvo.amostra().items():
+                picos[chave] = max(picos[chave], valor)
+            encerrar_monitor.wait(args.intervalo_monitor)
+
+    monitor = threading.Thread(target=monitorar, daemon=True)
+    monitor.start()
+
+    def enviar(payload):
+        inicio = time.monotonic()
+        try:
+            codigo, corpo = alvo.enviar(payload)
+        except Exception as erro:
+            codigo, corpo = 'erro', {'erro': str(erro)}
+        fim = time.monotonic()
+
+        with lock:
+            latencias_aceite.append(fim - inicio)
+            chave = corpo.get('status') if codigo == 200 else codigo
+            respostas[chave] = respostas.get(chave, 0) + 1
+            if codigo == 200 and corpo.get('status') == 'aceito':
+                enviados[corpo['job_id']] = inicio
+
+    inicio_carga = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concorrencia, thread_name_prefix='carga') as executor:
+        for indice, payload in enumerate(payloads):
+            if args.taxa > 0:
+                atraso = inicio_carga + indice / args.taxa - time.monotonic()
+                if atraso > 0:
+                    time.sleep(atraso)
+            executor.submit(enviar, payload)
+    duracao_envio = time.monotonic() - inicio_carga
+
+    limite = time.monotonic() + args.espera_maxima
+    while alvo.pendentes(enviados) and time.monotonic() < limite:
+        time.sleep(0.2)
+
+    encerrar_monitor.set()
+    monitor.join()
+
+    conclusoes = alvo.conclusoes()
+    tempos = [conclusoes[j] - enviados[j] for j in enviados if j in conclusoes]
+    duracao_total = time.monotonic() - inicio_carga
+
+    resultado = {
+        'modo': 'remoto' if args.url else 'local',
+        'escala_latencias': args.escala,
+        'enviados': len(payloads),
+        'respostas': {str(k): v for k, v in respostas.items()},
+        'aceitos': len(enviados),
+        'concluidos': len(tempos),
+        'duracao_envio_segundos': round(duracao_envio, 3),
+        'duracao_total_segundos': round(duracao_total, 3),
+        'vazao_jobs_por_minuto': round(60 * len(tempos) / duracao_total, 2) if duracao_total else 0.0,
+        'latencia_aceite_ms': percentis([v * 1000 for v in latencias_aceite]),
+        'conclusao_segundos': percentis(tempos),
+        'picos': picos
+    }
+
+    if isinstance(alvo, SimuladorLocal):
+        resultado['emails_enviados'] = alvo.emails_enviados
+        resultado['admissao_rpa'] = alvo.server.admissao_rpa.estatisticas()
+        resultado['faixas'] = {
+            'ad': alvo.server.faixa_ad.estatisticas(),
+            'rpa': alvo.server.faixa_rpa.estatisticas()
+        }
+
+    return resultado
+
+
+def imprimir_relatorio(resultado):
+    print("=" * 60)
+    print(f"CARGA DE WEBHOOKS ({resultado['modo']}, latências x{resultado['escala_latencias']})")
+    print("=" * 60)
+    print(f"Enviados: {resultado['enviados']} | Aceitos: {resultado['aceitos']} | "
+          f"Concluídos: {resultado['concluidos']}")
+    print(f"Respostas: {resultado['respostas']}")
+    print(f"Envio: {resultado['duracao_envio_segundos']}s | Total: {resultado['duracao_total_segundos']}s | "
+          f"Vazão: {resultado['vazao_jobs_por_minuto']} jobs/min")
+
+    for titulo, chave in (('Aceite (ms)', 'latencia_aceite_ms'), ('Conclusão (s)', 'conclusao_segundos')):
+        dist = resultado[chave]
+        if dist['n']:
+            print(f"{titulo:<15} média {dist['media']:>9}  p50 {dist['p50']:>9}  p90 {dist['p90']:>9}  "
+                  f"p99 {dist['p99']:>9}  máx {dist['max']:>9}")
+
+    picos = resultado['picos']
+    print(f"Picos: threads {picos['threads']} | memória {picos['memoria_mb']:.0f} MB | backlog {picos['backlog']}")
+
+
+def _especificacao(texto):
+    distribuicao(texto)
+    return texto
+
+
+def _par_sistema(texto):
+    sistema, _, spec = texto.partition('=')
+    if not spec:
+        raise argparse.ArgumentTypeError(f"Use sistema=distribuição: {texto}")
+    return sistema, _especificacao(spec)
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--total', type=int, default=100, help='Webhooks a enviar (replay: padrão = arquivo)')
+    parser.add_argument('--taxa', type=float, default=0, help='Webhooks por segundo (0 = rajada)')
+    parser.add_argument('--concorrencia', type=int, default=10, help='Requisições simultâneas')
+    parser.add_argument('--replay', help='Arquivo JSON/NDJSON com payloads capturados')
+    parser.add_argument('--novos-cpfs', action='store_true', help='Troca os CPFs do replay por sintéticos')
+    parser.add_argument('--duplicatas', type=float, default=0.0, help='Fração de reentregas do mesmo payload')
+    parser.add_argument('--url', help='Servidor real (ex.: http://localhost:3000); sem ele roda local')
+    parser.add_argument('--latencia-ad', type=_especificacao, default='lognormal:0.3:0.5', help='Conexão ao AD simulado')
+    parser.add_argument('--latencia-smtp', type=_especificacao, default='uniforme:0.5:2', help='Envio do email simulado')
+    parser.add_argument('--latencia-rpa', type=_especificacao, default='lognormal:45:0.4', help='Execução de cada RPA simulado')
+    parser.add_argument('--latencia-rpa-sistema', type=_par_sistema, action='append', default=[],
+                        metavar='SISTEMA=DIST', help='Latência específica de um sistema (repetível)')
+    parser.add_argument('--rpa-erros', type=float, default=0.02, help='Fração de RPAs com erro')
+    parser.add_argument('--ad-nao-encontrado', type=float, default=0.05,
+                        help='Fração de colaboradores ausentes no AD')
+    parser.add_argument('--escala', type=float, default=1.0,
+                        help='Multiplica todas as latências simuladas (ex.: 0.01 para testes rápidos)')
+    parser.add_argument('--espera-maxima', type=float, default=3600, help='Segundos aguardando a conclusão')
+    parser.add_argument('--intervalo-monitor', type=float, default=0.5, help='Amostragem de picos (s)')
+    parser.add_argument('--semente', type=int, default=None, help='Semente aleatória (reprodutível)')
+    parser.add_argument('--json', help='Grava o resultado completo neste arquivo')
+    parser.add_argument('--verboso', action='store_true', help='Mostra os logs INFO do servidor')
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = _argumentos(sys.argv[1:])
+    resultado = executar_carga(args)
+    imprimir_relatorio(resultado)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+        print(f"\nResultado salvo em {args.json}")
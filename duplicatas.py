@@ -0,0 +1,319 @@
+"""
+Supressão de duplicatas de webhooks (mesmo CPF ou mesmo payload).
+
+Dois backends com a mesma interface:
+
+- IndiceDuplicatas: em memória, para um único processo. As chaves expiram por
+  TTL através de filas ordenadas por expiração (remoção O(1) amortizada), o
+  tamanho é limitado e o estado sobrevive a reinícios via um snapshot JSON.
+- RegistroDuplicatasSQLite: arquivo SQLite compartilhado entre vários workers
+  (gunicorn), com expiração indexada.
+
+Em ambos a verificação e a reivindicação das chaves são atômicas. Uma chave
+em processamento nunca expira nem é expulsa, por mais que o job demore: o TTL
+só começa a contar em finalizar(). No SQLite, a chave de um worker que morreu
+sem finalizar volta a expirar pelo TTL contado desde a reivindicação.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+
+def chave_payload(dados):
+    """Chave derivada do hash do payload (detecta reentregas idênticas)."""
+    canonico = json.dumps(dados, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return 'payload:' + hashlib.sha256(canonico.encode('utf-8')).hexdigest()[:32]
+
+
+def _processo_vivo(pid):
+    if not pid:
+        # Linhas anteriores à coluna pid expiram pelo TTL da reivindicação, como antes
+        return False
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _normalizar_chaves(chaves, ttl_padrao):
+    """Aceita 'chave', ['chave', ...] ou [('chave', ttl), ...] e retorna [(chave, ttl)]."""
+    if isinstance(chaves, str):
+        chaves = [chaves]
+    return [c if isinstance(c, tuple) else (c, ttl_padrao) for c in chaves]
+
+
+class IndiceDuplicatas:
+    """Índice em memória com expiração por TTL, tamanho limitado e snapshot em disco."""
+
+    def __init__(self, tempo_bloqueio, maximo=100000, arquivo_snapshot=None, intervalo_snapshot=30):
+        self.tempo_bloqueio = tempo_bloqueio
+        self.maximo = maximo
+        self.arquivo_snapshot = arquivo_snapshot
+        self.intervalo_snapshot = intervalo_snapshot
+        self._chaves = {}
+        self._expiracoes = {}
+        # Chave em processamento -> TTL, que começa a contar em finalizar()
+        self._processando = {}
+        self._lock = threading.Lock()
+        self._ultimo_snapshot = 0.0
+        self.reivindicadas = 0
+        self.duplicatas = 0
+        self.expiradas = 0
+        self.expulsas = 0
+
+        if arquivo_snapshot:
+            self._carregar_snapshot()
+            atexit.register(self.salvar_snapshot)
+
+    def _fila_expiracao(self, ttl):
+        # Uma fila por TTL (e uma para as restauradas do snapshot): dentro dela a ordem de inserção é a de expiração
+        fila = self._expiracoes.get(ttl)
+        if fila is None:
+            fila = self._expiracoes[ttl] = deque()
+        return fila
+
+    def _remover_expiradas(self, agora):
+        for fila in self._expiracoes.values():
+            while fila and fila[0][0] <= agora:
+                expira_em, chave = fila.popleft()
+                registro = self._chaves.get(chave)
+                # Entradas antigas de chaves já reivindicadas de novo são ignoradas
+                if registro and registro[1] == expira_em and chave not in self._processando:
+                    del self._chaves[chave]
+                    self.expiradas += 1
+
+    def _limitar_tamanho(self):
+        # Só as chaves finalizadas estão nas filas: as em processamento nunca são expulsas
+        while len(self._chaves) > self.maximo:
+            filas = [f for f in self._expiracoes.values() if f]
+            if not filas:
+                break
+            expira_em, chave = min(filas, key=lambda f: f[0][0]).popleft()
+            registro = self._chaves.get(chave)
+            if registro and registro[1] == expira_em and chave not in self._processando:
+                del self._chaves[chave]
+                self.expulsas += 1
+
+    def reivindicar(self, chaves):
+        """Reivindica todas as chaves ou nenhuma.
+
+        Retorna (True, None) quando reivindicadas, ou
+        (False, segundos_desde_a_reivindicacao_anterior) quando alguma é duplicata.
+        """
+        chaves = _normalizar_chaves(chaves, self.tempo_bloqueio)
+        agora = time.time()
+
+        with self._lock:
+            self._remover_expiradas(agora)
+
+            for chave, _ in chaves:
+                registro = self._chaves.get(chave)
+                if registro:
+                    self.duplicatas += 1
+                    return False, agora - registro[0]
+
+            for chave, ttl in chaves:
+                self._chaves[chave] = (agora, None)
+                self._processando[chave] = ttl
+
+            self.reivindicadas += 1
+            self._limitar_tamanho()
+            salvar = self.arquivo_snapshot and agora - self._ultimo_snapshot >= self.intervalo_snapshot
+
+        if salvar:
+            self.salvar_snapshot()
+
+        return True, None
+
+    def finalizar(self, chaves):
+        """Marca o processamento como concluído; o bloqueio continua pelo TTL a partir de agora."""
+        agora = time.time()
+        with self._lock:
+            for chave, _ in _normalizar_chaves(chaves, self.tempo_bloqueio):
+                ttl = self._processando.pop(chave, None)
+                registro = self._chaves.get(chave)
+                if ttl is None or not registro:
+                    continue
+                expira_em = agora + ttl
+                self._chaves[chave] = (registro[0], expira_em)
+                self._fila_expiracao(ttl).append((expira_em, chave))
+            self._limitar_tamanho()
+
+    def salvar_snapshot(self):
+        """Grava as chaves ainda válidas no arquivo de snapshot."""
+        if not self.arquivo_snapshot:
+            return
+
+        with self._lock:
+            agora = time.time()
+            self._remover_expiradas(agora)
+            # Em processamento: o job não sobrevive ao reinício, então o TTL conta a partir do snapshot
+            dados = {
+                chave: [registro[0], registro[1] or agora + self._processando.get(chave, self.tempo_bloqueio)]
+                for chave, registro in self._chaves.items()
+            }
+            self._ultimo_snapshot = agora
+
+        try:
+            diretorio = os.path.dirname(self.arquivo_snapshot)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            temporario = f"{self.arquivo_snapshot}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as arquivo:
+                json.dump(dados, arquivo)
+            os.replace(temporario, self.arquivo_snapshot)
+        except OSError as erro:
+            logger.warning(f"[AVISO] Falha ao gravar snapshot de duplicatas: {erro}")
+
+    def _carregar_snapshot(self):
+        try:
+            with open(self.arquivo_snapshot, encoding='utf-8') as arquivo:
+                dados = json.load(arquivo)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as erro:
+            logger.warning(f"[AVISO] Snapshot de duplicatas ignorado: {erro}")
+            return
+
+        agora = time.time()
+        for chave, (reivindicado_em, expira_em) in sorted(dados.items(), key=lambda item: item[1][1]):
+            if expira_em > agora:
+                self._chaves[chave] = (reivindicado_em, expira_em)
+                # Restauradas em ordem de expiração, numa fila própria
+                self._fila_expiracao('snapshot').append((expira_em, chave))
+
+        self._limitar_tamanho()
+        logger.info(f"[DUPLICATAS] {len(self._chaves)} chave(s) restaurada(s) do snapshot")
+
+    def estatisticas(self):
+        """Retorna tamanho e contadores do índice."""
+        with self._lock:
+            self._remover_expiradas(time.time())
+            return {
+                'backend': 'memoria',
+                'chaves': len(self._chaves),
+                'maximo': self.maximo,
+                'processando': len(self._processando),
+                'reivindicadas': self.reivindicadas,
+                'duplicatas': self.duplicatas,
+                'expiradas': self.expiradas,
+                'expulsas': self.expulsas,
+                'tempo_bloqueio_segundos': self.tempo_bloqueio
+            }
+
+
+class RegistroDuplicatasSQLite:
+    """Bloqueia chaves por um período, de forma atômica entre processos."""
+
+    def __init__(self, caminho, tempo_bloqueio):
+        self.caminho = caminho
+        self.tempo_bloqueio = tempo_bloqueio
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with closing(self._conectar()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS duplicatas ('
+                ' chave TEXT PRIMARY KEY,'
+                ' reivindicado_em REAL NOT NULL,'
+                ' processando INTEGER NOT NULL DEFAULT 1)'
+            )
+            colunas = [linha[1] for linha in conn.execute('PRAGMA table_info(duplicatas)')]
+            if 'expira_em' not in colunas:
+                conn.execute('ALTER TABLE duplicatas ADD COLUMN expira_em REAL NOT NULL DEFAULT 0')
+            if 'pid' not in colunas:
+                conn.execute('ALTER TABLE duplicatas ADD COLUMN pid INTEGER')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_duplicatas_expira_em ON duplicatas (expira_em)')
+
+    def _conectar(self):
+        """Abre uma conexão nova (seguro após fork e entre threads)."""
+        return sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+
+    def reivindicar(self, chaves):
+        """Reivindica todas as chaves ou nenhuma.
+
+        Retorna (True, None) quando reivindicadas, ou
+        (False, segundos_desde_a_reivindicacao_anterior) quando alguma é duplicata.
+        """
+        chaves = _normalizar_chaves(chaves, self.tempo_bloqueio)
+        agora = time.time()
+
+        with closing(self._conectar()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._liberar_orfas(conn)
+                conn.execute('DELETE FROM duplicatas WHERE expira_em <= ? AND processando = 0', (agora,))
+
+                marcadores = ','.join('?' * len(chaves))
+                linha = conn.execute(
+                    f'SELECT MIN(reivindicado_em) FROM duplicatas WHERE chave IN ({marcadores})',
+                    [chave for chave, _ in chaves]
+                ).fetchone()
+
+                if linha[0] is not None:
+                    conn.execute('COMMIT')
+                    return False, agora - linha[0]
+
+                conn.executemany(
+                    'INSERT OR REPLACE INTO duplicatas (chave, reivindicado_em, processando, expira_em, pid)'
+                    ' VALUES (?, ?, 1, ?, ?)',
+                    [(chave, agora, agora + ttl, os.getpid()) for chave, ttl in chaves]
+                )
+                conn.execute('COMMIT')
+                return True, None
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _liberar_orfas(self, conn):
+        # Chaves de workers que morreram sem finalizar: voltam a expirar pelo TTL da reivindicação
+        orfas = [
+            (chave,) for chave, pid in conn.execute('SELECT chave, pid FROM duplicatas WHERE processando = 1')
+            if not _processo_vivo(pid)
+        ]
+        if orfas:
+            conn.executemany('UPDATE duplicatas SET processando = 0 WHERE chave = ?', orfas)
+            logger.warning(f"[DUPLICATAS] {len(orfas)} chave(s) de worker encerrado liberada(s) para expirar")
+
+    def finalizar(self, chaves):
+        """Marca o processamento como concluído; o bloqueio continua pelo TTL a partir de agora."""
+        agora = time.time()
+        with closing(self._conectar()) as conn:
+            conn.executemany(
+                'UPDATE duplicatas SET processando = 0, expira_em = ? WHERE chave = ?',
+                [(agora + ttl, chave) for chave, ttl in _normalizar_chaves(chaves, self.tempo_bloqueio)]
+            )
+
+    def estatisticas(self):
+        """Retorna a quantidade de chaves válidas e em processamento."""
+        with closing(self._conectar()) as conn:
+            total, processando = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(processando), 0) FROM duplicatas'
+                ' WHERE expira_em > ? OR processando = 1',
+                (time.time(),)
+            ).fetchone()
+
+        return {
+            'backend': 'sqlite',
+            'chaves': total,
+            'processando': processando,
+            'tempo_bloqueio_segundos': self.tempo_bloqueio
+        }
@@ -0,0 +1,169 @@
+"""
+Barramento de eventos dos jobs de desligamento (em processo).
+
+Os trabalhadores do pipeline publicam o ciclo de vida de cada job (recebido, AD
+concluído, cada RPA iniciado/aguardando/concluído, email enviado, job concluído). Cada job
+guarda um buffer limitado de eventos com ids crescentes; quem acompanha (o
+endpoint SSE) lê a partir do último id visto. Publicar só acrescenta ao buffer
+e acorda os leitores, então um cliente lento nunca bloqueia um trabalhador:
+se ficar para trás além do buffer, perde os eventos mais antigos.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+TIPO_CONCLUIDO = 'concluido'
+
+
+class BarramentoEventos:
+    """Eventos e estado resumido dos jobs recentes deste processo."""
+
+    def __init__(self, maximo_por_job=200, maximo_jobs=500):
+        self.maximo_por_job = maximo_por_job
+        self.maximo_jobs = maximo_jobs
+        self._jobs = OrderedDict()
+        self._condicao = threading.Condition()
+        self._sequencia = 0
+        self.publicados = 0
+
+    def registrar_job(self, job_id, **dados):
+        """Começa a acompanhar um job (os demais eventos de jobs desconhecidos são ignorados)."""
+        with self._condicao:
+            self._jobs[job_id] = {
+                'estado': {
+                    'job_id': job_id,
+                    'etapa': 'recebido',
+                    'finalizado': False,
+                    'recebido_em': datetime.now().isoformat(),
+                    'atualizado_em': datetime.now().isoformat(),
+                    'sistemas': {},
+                    **dados
+                },
+                'eventos': deque(maxlen=self.maximo_por_job)
+            }
+            self._limitar_jobs()
+
+        self.publicar(job_id, 'recebido', **dados)
+
+    def _limitar_jobs(self):
+        # Descarta primeiro os jobs finalizados mais antigos
+        excedente = len(self._jobs) - self.maximo_jobs
+        if excedente <= 0:
+            return
+        for job_id in [j for j, r in self._jobs.items() if r['estado']['finalizado']][:excedente]:
+            del self._jobs[job_id]
+
+    def publicar(self, job_id, tipo, **dados):
+        """Registra um evento do job e acorda quem estiver acompanhando."""
+        if not job_id:
+            return None
+
+        with self._condicao:
+            registro = self._jobs.get(job_id)
+            if registro is None:
+                return None
+
+            self._sequencia += 1
+            evento = {
+                'id': self._sequencia,
+                'job_id': job_id,
+                'tipo': tipo,
+                'timestamp': datetime.now().isoformat(),
+                **dados
+            }
+            registro['eventos'].append(evento)
+            self._atualizar_estado(registro['estado'], evento)
+            self.publicados += 1
+            self._condicao.notify_all()
+
+        return evento
+
+    @staticmethod
+    def _atualizar_estado(estado, evento):
+        tipo = evento['tipo']
+        estado['atualizado_em'] = evento['timestamp']
+
+        if tipo == 'ad_concluido':
+            estado['etapa'] = 'fila_rpa'
+            estado['ad'] = evento.get('status')
+        elif tipo == 'rpa_iniciado':
+            estado['etapa'] = 'rpa'
+            estado['sistemas'][evento['sistema']] = {'status': 'executando'}
+        elif tipo == 'rpa_aguardando':
+            # Na fila dos limites do sistema (sessão ocupada, limite de logins)
+            estado['sistemas'][evento['sistema']] = {
+                'status': 'aguardando',
+                'posicao': evento.get('posicao'),
+                'motivo': evento.get('motivo'),
+                'espera_segundos': evento.get('espera_segundos')
+            }
+        elif tipo == 'rpa_concluido':
+            estado['sistemas'][evento['sistema']] = {
+                'status': evento.get('status'),
+                'duracao_segundos': evento.get('duracao_segundos')
+            }
+        elif tipo in ('email_enviado', 'email_erro'):
+            estado['etapa'] = 'email'
+            estado['email'] = 'enviado' if tipo == 'email_enviado' else 'erro'
+        elif tipo == TIPO_CONCLUIDO:
+            estado['etapa'] = TIPO_CONCLUIDO
+            estado['finalizado'] = True
+
+    def existe(self, job_id):
+        with self._condicao:
+            return job_id in self._jobs
+
+    def estado(self, job_id):
+        """Estado resumido do job, ou None se desconhecido."""
+        with self._condicao:
+            registro = self._jobs.get(job_id)
+            return _copiar_estado(registro['estado']) if registro else None
+
+    def estados(self, somente_ativos=False):
+        """Estado resumido dos jobs acompanhados, do mais recente ao mais antigo."""
+        with self._condicao:
+            return [
+                _copiar_estado(r['estado']) for r in reversed(self._jobs.values())
+                if not (somente_ativos and r['estado']['finalizado'])
+            ]
+
+    def eventos_desde(self, job_id, ultimo_id=0, timeout=None):
+        """Retorna os eventos do job com id maior que ultimo_id.
+
+        Se não houver nenhum, espera até timeout segundos por um novo. Retorna
+        None se o job não existir (ou tiver sido descartado).
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+
+        with self._condicao:
+            while True:
+                registro = self._jobs.get(job_id)
+                if registro is None:
+                    return None
+
+                novos = [e for e in registro['eventos'] if e['id'] > ultimo_id]
+                if novos or registro['estado']['finalizado']:
+                    return novos
+
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return []
+                self._condicao.wait(restante)
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                'jobs': len(self._jobs),
+                'ativos': sum(1 for r in self._jobs.values() if not r['estado']['finalizado']),
+                'eventos_publicados': self.publicados,
+                'maximo_por_job': self.maximo_por_job,
+                'maximo_jobs': self.maximo_jobs
+            }
+
+
+def _copiar_estado(estado):
+    copia = dict(estado)
+    copia['sistemas'] = {sistema: dict(info) for sistema, info in estado['sistemas'].items()}
+    return copia
@@ -0,0 +1,491 @@
+"""
+Fila distribuída de execuções de RPA com arrendamento (lease).
+
+Cada job de desligamento publica uma unidade (job, sistema) em um banco SQLite
+compartilhado (RPA_FILA_DB, local ou em um compartilhamento NFS). Trabalhadores
+em um ou mais hosts arrendam unidades pendentes por RPA_ARRENDAMENTO_DURACAO
+segundos, renovam o arrendamento (heartbeat) enquanto o script roda e gravam o
+resultado; o servidor coordenador aguarda esse resultado no próprio banco.
+
+Um arrendamento que expira (host caiu, processo travou) volta a ficar pendente
+para outro trabalhador, até RPA_ARRENDAMENTO_TENTATIVAS. Cada arrendamento tem
+um token: o trabalhador que perdeu o seu não consegue renovar nem concluir e
+encerra o script. Se o banco ficar inacessível, o trabalhador encerra o script
+antes de o arrendamento expirar (um intervalo de renovação antes do prazo), de
+modo que há no máximo uma tentativa ativa por sistema e usuário.
+
+O banco usa o journal padrão do SQLite (o WAL não funciona em NFS) e os prazos
+usam o relógio de cada host, que precisam estar sincronizados (NTP).
+
+Trabalhador em outro host (mesmo repositório e .env com as credenciais):
+    python fila_rpa.py [--trabalhadores N] [--sistemas tasy,crm_jmj]
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from processos_rpa import encerrar_arvore, iniciar_processo
+from rastreio import span
+from registro_log import contexto_log, variaveis_contexto
+from resultado_rpa import CapturaSaida, ExecucaoRPA
+
+logger = logging.getLogger(__name__)
+
+RPA_FILA_DB = os.getenv('RPA_FILA_DB', 'dados/fila_rpa.db')
+RPA_ARRENDAMENTO_DURACAO = int(os.getenv('RPA_ARRENDAMENTO_DURACAO', 60))
+RPA_ARRENDAMENTO_TENTATIVAS = int(os.getenv('RPA_ARRENDAMENTO_TENTATIVAS', 2))
+RPA_FILA_CONSULTA = float(os.getenv('RPA_FILA_CONSULTA', 2))
+RPA_FILA_RETENCAO = int(os.getenv('RPA_FILA_RETENCAO', 7 * 86400))
+
+ESTADO_PENDENTE = 'pendente'
+ESTADO_ARRENDADA = 'arrendada'
+ESTADO_CONCLUIDA = 'concluida'
+ESTADO_CANCELADA = 'cancelada'
+
+_COLUNAS = (
+    'job_id', 'sistema', 'comando', 'timeout', 'estado', 'trabalhador', 'token', 'expira_em',
+    'tentativas', 'codigo', 'stdout', 'stderr', 'erro', 'criado_em', 'iniciado_em', 'concluido_em', 'limites',
+    'resultado', 'traceparent'
+)
+
+
+def nome_trabalhador():
+    """Identificador do trabalhador: host e PID."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class FilaArrendamentos:
+    """Unidades (job, sistema) compartilhadas entre hosts, com arrendamento e expiração."""
+
+    def __init__(self, caminho=RPA_FILA_DB, duracao_arrendamento=RPA_ARRENDAMENTO_DURACAO,
+                 maximo_tentativas=RPA_ARRENDAMENTO_TENTATIVAS):
+        self.caminho = caminho
+        self.duracao_arrendamento = duracao_arrendamento
+        self.maximo_tentativas = maximo_tentativas
+        self.recuperadas = 0
+        self.esgotadas = 0
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with closing(self._conectar()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS unidades ('
+                ' job_id TEXT NOT NULL,'
+                ' sistema TEXT NOT NULL,'
+                ' comando TEXT NOT NULL,'
+                ' timeout REAL NOT NULL,'
+                ' estado TEXT NOT NULL,'
+                ' trabalhador TEXT,'
+                ' token TEXT,'
+                ' expira_em REAL,'
+                ' tentativas INTEGER NOT NULL DEFAULT 0,'
+                ' codigo INTEGER,'
+                ' stdout TEXT,'
+                ' stderr TEXT,'
+                ' erro TEXT,'
+                ' criado_em REAL NOT NULL,'
+                ' iniciado_em REAL,'
+                ' concluido_em REAL,'
+                ' PRIMARY KEY (job_id, sistema))'
+            )
+            colunas = [linha[1] for linha in conn.execute('PRAGMA table_info(unidades)')]
+            if 'limites' not in colunas:
+                conn.execute('ALTER TABLE unidades ADD COLUMN limites TEXT')
+            if 'resultado' not in colunas:
+                conn.execute('ALTER TABLE unidades ADD COLUMN resultado TEXT')
+            if 'traceparent' not in colunas:
+                conn.execute('ALTER TABLE unidades ADD COLUMN traceparent TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_unidades_estado ON unidades (estado, criado_em)')
+
+    def _conectar(self):
+        """Abre uma conexão nova (seguro após fork e entre threads)."""
+        return sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+
+    def publicar(self, job_id, sistema, comando, timeout, limites=None, traceparent=None):
+        """Publica a unidade do sistema para o job (ignorada se já existir).
+
+        limites (SISTEMAS_CONFIG) segue com a unidade para o trabalhador aplicar;
+        traceparent liga a execução no trabalhador ao rastreamento do job.
+        """
+        agora = time.time()
+        with closing(self._conectar()) as conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO unidades'
+                ' (job_id, sistema, comando, timeout, estado, criado_em, limites, traceparent)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, sistema, comando, timeout, ESTADO_PENDENTE, agora,
+                 json.dumps(limites) if limites else None, traceparent)
+            )
+            conn.execute(
+                'DELETE FROM unidades WHERE estado IN (?, ?) AND concluido_em < ?',
+                (ESTADO_CONCLUIDA, ESTADO_CANCELADA, agora - RPA_FILA_RETENCAO)
+            )
+
+    def arrendar(self, trabalhador, sistemas=None):
+        """Arrenda a unidade pendente mais antiga (dos sistemas informados); None se não houver."""
+        agora = time.time()
+
+        with closing(self._conectar()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._recuperar_expiradas(conn, agora)
+
+                filtro = ''
+                parametros = [ESTADO_PENDENTE]
+                if sistemas:
+                    filtro = f" AND sistema IN ({','.join('?' * len(sistemas))})"
+                    parametros.extend(sistemas)
+
+                linha = conn.execute(
+                    f'SELECT job_id, sistema FROM unidades WHERE estado = ?{filtro} ORDER BY criado_em LIMIT 1',
+                    parametros
+                ).fetchone()
+
+                if linha is None:
+                    conn.execute('COMMIT')
+                    return None
+
+                token = uuid.uuid4().hex
+                conn.execute(
+                    'UPDATE unidades SET estado = ?, trabalhador = ?, token = ?, expira_em = ?,'
+                    ' tentativas = tentativas + 1, iniciado_em = ? WHERE job_id = ? AND sistema = ?',
+                    (ESTADO_ARRENDADA, trabalhador, token, agora + self.duracao_arrendamento, agora, *linha)
+                )
+                unidade = self._ler(conn, *linha)
+                conn.execute('COMMIT')
+                return unidade
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _recuperar_expiradas(self, conn, agora):
+        expiradas = conn.execute(
+            'SELECT job_id, sistema, tentativas, trabalhador FROM unidades WHERE estado = ? AND expira_em < ?',
+            (ESTADO_ARRENDADA, agora)
+        ).fetchall()
+
+        for job_id, sistema, tentativas, trabalhador in expiradas:
+            if tentativas >= self.maximo_tentativas:
+                conn.execute(
+                    'UPDATE unidades SET estado = ?, token = NULL, erro = ?, concluido_em = ?'
+                    ' WHERE job_id = ? AND sistema = ?',
+                    (ESTADO_CONCLUIDA, f'Arrendamento expirado após {tentativas} tentativa(s)', agora, job_id, sistema)
+                )
+                self.esgotadas += 1
+                logger.error(f"[FILA] {sistema} do job {job_id} esgotou as tentativas (último: {trabalhador})")
+            else:
+                conn.execute(
+                    'UPDATE unidades SET estado = ?, token = NULL, trabalhador = NULL, expira_em = NULL'
+                    ' WHERE job_id = ? AND sistema = ?',
+                    (ESTADO_PENDENTE, job_id, sistema)
+                )
+                self.recuperadas += 1
+                logger.warning(f"[FILA] Arrendamento de {sistema} do job {job_id} expirou ({trabalhador}); unidade recuperada")
+
+    def renovar(self, job_id, sistema, token):
+        """Estende o arrendamento; False se o trabalhador não o detém mais."""
+        with closing(self._conectar()) as conn:
+            cursor = conn.execute(
+                'UPDATE unidades SET expira_em = ? WHERE job_id = ? AND sistema = ? AND token = ? AND estado = ?',
+                (time.time() + self.duracao_arrendamento, job_id, sistema, token, ESTADO_ARRENDADA)
+            )
+            return cursor.rowcount == 1
+
+    def concluir(self, job_id, sistema, token, codigo, stdout='', stderr='', erro=None, resultado=None):
+        """Grava o resultado; False se o arrendamento já tinha sido perdido.
+
+        stdout/stderr são só o final da saída (resultado_rpa); resultado é o
+        resultado estruturado do script.
+        """
+        with closing(self._conectar()) as conn:
+            cursor = conn.execute(
+                'UPDATE unidades SET estado = ?, token = NULL, codigo = ?, stdout = ?, stderr = ?, erro = ?,'
+                ' resultado = ?, concluido_em = ? WHERE job_id = ? AND sistema = ? AND token = ? AND estado = ?',
+                (ESTADO_CONCLUIDA, codigo, stdout, stderr, erro, json.dumps(resultado) if resultado else None,
+                 time.time(), job_id, sistema, token, ESTADO_ARRENDADA)
+            )
+            return cursor.rowcount == 1
+
+    def cancelar(self, job_id, sistema):
+        """Cancela a unidade pendente ou em execução (o trabalhador encerra no próximo heartbeat)."""
+        with closing(self._conectar()) as conn:
+            conn.execute(
+                'UPDATE unidades SET estado = ?, token = NULL, concluido_em = ?'
+                ' WHERE job_id = ? AND sistema = ? AND estado IN (?, ?)',
+                (ESTADO_CANCELADA, time.time(), job_id, sistema, ESTADO_PENDENTE, ESTADO_ARRENDADA)
+            )
+
+    def obter(self, job_id, sistema):
+        with closing(self._conectar()) as conn:
+            return self._ler(conn, job_id, sistema)
+
+    @staticmethod
+    def _ler(conn, job_id, sistema):
+        linha = conn.execute(
+            f"SELECT {', '.join(_COLUNAS)} FROM unidades WHERE job_id = ? AND sistema = ?",
+            (job_id, sistema)
+        ).fetchone()
+        return dict(zip(_COLUNAS, linha)) if linha else None
+
+    def aguardar(self, job_id, sistema, timeout=None, intervalo=RPA_FILA_CONSULTA):
+        """Aguarda a unidade ser concluída e a retorna; None se o prazo acabar antes."""
+        limite = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            unidade = self.obter(job_id, sistema)
+            if unidade is None or unidade['estado'] in (ESTADO_CONCLUIDA, ESTADO_CANCELADA):
+                return unidade
+            if limite is not None and time.monotonic() >= limite:
+                return None
+            time.sleep(intervalo)
+
+    def estatisticas(self):
+        """Unidades por estado, arrendamentos ativos por trabalhador e espera da mais antiga."""
+        agora = time.time()
+        with closing(self._conectar()) as conn:
+            por_estado = dict(conn.execute('SELECT estado, COUNT(*) FROM unidades GROUP BY estado').fetchall())
+            por_trabalhador = dict(conn.execute(
+                'SELECT trabalhador, COUNT(*) FROM unidades WHERE estado = ? GROUP BY trabalhador',
+                (ESTADO_ARRENDADA,)
+            ).fetchall())
+            mais_antiga = conn.execute(
+                'SELECT MIN(criado_em) FROM unidades WHERE estado = ?', (ESTADO_PENDENTE,)
+            ).fetchone()[0]
+
+        return {
+            'banco': self.caminho,
+            'duracao_arrendamento_segundos': self.duracao_arrendamento,
+            'maximo_tentativas': self.maximo_tentativas,
+            'unidades': por_estado,
+            'arrendamentos_por_trabalhador': por_trabalhador,
+            'espera_pendente_mais_antiga_segundos': round(agora - mais_antiga, 1) if mais_antiga else 0.0,
+            'recuperadas_neste_processo': self.recuperadas,
+            'esgotadas_neste_processo': self.esgotadas
+        }
+
+
+class TrabalhadorRPA:
+    """Threads que arrendam unidades da fila e executam os scripts RPA neste host."""
+
+    def __init__(self, fila, nome=None, sistemas=None, admissao=None, limites=None, ao_aguardar=None,
+                 intervalo_consulta=RPA_FILA_CONSULTA):
+        self.fila = fila
+        self.nome = nome or nome_trabalhador()
+        self.sistemas = sistemas
+        self.admissao = admissao
+        self.limites = limites
+        self.ao_aguardar = ao_aguardar
+        self.intervalo_consulta = intervalo_consulta
+        self._threads = []
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self.executadas = 0
+        self.perdidas = 0
+
+    def iniciar(self, quantidade=1):
+        """Inicia as threads na primeira chamada (seguro com fork do gunicorn)."""
+        with self._lock:
+            if self._threads:
+                return
+
+            for indice in range(quantidade):
+                thread = threading.Thread(
+                    target=self._trabalhar,
+                    name=f"fila-rpa-{indice + 1}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+        logger.info(f"[FILA] Trabalhador {self.nome} iniciado com {quantidade} thread(s)")
+
+    def parar(self):
+        self._parar.set()
+
+    def _trabalhar(self):
+        while not self._parar.is_set():
+            try:
+                unidade = self.fila.arrendar(self.nome, self.sistemas)
+            except Exception as erro:
+                logger.error(f"[FILA] Falha ao arrendar unidade: {erro}")
+                unidade = None
+
+            if unidade is None:
+                self._parar.wait(self.intervalo_consulta)
+                continue
+
+            with contexto_log(job_id=unidade['job_id'], sistema=unidade['sistema']), span(
+                'fila.unidade', pai=unidade.get('traceparent'), sistema=unidade['sistema'],
+                trabalhador=self.nome, tentativa=unidade['tentativas']
+            ):
+                try:
+                    self.executar(unidade)
+                except Exception as erro:
+                    logger.error(f"[FILA] Erro ao executar unidade: {erro}")
+
+    def executar(self, unidade):
+        """Executa o script da unidade renovando o arrendamento até o fim."""
+        job_id, sistema, token = unidade['job_id'], unidade['sistema'], unidade['token']
+        logger.info(f"[FILA] {self.nome} executando {sistema} (tentativa {unidade['tentativas']})")
+
+        perdido = threading.Event()
+        encerrado = threading.Event()
+        processo = {}
+
+        def renovar():
+            intervalo = max(self.fila.duracao_arrendamento / 3, 1)
+            ultima_renovacao = time.monotonic()
+            while not encerrado.wait(intervalo):
+                try:
+                    valido = self.fila.renovar(job_id, sistema, token)
+                except Exception as erro:
+                    # Falha transitória do banco: tenta de novo enquanto o arrendamento ainda vale.
+                    # Perto de expirar, encerra o script: outro host vai arrendar a unidade
+                    sem_renovar = time.monotonic() - ultima_renovacao
+                    if sem_renovar < self.fila.duracao_arrendamento - intervalo:
+                        logger.warning(f"[FILA] Falha ao renovar arrendamento: {erro}")
+                        continue
+                    logger.error(f"[FILA] Arrendamento de {sistema} sem renovação há {sem_renovar:.0f}s "
+                                 f"({erro}); encerrando o RPA")
+                    valido = False
+                if not valido:
+                    perdido.set()
+                    if processo.get('popen'):
+                        encerrar_arvore(processo['popen'])
+                    return
+                ultima_renovacao = time.monotonic()
+
+        heartbeat = threading.Thread(target=renovar, name=f"fila-rpa-heartbeat-{sistema}", daemon=True)
+        heartbeat.start()
+
+        execucao, erro = None, None
+        try:
+            execucao, erro = self._executar_comando(sistema, unidade, processo, perdido)
+        except Exception as excecao:
+            erro = str(excecao)
+        finally:
+            encerrado.set()
+            heartbeat.join()
+
+        if perdido.is_set():
+            self.perdidas += 1
+            logger.warning(f"[FILA] Arrendamento de {sistema} perdido (expirado ou cancelado); resultado descartado")
+            return
+
+        if execucao is None:
+            execucao = ExecucaoRPA(None)
+        if self.fila.concluir(job_id, sistema, token, execucao.codigo, execucao.log, execucao.erro_saida, erro,
+                              execucao.resultado):
+            self.executadas += 1
+        else:
+            self.perdidas += 1
+            logger.warning(f"[FILA] Resultado de {sistema} descartado: arrendamento já não era deste trabalhador")
+
+    def _executar_comando(self, sistema, unidade, processo, perdido):
+        limites = json.loads(unidade['limites']) if unidade.get('limites') else None
+        if self.limites is None or not limites:
+            return self._executar_admitido(sistema, unidade, processo, perdido)
+
+        ao_aguardar = None
+        if self.ao_aguardar:
+            ao_aguardar = lambda *espera: self.ao_aguardar(sistema, *espera)
+
+        with self.limites.adquirir(
+            sistema, limites, duracao_maxima=unidade['timeout'] + 60, ao_aguardar=ao_aguardar
+        ) as sessao:
+            return self._executar_admitido(sistema, unidade, processo, perdido, sessao)
+
+    def _executar_admitido(self, sistema, unidade, processo, perdido, sessao=None):
+        if self.admissao is None:
+            return self._executar_processo(unidade, processo, perdido, None)
+        with self.admissao.reservar(sistema) as reserva:
+            if sessao is not None:
+                sessao.estender(unidade['timeout'] + 60)
+            return self._executar_processo(unidade, processo, perdido, reserva)
+
+    def _executar_processo(self, unidade, processo, perdido, reserva):
+        if perdido.is_set():
+            return None, 'Arrendamento perdido antes do início'
+
+        popen = iniciar_processo(
+            unidade['comando'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=os.getcwd(),
+            env={**os.environ, **variaveis_contexto()},
+            shell=True
+        )
+        processo['popen'] = popen
+        if reserva is not None:
+            reserva.monitorar(popen.pid)
+
+        captura = CapturaSaida(popen)
+        try:
+            return captura.aguardar(unidade['timeout']), None
+        except subprocess.TimeoutExpired:
+            execucao = captura.execucao()
+            execucao.codigo = None
+            return execucao, f"Timeout de {unidade['timeout']:g}s excedido"
+
+    def estatisticas(self):
+        return {
+            'nome': self.nome,
+            'threads': len(self._threads),
+            'sistemas': self.sistemas or 'todos',
+            'executadas': self.executadas,
+            'perdidas': self.perdidas
+        }
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    from admissao import AdmissaoMemoria
+    from limites_rpa import LimitesSistemas
+    from registro_log import configurar_logging
+
+    load_dotenv()
+    configurar_logging()
+
+    parser = argparse.ArgumentParser(description='Trabalhador da fila distribuída de RPAs')
+    parser.add_argument('--trabalhadores', type=int, default=int(os.getenv('RPA_FILA_TRABALHADORES', 2)),
+                        help='execuções simultâneas neste host')
+    parser.add_argument('--sistemas', help='sistemas atendidos, separados por vírgula (padrão: todos)')
+    parser.add_argument('--banco', default=RPA_FILA_DB, help='banco SQLite compartilhado')
+    args = parser.parse_args()
+
+    fila = FilaArrendamentos(args.banco)
+    trabalhador = TrabalhadorRPA(
+        fila,
+        sistemas=[s.strip() for s in args.sistemas.split(',') if s.strip()] if args.sistemas else None,
+        admissao=AdmissaoMemoria(
+            orcamento_mb=int(os.getenv('RPA_MEMORIA_ORCAMENTO_MB', 0)),
+            margem_mb=int(os.getenv('RPA_MEMORIA_MARGEM_MB', 512)),
+            padrao_mb=int(os.getenv('RPA_MEMORIA_PADRAO_MB', 400)),
+            maximo_simultaneos=int(os.getenv('RPA_MAXIMO_SIMULTANEOS', 0)),
+            # Banco local do host: o orçamento soma as reservas do servidor neste host
+            caminho=os.getenv('RPA_ADMISSAO_DB', 'dados/admissao_rpa.db') or None
+        ),
+        # Mesmo banco de limites do servidor (compartilhado) para valer entre os hosts
+        limites=LimitesSistemas(os.getenv('RPA_LIMITES_DB', 'dados/limites_rpa.db'))
+    )
+    trabalhador.iniciar(args.trabalhadores)
+
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"[FILA] {trabalhador.estatisticas()}")
+    except KeyboardInterrupt:
+        trabalhador.parar()
@@ -0,0 +1,38 @@
+"""
+Configuração do gunicorn para o servidor de integração em produção.
+
+Uso: gunicorn -c gunicorn.conf.py server:app
+"""
+
+import os
+
+# Um arquivo de log por worker: RotatingFileHandler não é seguro entre processos
+os.environ.setdefault('LOG_ARQUIVO', 'logs/integracao-{pid}.jsonl')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+
+# Cada worker é um processo com seu próprio pool de threads. O webhook só
+# enfileira o job e responde, então poucas threads já bastam para ele.
+workers = int(os.getenv('SERVER_WORKERS', 2))
+threads = int(os.getenv('SERVER_THREADS', 8))
+worker_class = 'gthread'
+
+# Com mais de um worker, as duplicatas precisam de um registro compartilhado. A admissão
+# por memória já soma as reservas de todos os workers (RPA_ADMISSAO_DB): não defina vazio
+if workers > 1:
+    os.environ.setdefault('DUPLICATAS_BACKEND', 'sqlite')
+
+timeout = int(os.getenv('SERVER_TIMEOUT', 120))
+
+# Tempo máximo para drenar os jobs de demissão em andamento ao encerrar
+graceful_timeout = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 900))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    """Aguarda os jobs em background do worker antes de o processo sair."""
+    from server import aguardar_jobs_em_andamento
+
+    aguardar_jobs_em_andamento(timeout=max(graceful_timeout - 5, 0))
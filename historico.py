@@ -0,0 +1,370 @@
+"""
+Histórico dos desligamentos em SQLite (/historico).
+
+Cada job de demissão vira uma linha em `jobs` (CPF, colaborador, resultado do
+AD, status geral, duração, email) e cada sistema executado vira uma linha em
+`tentativas` (status, classe do erro, conta, status antes/depois, duração e
+tempo por etapa do resultado estruturado). Há índices por CPF, data e sistema,
+então relatórios como "falhas do GED no último mês" ou "desligamentos do CPF X"
+não dependem mais dos logs.
+
+As consultas são paginadas por cursor (id decrescente) e a exportação em
+CSV/NDJSON é gerada em lotes, sem carregar o resultado inteiro em memória.
+Falhas ao gravar o histórico são registradas no log e nunca interrompem o job.
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+HISTORICO_DB = os.getenv('HISTORICO_DB', 'dados/historico.db')
+HISTORICO_RETENCAO_DIAS = int(os.getenv('HISTORICO_RETENCAO_DIAS', 0))
+
+PAGINA_PADRAO = 50
+PAGINA_MAXIMA = 500
+_LOTE_EXPORTACAO = 500
+
+COLUNAS_JOBS = (
+    'job_id', 'cpf', 'colaborador', 'email', 'recebido_em', 'concluido_em', 'duracao_segundos',
+    'status_geral', 'status_ad', 'email_enviado'
+)
+COLUNAS_TENTATIVAS = (
+    'job_id', 'cpf', 'sistema', 'nome', 'status', 'classe_erro', 'erro', 'conta', 'status_antes',
+    'status_depois', 'duracao_segundos', 'duracao_script', 'etapas', 'registrado_em'
+)
+
+_COLUNAS_DATA = {'recebido_em', 'concluido_em', 'registrado_em'}
+
+# Filtros aceitos por tabela: nome do parâmetro -> expressão SQL
+_FILTROS = {
+    'jobs': {
+        'cpf': 'cpf = ?',
+        'status': 'status_geral = ?',
+        'status_ad': 'status_ad = ?',
+        'job_id': 'job_id = ?',
+        'sistema': 'job_id IN (SELECT job_id FROM tentativas WHERE sistema = ?)',
+    },
+    'tentativas': {
+        'cpf': 'cpf = ?',
+        'sistema': 'sistema = ?',
+        'status': 'status = ?',
+        'classe_erro': 'classe_erro = ?',
+        'job_id': 'job_id = ?',
+    },
+}
+_COLUNA_DATA_FILTRO = {'jobs': 'recebido_em', 'tentativas': 'registrado_em'}
+
+_EXCECAO = re.compile(r'^([A-Za-z_][\w.]*(?:Error|Exception|Expired))\b')
+
+
+def classificar_erro(status, erro):
+    """Classe do erro de um sistema, para agrupar falhas (timeout, TimeoutError, fila...)."""
+    if status != 'erro':
+        return None
+    erro = (erro or '').strip()
+
+    if erro.startswith('Timeout de'):
+        return 'timeout'
+    if erro.startswith('Script ') and 'não encontrado' in erro:
+        return 'script_ausente'
+    if 'não confirmada' in erro:
+        return 'nao_confirmado'
+    if 'não configurad' in erro:
+        return 'configuracao'
+    if erro.startswith(('Arrendamento', 'Unidade')):
+        return 'fila'
+
+    excecao = _EXCECAO.match(erro.splitlines()[-1] if erro else '') or _EXCECAO.match(erro)
+    if excecao:
+        return excecao.group(1).rsplit('.', 1)[-1]
+    return 'outro'
+
+
+def interpretar_data(texto, fim=False):
+    """Converte 'AAAA-MM-DD' ou ISO completo em timestamp; com fim=True, a data inclui o dia inteiro."""
+    if not texto:
+        return None
+    data = datetime.fromisoformat(texto)
+    if fim and len(texto) == 10:
+        data += timedelta(days=1)
+    return data.timestamp()
+
+
+def _formatar_data(valor):
+    return datetime.fromtimestamp(valor).isoformat(timespec='seconds') if valor else None
+
+
+class HistoricoDesligamentos:
+    """Jobs e tentativas por sistema, consultáveis por CPF, data e sistema."""
+
+    def __init__(self, caminho=HISTORICO_DB, retencao_dias=HISTORICO_RETENCAO_DIAS):
+        self.caminho = caminho
+        self.retencao_dias = retencao_dias
+        self.falhas_gravacao = 0
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with closing(self._conectar()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id INTEGER PRIMARY KEY,'
+                ' job_id TEXT NOT NULL UNIQUE,'
+                ' cpf TEXT,'
+                ' colaborador TEXT,'
+                ' email TEXT,'
+                ' recebido_em REAL NOT NULL,'
+                ' concluido_em REAL,'
+                ' duracao_segundos REAL,'
+                ' status_geral TEXT NOT NULL,'
+                ' status_ad TEXT,'
+                ' email_enviado INTEGER)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tentativas ('
+                ' id INTEGER PRIMARY KEY,'
+                ' job_id TEXT NOT NULL,'
+                ' cpf TEXT,'
+                ' sistema TEXT NOT NULL,'
+                ' nome TEXT,'
+                ' status TEXT NOT NULL,'
+                ' classe_erro TEXT,'
+                ' erro TEXT,'
+                ' conta TEXT,'
+                ' status_antes TEXT,'
+                ' status_depois TEXT,'
+                ' duracao_segundos REAL,'
+                ' duracao_script REAL,'
+                ' etapas TEXT,'
+                ' registrado_em REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_cpf ON jobs (cpf, recebido_em)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_recebido_em ON jobs (recebido_em)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tentativas_job ON tentativas (job_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tentativas_cpf ON tentativas (cpf, registrado_em)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tentativas_sistema ON tentativas (sistema, registrado_em)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tentativas_registrado_em ON tentativas (registrado_em)')
+
+    def _conectar(self):
+        """Abre uma conexão nova (seguro após fork e entre threads)."""
+        return sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+
+    def _gravar(self, sql, parametros):
+        try:
+            with closing(self._conectar()) as conn:
+                conn.execute(sql, parametros)
+        except sqlite3.Error as erro:
+            self.falhas_gravacao += 1
+            logger.warning(f"[HISTORICO] Falha ao gravar o histórico: {erro}")
+
+    # Gravação
+
+    def iniciar_job(self, job_id, cpf, colaborador, recebido_em):
+        """Registra o job ao ser aceito (status_geral 'em_andamento' até a conclusão)."""
+        self._gravar(
+            'INSERT OR IGNORE INTO jobs (job_id, cpf, colaborador, recebido_em, status_geral)'
+            ' VALUES (?, ?, ?, ?, ?)',
+            (job_id, cpf, colaborador, datetime.fromisoformat(recebido_em).timestamp(), 'em_andamento')
+        )
+
+    def registrar_tentativa(self, job_id, sistema, cpf, resultado, duracao=None):
+        """Registra o resultado de um sistema no job (resultado de executar_sistema_rpa)."""
+        etapas = resultado.get('etapas')
+        self._gravar(
+            'INSERT INTO tentativas (job_id, cpf, sistema, nome, status, classe_erro, erro, conta, status_antes,'
+            ' status_depois, duracao_segundos, duracao_script, etapas, registrado_em)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                job_id, cpf, sistema, resultado.get('sistema'), resultado['status'],
+                classificar_erro(resultado['status'], resultado.get('erro') or resultado.get('motivo')),
+                resultado.get('erro'), resultado.get('conta'), resultado.get('status_antes'),
+                resultado.get('status_depois'), duracao, resultado.get('duracao_segundos'),
+                json.dumps(etapas) if etapas else None, time.time()
+            )
+        )
+
+    def finalizar_job(self, job_id, status_geral, duracao, status_ad=None, email=None, email_enviado=None):
+        """Grava o desfecho do job e aplica a retenção (HISTORICO_RETENCAO_DIAS, 0 = sem limite)."""
+        self._gravar(
+            'UPDATE jobs SET status_geral = ?, status_ad = ?, email = ?, email_enviado = ?,'
+            ' duracao_segundos = ?, concluido_em = ? WHERE job_id = ?',
+            (status_geral, status_ad, email, None if email_enviado is None else int(email_enviado),
+             duracao, time.time(), job_id)
+        )
+
+        if self.retencao_dias:
+            limite = time.time() - self.retencao_dias * 86400
+            self._gravar('DELETE FROM tentativas WHERE registrado_em < ?', (limite,))
+            self._gravar('DELETE FROM jobs WHERE recebido_em < ?', (limite,))
+
+    # Consulta
+
+    @staticmethod
+    def _condicoes(tabela, filtros):
+        """Monta o WHERE a partir dos filtros (desde/ate em ISO, demais por igualdade)."""
+        condicoes, parametros = [], []
+
+        for nome, expressao in _FILTROS[tabela].items():
+            if filtros.get(nome):
+                condicoes.append(expressao)
+                parametros.append(filtros[nome])
+
+        coluna_data = _COLUNA_DATA_FILTRO[tabela]
+        desde = interpretar_data(filtros.get('desde'))
+        ate = interpretar_data(filtros.get('ate'), fim=True)
+        if desde is not None:
+            condicoes.append(f'{coluna_data} >= ?')
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append(f'{coluna_data} < ?')
+            parametros.append(ate)
+
+        return condicoes, parametros
+
+    @staticmethod
+    def _linha(colunas, valores):
+        linha = dict(zip(colunas, valores))
+        for coluna in _COLUNAS_DATA & linha.keys():
+            linha[coluna] = _formatar_data(linha[coluna])
+        if linha.get('etapas'):
+            linha['etapas'] = json.loads(linha['etapas'])
+        if linha.get('email_enviado') is not None:
+            linha['email_enviado'] = bool(linha['email_enviado'])
+        return linha
+
+    def consultar(self, tabela, filtros=None, limite=PAGINA_PADRAO, cursor=None):
+        """Uma página de jobs ou tentativas, dos mais recentes para os mais antigos.
+
+        Retorna {'itens': [...], 'proximo_cursor': id ou None}. Levanta
+        ValueError para tabela ou data inválida.
+        """
+        if tabela not in _FILTROS:
+            raise ValueError(f"Tabela inválida: {tabela}")
+        colunas = COLUNAS_JOBS if tabela == 'jobs' else COLUNAS_TENTATIVAS
+        limite = max(1, min(int(limite), PAGINA_MAXIMA))
+
+        condicoes, parametros = self._condicoes(tabela, filtros or {})
+        if cursor:
+            condicoes.append('id < ?')
+            parametros.append(int(cursor))
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+
+        with closing(self._conectar()) as conn:
+            linhas = conn.execute(
+                f"SELECT id, {', '.join(colunas)} FROM {tabela} {where} ORDER BY id DESC LIMIT ?",
+                parametros + [limite + 1]
+            ).fetchall()
+
+            itens = [self._linha(colunas, linha[1:]) for linha in linhas[:limite]]
+            proximo = linhas[limite - 1][0] if len(linhas) > limite else None
+
+            if tabela == 'jobs' and itens:
+                self._anexar_tentativas(conn, itens)
+
+        return {'itens': itens, 'proximo_cursor': proximo}
+
+    def obter_job(self, job_id):
+        """O job com as tentativas de cada sistema, ou None se não estiver no histórico."""
+        itens = self.consultar('jobs', {'job_id': job_id}, limite=1)['itens']
+        return itens[0] if itens else None
+
+    def _anexar_tentativas(self, conn, jobs):
+        por_job = {job['job_id']: job for job in jobs}
+        for job in jobs:
+            job['sistemas'] = []
+
+        marcadores = ','.join('?' * len(por_job))
+        for valores in conn.execute(
+            f"SELECT {', '.join(COLUNAS_TENTATIVAS)} FROM tentativas WHERE job_id IN ({marcadores}) ORDER BY id",
+            list(por_job)
+        ):
+            tentativa = self._linha(COLUNAS_TENTATIVAS, valores)
+            por_job[tentativa.pop('job_id')]['sistemas'].append(tentativa)
+
+    def exportar(self, tabela, filtros=None, formato='ndjson'):
+        """Gera o export (CSV ou NDJSON) em lotes; valida os filtros antes de começar."""
+        if tabela not in _FILTROS:
+            raise ValueError(f"Tabela inválida: {tabela}")
+        if formato not in ('csv', 'ndjson'):
+            raise ValueError(f"Formato inválido: {formato}")
+        colunas = COLUNAS_JOBS if tabela == 'jobs' else COLUNAS_TENTATIVAS
+        condicoes, parametros = self._condicoes(tabela, filtros or {})
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+        sql = f"SELECT {', '.join(colunas)} FROM {tabela} {where} ORDER BY id"
+
+        def gerar():
+            with closing(self._conectar()) as conn:
+                cursor = conn.execute(sql, parametros)
+                if formato == 'csv':
+                    yield _linha_csv(colunas)
+
+                while True:
+                    lote = cursor.fetchmany(_LOTE_EXPORTACAO)
+                    if not lote:
+                        return
+                    if formato == 'csv':
+                        yield ''.join(_linha_csv(_valores_csv(colunas, self._linha(colunas, v))) for v in lote)
+                    else:
+                        yield ''.join(
+                            json.dumps(self._linha(colunas, v), ensure_ascii=False) + '\n' for v in lote
+                        )
+
+        return gerar()
+
+    def resumo(self, filtros=None):
+        """Tentativas por sistema e status, com duração média e máxima."""
+        condicoes, parametros = self._condicoes('tentativas', filtros or {})
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+
+        sistemas = {}
+        with closing(self._conectar()) as conn:
+            for sistema, status, total, media, maxima in conn.execute(
+                'SELECT sistema, status, COUNT(*), AVG(duracao_segundos), MAX(duracao_segundos)'
+                f' FROM tentativas {where} GROUP BY sistema, status ORDER BY sistema, status',
+                parametros
+            ):
+                resumo = sistemas.setdefault(sistema, {'total': 0, 'por_status': {}})
+                resumo['total'] += total
+                resumo['por_status'][status] = {
+                    'total': total,
+                    'duracao_media': round(media, 2) if media is not None else None,
+                    'duracao_maxima': round(maxima, 2) if maxima is not None else None
+                }
+
+            erros = conn.execute(
+                f"SELECT sistema, classe_erro, COUNT(*) FROM tentativas WHERE {' AND '.join(condicoes + ['status = ?'])}"
+                ' GROUP BY sistema, classe_erro',
+                parametros + ['erro']
+            ).fetchall()
+
+        for sistema, classe, total in erros:
+            sistemas[sistema].setdefault('erros_por_classe', {})[classe or 'outro'] = total
+
+        return {'sistemas': sistemas}
+
+    def estatisticas(self):
+        with closing(self._conectar()) as conn:
+            jobs = conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+            tentativas = conn.execute('SELECT COUNT(*) FROM tentativas').fetchone()[0]
+        return {'jobs': jobs, 'tentativas': tentativas, 'falhas_gravacao': self.falhas_gravacao}
+
+
+def _valores_csv(colunas, linha):
+    return [json.dumps(linha[c], ensure_ascii=False) if isinstance(linha[c], dict) else linha[c] for c in colunas]
+
+
+def _linha_csv(valores):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(['' if v is None else v for v in valores])
+    return buffer.getvalue()
@@ -0,0 +1,87 @@
+"""
+Identificação do colaborador para os RPAs.
+
+Montada uma vez, ao fim da etapa do AD, a partir dos atributos do AD (mail,
+userPrincipalName, sAMAccountName, displayName, givenName/sn) e do payload da
+Solides. Cada sistema declara em SISTEMAS_CONFIG['argumentos'] os campos que o
+seu script recebe; o primeiro é obrigatório e os demais refinam a busca.
+
+Nos scripts, chaves_busca() ordena as chaves da mais seletiva para a mais ampla
+(ex.: nome completo antes do primeiro nome) e a busca só é ampliada se a chave
+anterior não encontrar o usuário. As comparações usam normalizar(): sem
+acentos, minúsculas e espaços simples, para que "JOÃO  DA SILVA" e
+"Joao da Silva" coincidam.
+"""
+
+import unicodedata
+
+
+def remover_acentos(texto):
+    decomposto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def normalizar(texto):
+    """Texto para comparação: sem acentos, minúsculo e com espaços simples."""
+    if not texto:
+        return ''
+    return ' '.join(remover_acentos(texto).lower().split())
+
+
+def _limpar(valor):
+    valor = ' '.join(str(valor).split()) if valor else ''
+    return valor or None
+
+
+def montar_identificacao(cpf, email=None, resultado_ad=None, dados=None):
+    """Reúne os identificadores do colaborador vindos do AD e da Solides."""
+    ad = resultado_ad or {}
+    dados = dados or {}
+
+    email = _limpar(email)
+    conta_email = email.split('@')[0] if email else None
+    nome_ad = _limpar(ad.get('nome'))
+    # Nome do RH primeiro: é o que os sistemas assistenciais cadastram
+    nome = _limpar(dados.get('nome')) or nome_ad
+    if not nome and conta_email:
+        nome = conta_email.replace('.', ' ').title()
+
+    partes = nome.split() if nome else []
+    primeiro_nome = _limpar(ad.get('primeiro_nome')) or (partes[0] if partes else None)
+    sobrenome = _limpar(ad.get('sobrenome')) or (partes[-1] if len(partes) > 1 else None)
+
+    return {
+        'cpf': cpf,
+        'email': email,
+        'upn': _limpar(ad.get('upn')),
+        'login': _limpar(ad.get('login')) or conta_email,
+        'conta_email': conta_email,
+        'nome': nome,
+        'nome_ad': nome_ad,
+        'primeiro_nome': primeiro_nome,
+        'sobrenome': sobrenome
+    }
+
+
+def argumentos_sistema(campos, identificacao):
+    """Valores dos campos do sistema, na ordem declarada ('' para os ausentes).
+
+    None se faltar o primeiro campo, sem o qual o script não tem o que buscar.
+    """
+    valores = [identificacao.get(campo) or '' for campo in campos]
+    if not valores or not valores[0]:
+        return None
+    return valores
+
+
+def chaves_busca(*candidatas):
+    """Chaves distintas na ordem dada, cada uma seguida da variante sem acentos."""
+    chaves = []
+    for candidata in candidatas:
+        candidata = _limpar(candidata)
+        if not candidata:
+            continue
+        for chave in (candidata, remover_acentos(candidata)):
+            if chave.lower() not in [c.lower() for c in chaves]:
+                chaves.append(chave)
+    return chaves
@@ -0,0 +1,304 @@
+"""
+Limites por sistema para as execuções de RPA: sessões simultâneas e logins.
+
+Alguns sistemas só aceitam uma sessão ativa por conta de administrador ou
+bloqueiam logins repetidos em sequência. Cada sistema pode declarar em
+SISTEMAS_CONFIG['limites']:
+
+- sessoes_simultaneas: execuções ao mesmo tempo com a mesma conta;
+- logins_por_minuto / rajada_logins: balde de fichas (token bucket) de logins;
+- conta_env: variável com o usuário admin (os limites valem por conta).
+
+O estado fica em um banco SQLite (RPA_LIMITES_DB), de modo que os limites
+valem entre todos os workers do gunicorn e, com o banco em um
+compartilhamento, entre os hosts da fila distribuída. Quem espera entra em
+uma fila por ordem de chegada e é informado da posição e do motivo.
+Sessões de processos que morreram expiram pelo prazo informado na aquisição.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+RPA_LIMITES_DB = os.getenv('RPA_LIMITES_DB', 'dados/limites_rpa.db')
+RPA_LIMITES_CONSULTA = float(os.getenv('RPA_LIMITES_CONSULTA', 0.5))
+
+# Ficha de quem esperava e parou de consultar (processo encerrado) é descartada
+_FICHA_ABANDONADA = 30
+
+
+class _Permissao:
+    """Sessão obtida dentro dos limites do sistema."""
+
+    def __init__(self, limites, ficha, espera_segundos, posicao_inicial):
+        self._limites = limites
+        self._ficha = ficha
+        self.espera_segundos = espera_segundos
+        self.posicao_inicial = posicao_inicial
+
+    def estender(self, segundos):
+        """Renova o prazo da sessão (ex.: depois de esperar pela admissão de memória)."""
+        if self._ficha:
+            self._limites._estender(self._ficha, segundos)
+
+
+class LimitesSistemas:
+    """Semáforos de sessão e baldes de logins por sistema/conta, compartilhados via SQLite."""
+
+    def __init__(self, caminho=RPA_LIMITES_DB, intervalo=RPA_LIMITES_CONSULTA):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._metricas = {}
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with closing(self._conectar()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessoes ('
+                ' id TEXT PRIMARY KEY,'
+                ' chave TEXT NOT NULL,'
+                ' iniciada_em REAL NOT NULL,'
+                ' expira_em REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS fila_espera ('
+                ' id TEXT PRIMARY KEY,'
+                ' chave TEXT NOT NULL,'
+                ' criado_em REAL NOT NULL,'
+                ' visto_em REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS baldes ('
+                ' chave TEXT PRIMARY KEY,'
+                ' fichas REAL NOT NULL,'
+                ' capacidade REAL NOT NULL,'
+                ' taxa REAL NOT NULL,'
+                ' atualizado_em REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessoes_chave ON sessoes (chave)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_fila_espera_chave ON fila_espera (chave, criado_em)')
+
+    def _conectar(self):
+        """Abre uma conexão nova (seguro após fork e entre threads)."""
+        return sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def chave(sistema, limites):
+        """Sistema e conta admin: os limites valem por conta."""
+        conta = os.getenv(limites['conta_env']) if limites.get('conta_env') else None
+        return f"{sistema}:{conta.lower()}" if conta else sistema
+
+    @contextmanager
+    def adquirir(self, sistema, limites, duracao_maxima, timeout=None, ao_aguardar=None):
+        """Aguarda a vez do sistema dentro dos limites e mantém a sessão até o fim do bloco.
+
+        duracao_maxima expira a sessão se o processo morrer sem liberá-la.
+        ao_aguardar(posicao, motivo, esperou) é chamado quando a posição ou o
+        motivo da espera mudam. Levanta TimeoutError se o prazo acabar.
+        """
+        if not limites:
+            yield _Permissao(self, None, 0.0, 0)
+            return
+
+        chave = self.chave(sistema, limites)
+        inicio = time.monotonic()
+        ficha = uuid.uuid4().hex
+        situacao_anterior = None
+        posicao_inicial = None
+
+        self._registrar(chave, 'aguardando', 1)
+        try:
+            while True:
+                posicao, motivo, espera = self._tentar(chave, ficha, limites, duracao_maxima)
+                if posicao_inicial is None:
+                    posicao_inicial = posicao
+                if motivo is None:
+                    break
+
+                esperou = time.monotonic() - inicio
+                if (posicao, motivo) != situacao_anterior:
+                    situacao_anterior = (posicao, motivo)
+                    logger.info(f"[LIMITE] {chave} aguardando: posição {posicao + 1}, motivo {motivo}, {esperou:.1f}s")
+                    if ao_aguardar:
+                        ao_aguardar(posicao + 1, motivo, round(esperou, 1))
+
+                if timeout is not None and esperou >= timeout:
+                    self._remover_ficha(ficha)
+                    self._registrar(chave, 'expiradas', 1)
+                    raise TimeoutError(f"Limite de {chave} não liberado em {timeout}s ({motivo})")
+
+                time.sleep(max(min(self.intervalo, espera), 0.05))
+        finally:
+            self._registrar(chave, 'aguardando', -1)
+
+        esperou = time.monotonic() - inicio
+        self._registrar_aquisicao(chave, esperou)
+        if situacao_anterior:
+            logger.info(f"[LIMITE] {chave} liberado após {esperou:.1f}s")
+
+        try:
+            yield _Permissao(self, ficha, round(esperou, 3), posicao_inicial + 1)
+        finally:
+            self._liberar(ficha)
+
+    def _tentar(self, chave, ficha, limites, duracao_maxima):
+        """Uma tentativa atômica: retorna (posicao, motivo, segundos_ate_nova_tentativa).
+
+        motivo None significa sessão obtida (ficha vira o id da sessão).
+        """
+        agora = time.time()
+        sessoes_maximas = limites.get('sessoes_simultaneas')
+        por_minuto = limites.get('logins_por_minuto')
+
+        with closing(self._conectar()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('DELETE FROM sessoes WHERE expira_em < ?', (agora,))
+                conn.execute('DELETE FROM fila_espera WHERE visto_em < ?', (agora - _FICHA_ABANDONADA,))
+                conn.execute(
+                    'INSERT OR IGNORE INTO fila_espera (id, chave, criado_em, visto_em) VALUES (?, ?, ?, ?)',
+                    (ficha, chave, agora, agora)
+                )
+                conn.execute('UPDATE fila_espera SET visto_em = ? WHERE id = ?', (agora, ficha))
+
+                posicao = conn.execute(
+                    'SELECT COUNT(*) FROM fila_espera WHERE chave = ? AND (criado_em, id) <'
+                    ' (SELECT criado_em, id FROM fila_espera WHERE id = ?)',
+                    (chave, ficha)
+                ).fetchone()[0]
+
+                motivo, espera = None, self.intervalo
+                if posicao > 0:
+                    motivo = 'fila'
+                elif sessoes_maximas:
+                    ativas = conn.execute('SELECT COUNT(*) FROM sessoes WHERE chave = ?', (chave,)).fetchone()[0]
+                    if ativas >= sessoes_maximas:
+                        motivo = 'sessao_ocupada'
+
+                if motivo is None and por_minuto:
+                    fichas, espera = self._consumir_ficha(conn, chave, limites, agora)
+                    if fichas is None:
+                        motivo = 'limite_logins'
+
+                if motivo is None:
+                    conn.execute('DELETE FROM fila_espera WHERE id = ?', (ficha,))
+                    conn.execute(
+                        'INSERT INTO sessoes (id, chave, iniciada_em, expira_em) VALUES (?, ?, ?, ?)',
+                        (ficha, chave, agora, agora + duracao_maxima)
+                    )
+
+                conn.execute('COMMIT')
+                return posicao, motivo, espera
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _consumir_ficha(conn, chave, limites, agora):
+        """Tira uma ficha do balde de logins; retorna (fichas_restantes, 0) ou (None, segundos_ate_a_proxima)."""
+        taxa = limites['logins_por_minuto'] / 60.0
+        capacidade = float(limites.get('rajada_logins', 1))
+
+        linha = conn.execute('SELECT fichas, atualizado_em FROM baldes WHERE chave = ?', (chave,)).fetchone()
+        fichas = capacidade if linha is None else min(capacidade, linha[0] + (agora - linha[1]) * taxa)
+
+        if fichas < 1:
+            conn.execute(
+                'INSERT OR REPLACE INTO baldes (chave, fichas, capacidade, taxa, atualizado_em) VALUES (?, ?, ?, ?, ?)',
+                (chave, fichas, capacidade, taxa, agora)
+            )
+            return None, (1 - fichas) / taxa
+
+        conn.execute(
+            'INSERT OR REPLACE INTO baldes (chave, fichas, capacidade, taxa, atualizado_em) VALUES (?, ?, ?, ?, ?)',
+            (chave, fichas - 1, capacidade, taxa, agora)
+        )
+        return fichas - 1, 0
+
+    def _estender(self, ficha, segundos):
+        with closing(self._conectar()) as conn:
+            conn.execute('UPDATE sessoes SET expira_em = ? WHERE id = ?', (time.time() + segundos, ficha))
+
+    def _remover_ficha(self, ficha):
+        with closing(self._conectar()) as conn:
+            conn.execute('DELETE FROM fila_espera WHERE id = ?', (ficha,))
+
+    def _liberar(self, ficha):
+        try:
+            with closing(self._conectar()) as conn:
+                conn.execute('DELETE FROM sessoes WHERE id = ?', (ficha,))
+        except Exception as erro:
+            # A sessão expira sozinha pelo prazo
+            logger.warning(f"[LIMITE] Falha ao liberar sessão: {erro}")
+
+    def _registrar(self, chave, campo, valor):
+        with self._lock:
+            metricas = self._metricas.setdefault(chave, {
+                'aguardando': 0, 'adquiridas': 0, 'adiadas': 0, 'expiradas': 0,
+                'espera_total': 0.0, 'espera_maxima': 0.0
+            })
+            metricas[campo] += valor
+
+    def _registrar_aquisicao(self, chave, esperou):
+        with self._lock:
+            metricas = self._metricas[chave]
+            metricas['adquiridas'] += 1
+            if esperou >= self.intervalo:
+                metricas['adiadas'] += 1
+            metricas['espera_total'] += esperou
+            metricas['espera_maxima'] = max(metricas['espera_maxima'], esperou)
+
+    def estatisticas(self):
+        """Sessões ativas, fila e fichas por sistema/conta (todos os processos) e esperas deste processo."""
+        agora = time.time()
+        resultado = {}
+
+        with closing(self._conectar()) as conn:
+            for chave, ativas in conn.execute(
+                'SELECT chave, COUNT(*) FROM sessoes WHERE expira_em >= ? GROUP BY chave', (agora,)
+            ):
+                resultado.setdefault(chave, {})['sessoes_ativas'] = ativas
+
+            for chave, aguardando, mais_antiga in conn.execute(
+                'SELECT chave, COUNT(*), MIN(criado_em) FROM fila_espera WHERE visto_em >= ? GROUP BY chave',
+                (agora - _FICHA_ABANDONADA,)
+            ):
+                resultado.setdefault(chave, {}).update({
+                    'aguardando': aguardando,
+                    'espera_mais_antiga_segundos': round(agora - mais_antiga, 1)
+                })
+
+            for chave, fichas, capacidade, taxa, atualizado_em in conn.execute(
+                'SELECT chave, fichas, capacidade, taxa, atualizado_em FROM baldes'
+            ):
+                resultado.setdefault(chave, {}).update({
+                    'fichas_login': round(min(capacidade, fichas + (agora - atualizado_em) * taxa), 2),
+                    'capacidade_login': capacidade
+                })
+
+        with self._lock:
+            for chave, metricas in self._metricas.items():
+                resultado.setdefault(chave, {})['processo'] = {
+                    'aguardando': metricas['aguardando'],
+                    'adquiridas': metricas['adquiridas'],
+                    'adiadas': metricas['adiadas'],
+                    'expiradas': metricas['expiradas'],
+                    'espera_media_segundos': round(metricas['espera_total'] / metricas['adquiridas'], 3)
+                    if metricas['adquiridas'] else 0.0,
+                    'espera_maxima_segundos': round(metricas['espera_maxima'], 3)
+                }
+
+        for dados in resultado.values():
+            dados.setdefault('sessoes_ativas', 0)
+            dados.setdefault('aguardando', 0)
+
+        return resultado
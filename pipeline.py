@@ -0,0 +1,86 @@
+"""
+Faixas de processamento do pipeline de desligamento.
+
+Cada faixa é uma fila com seu próprio pool de threads trabalhadoras. O servidor
+usa uma faixa rápida para o AD e outra, com concorrência limitada, para os RPAs,
+de modo que a desativação no AD nunca espera atrás da automação de navegador.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Faixa:
+    """Fila de trabalho com pool próprio de threads."""
+
+    def __init__(self, nome, trabalhadores, processar):
+        self.nome = nome
+        self.trabalhadores = trabalhadores
+        self._processar = processar
+        self._fila = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.em_execucao = 0
+        self.processados = 0
+        self.erros = 0
+        self.espera_total = 0.0
+
+    def _garantir_iniciada(self):
+        """Inicia as threads na primeira utilização (seguro com fork do gunicorn)."""
+        with self._lock:
+            if self._threads:
+                return
+
+            for indice in range(self.trabalhadores):
+                thread = threading.Thread(
+                    target=self._trabalhar,
+                    name=f"faixa-{self.nome}-{indice + 1}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def enfileirar(self, item):
+        """Adiciona um item à fila da faixa."""
+        self._garantir_iniciada()
+        self._fila.put((time.monotonic(), item))
+
+    def profundidade(self):
+        """Quantidade de itens aguardando um trabalhador."""
+        return self._fila.qsize()
+
+    def _trabalhar(self):
+        while True:
+            enfileirado_em, item = self._fila.get()
+
+            with self._lock:
+                self.em_execucao += 1
+                self.espera_total += time.monotonic() - enfileirado_em
+
+            try:
+                self._processar(item)
+            except Exception as erro:
+                with self._lock:
+                    self.erros += 1
+                logger.error(f"[ERRO] Falha na faixa {self.nome}: {erro}")
+            finally:
+                with self._lock:
+                    self.em_execucao -= 1
+                    self.processados += 1
+                self._fila.task_done()
+
+    def estatisticas(self):
+        """Retorna profundidade, itens em execução e contadores da faixa."""
+        with self._lock:
+            return {
+                'trabalhadores': self.trabalhadores,
+                'na_fila': self._fila.qsize(),
+                'em_execucao': self.em_execucao,
+                'processados': self.processados,
+                'erros': self.erros,
+                'espera_media_segundos': round(self.espera_total / self.processados, 3) if self.processados else 0.0
+            }
@@ -0,0 +1,271 @@
+"""
+Processos dos RPAs: sessão própria, encerramento da árvore inteira e coleta de órfãos.
+
+O comando do RPA roda com shell=True: sh -> python -> driver do Playwright
+(node) -> Chrome e seus processos auxiliares. Matar só o processo do Popen (o
+shell) deixa o restante vivo, e o Playwright ainda abre o Chrome em uma sessão
+própria (detached). Por isso:
+
+- iniciar_processo() coloca cada execução em uma sessão nova (o shell vira líder
+  da sessão e do grupo);
+- encerrar_arvore() tira uma fotografia da árvore em /proc (descendentes pelo
+  ppid e membros da sessão) antes de sinalizar: SIGTERM no grupo e na árvore,
+  RPA_ENCERRAMENTO_ESPERA segundos para sair e SIGKILL no que restar. Chamado
+  também após um término normal, recolhe o que o script deixou para trás;
+- ColetorOrfaos varre /proc a cada RPA_ORFAOS_INTERVALO segundos atrás de
+  drivers do Playwright e Chrome abertos pelo Playwright (--remote-debugging-pipe)
+  do mesmo usuário que não pertencem a nenhuma execução viva: o primeiro
+  ancestral que não é navegador/driver é o init ou o próprio servidor (que os
+  herdou). Sobras de execuções antigas, de um servidor que caiu ou de outro
+  worker/trabalhador do host que perdeu o processo são encerradas junto com os
+  descendentes.
+
+Sem /proc (ex.: macOS) vale só o sinal no grupo; no Windows, taskkill /T.
+O total encerrado fica em estatisticas() (/pipeline/status).
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RPA_ENCERRAMENTO_ESPERA = float(os.getenv('RPA_ENCERRAMENTO_ESPERA', 5))
+# 0 desativa a coleta periódica de órfãos
+RPA_ORFAOS_INTERVALO = float(os.getenv('RPA_ORFAOS_INTERVALO', 60))
+RPA_ORFAOS_IDADE_MINIMA = float(os.getenv('RPA_ORFAOS_IDADE_MINIMA', 60))
+
+_POSIX = os.name == 'posix'
+_NOMES_NAVEGADOR = ('chrome', 'chromium', 'headless_shell')
+
+try:
+    _TICKS = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    _TICKS = 100
+
+_lock = threading.Lock()
+_contadores = {'arvores_encerradas': 0, 'processos_encerrados': 0, 'orfaos_coletados': 0, 'coletas': 0}
+
+
+def _contar(**incrementos):
+    with _lock:
+        for nome, valor in incrementos.items():
+            _contadores[nome] += valor
+
+
+def iniciar_processo(comando, **opcoes):
+    """subprocess.Popen do RPA em uma sessão (grupo de processos) própria."""
+    if _POSIX:
+        opcoes['start_new_session'] = True
+    else:
+        opcoes['creationflags'] = opcoes.get('creationflags', 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+    coletor_orfaos.iniciar()
+    return subprocess.Popen(comando, **opcoes)
+
+
+def _ler(caminho):
+    try:
+        with open(caminho, 'rb') as arquivo:
+            return arquivo.read()
+    except OSError:
+        return None
+
+
+def _processos(com_linha=False):
+    """pid -> ppid, sessão, início (ticks desde o boot) e nome; {} sem /proc."""
+    try:
+        pids = [int(nome) for nome in os.listdir('/proc') if nome.isdigit()]
+    except OSError:
+        return {}
+
+    processos = {}
+    for pid in pids:
+        stat = _ler(f'/proc/{pid}/stat')
+        if not stat:
+            continue
+        stat = stat.decode('utf-8', 'replace')
+        # O nome (campo 2) pode conter espaços e parênteses
+        nome = stat[stat.find('(') + 1:stat.rfind(')')]
+        campos = stat.rsplit(')', 1)[-1].split()
+        if len(campos) < 20:
+            continue
+        processo = {
+            'ppid': int(campos[1]), 'sessao': int(campos[3]), 'inicio': int(campos[19]), 'nome': nome
+        }
+        if com_linha:
+            linha = _ler(f'/proc/{pid}/cmdline') or b''
+            processo['linha'] = linha.replace(b'\0', b' ').decode('utf-8', 'replace')
+            try:
+                processo['uid'] = os.stat(f'/proc/{pid}').st_uid
+            except OSError:
+                continue
+        processos[pid] = processo
+    return processos
+
+
+def _descendentes(raizes, processos):
+    filhos = {}
+    for pid, processo in processos.items():
+        filhos.setdefault(processo['ppid'], []).append(pid)
+
+    encontrados = set()
+    pendentes = list(raizes)
+    while pendentes:
+        atual = pendentes.pop()
+        for filho in filhos.get(atual, []):
+            if filho not in encontrados:
+                encontrados.add(filho)
+                pendentes.append(filho)
+    return encontrados
+
+
+def _sinalizar(pid, sinal, inicio=None):
+    """Envia o sinal se o pid ainda for o mesmo processo (início igual); True se enviado."""
+    if inicio is not None:
+        atual = _ler(f'/proc/{pid}/stat')
+        if not atual:
+            return False
+        campos = atual.decode('utf-8', 'replace').rsplit(')', 1)[-1].split()
+        if len(campos) < 20 or int(campos[19]) != inicio:
+            return False
+    try:
+        os.kill(pid, sinal)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def _sinalizar_grupo(pgid, sinal):
+    try:
+        os.killpg(pgid, sinal)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def encerrar_arvore(processo, espera=RPA_ENCERRAMENTO_ESPERA):
+    """Encerra o processo do RPA e toda a árvore dele; retorna quantos processos foram mortos.
+
+    Com o processo ainda vivo: SIGTERM, espera e SIGKILL. Já encerrado: só
+    recolhe o que ficou para trás na sessão.
+    """
+    if not _POSIX:
+        if processo.poll() is None:
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(processo.pid)], capture_output=True)
+            processo.kill()
+        processo.wait()
+        return 0
+
+    vivo = processo.poll() is None
+    processos = _processos()
+    # Com o líder já encerrado, só os membros da sessão garantem que o id não foi reutilizado
+    raizes = {pid for pid, p in processos.items() if p['sessao'] == processo.pid}
+    if vivo:
+        raizes.add(processo.pid)
+    arvore = {pid: processos[pid]['inicio'] for pid in raizes | _descendentes(raizes, processos)
+              if pid in processos and pid != processo.pid}
+
+    if vivo:
+        _sinalizar_grupo(processo.pid, signal.SIGTERM)
+        for pid, inicio in arvore.items():
+            _sinalizar(pid, signal.SIGTERM, inicio)
+        try:
+            processo.wait(timeout=espera)
+        except subprocess.TimeoutExpired:
+            pass
+
+    if vivo or arvore:
+        _sinalizar_grupo(processo.pid, signal.SIGKILL)
+    mortos = sum(1 for pid, inicio in arvore.items() if _sinalizar(pid, signal.SIGKILL, inicio))
+    if processo.poll() is None:
+        processo.kill()
+    processo.wait()
+
+    if vivo or mortos:
+        _contar(arvores_encerradas=1 if vivo else 0, processos_encerrados=mortos + (1 if vivo else 0))
+    if mortos and not vivo:
+        logger.info(f"[PROCESSOS] {mortos} processo(s) deixado(s) pelo RPA (pid {processo.pid}) encerrado(s)")
+    return mortos
+
+
+def _navegador_ou_driver(processo):
+    return processo['nome'].lower().startswith(_NOMES_NAVEGADOR) or 'run-driver' in processo['linha']
+
+
+def _raiz_playwright(processo):
+    """Driver do Playwright ou processo principal do Chrome aberto por ele."""
+    if 'run-driver' in processo['linha']:
+        return True
+    return processo['nome'].lower().startswith(_NOMES_NAVEGADOR) and '--remote-debugging-pipe' in processo['linha']
+
+
+class ColetorOrfaos:
+    """Thread que encerra periodicamente Chrome/drivers do Playwright sem execução viva."""
+
+    def __init__(self, intervalo=RPA_ORFAOS_INTERVALO, idade_minima=RPA_ORFAOS_IDADE_MINIMA):
+        self.intervalo = intervalo
+        self.idade_minima = idade_minima
+        self.ultima_coleta = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        if not self.intervalo or not _POSIX:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='coletor-orfaos', daemon=True)
+                self._thread.start()
+
+    def _executar(self):
+        while True:
+            try:
+                self.coletar()
+            except Exception as erro:
+                logger.warning(f"[PROCESSOS] Falha na coleta de órfãos: {erro}")
+            time.sleep(self.intervalo)
+
+    def _orfao(self, pid, processos):
+        # Sobe pelos navegadores/drivers até o primeiro ancestral que não é um deles
+        atual = processos[pid]['ppid']
+        while atual in processos and _navegador_ou_driver(processos[atual]):
+            atual = processos[atual]['ppid']
+        return atual in (0, 1, os.getpid())
+
+    def coletar(self):
+        """Encerra os órfãos encontrados agora; retorna quantos processos foram mortos."""
+        processos = _processos(com_linha=True)
+        uptime = float((_ler('/proc/uptime') or b'0').split()[0])
+        uid = os.getuid()
+
+        raizes = [
+            pid for pid, processo in processos.items()
+            if processo['uid'] == uid and _raiz_playwright(processo)
+            and uptime - processo['inicio'] / _TICKS >= self.idade_minima
+            and self._orfao(pid, processos)
+        ]
+        mortos = 0
+        if raizes:
+            alvos = set(raizes) | _descendentes(raizes, processos)
+            mortos = sum(1 for pid in alvos if _sinalizar(pid, signal.SIGKILL, processos[pid]['inicio']))
+            if mortos:
+                logger.warning(f"[PROCESSOS] {mortos} processo(s) órfão(s) de navegador/driver encerrado(s)")
+
+        self.ultima_coleta = time.time()
+        _contar(coletas=1, orfaos_coletados=mortos)
+        return mortos
+
+    def estatisticas(self):
+        with _lock:
+            contadores = dict(_contadores)
+        return {
+            'intervalo': self.intervalo if _POSIX else 0,
+            'ultima_coleta': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.ultima_coleta))
+            if self.ultima_coleta else None,
+            **contadores
+        }
+
+
+coletor_orfaos = ColetorOrfaos()
@@ -0,0 +1,457 @@
+"""
+Rastreamento dos desligamentos em spans compatíveis com OpenTelemetry.
+
+webhook -> job -> etapa AD (busca, modificação) -> cada RPA -> SMTP. O contexto
+segue o formato W3C traceparent: dentro do servidor fica em uma ContextVar (o
+job guarda o próprio span para as faixas AD e RPA); para os scripts dos RPAs
+vai na variável de ambiente TRACEPARENT (registro_log.variaveis_contexto), e
+as etapas do Perfilador viram spans filhos do span do RPA. Na fila distribuída,
+o traceparent segue junto com a unidade.
+
+Os spans encerrados são exportados em lote por uma thread em background no
+formato OTLP/JSON (resourceSpans): uma linha por lote em RASTREIO_ARQUIVO
+(rotacionado por tamanho, como o log) e, se configurado, um POST em
+RASTREIO_OTLP_URL (coletor OTLP/HTTP, /v1/traces).
+
+Linha do tempo e caminho crítico: python rastreio.py <job_id|trace_id>
+Coletor local (substituto do OTLP):  python rastreio.py --coletor [--porta 4318]
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+RASTREIO = os.getenv('RASTREIO', '1').lower() in ('1', 'true')
+RASTREIO_ARQUIVO = os.getenv('RASTREIO_ARQUIVO', 'logs/rastreio.jsonl')
+RASTREIO_ARQUIVO_MAX_BYTES = int(os.getenv('RASTREIO_ARQUIVO_MAX_BYTES', 10 * 1024 * 1024))
+RASTREIO_ARQUIVO_BACKUPS = int(os.getenv('RASTREIO_ARQUIVO_BACKUPS', 5))
+RASTREIO_OTLP_URL = os.getenv('RASTREIO_OTLP_URL', '')
+RASTREIO_SERVICO = os.getenv('RASTREIO_SERVICO', 'integracao-solides')
+RASTREIO_LOTE = int(os.getenv('RASTREIO_LOTE', 200))
+RASTREIO_INTERVALO = float(os.getenv('RASTREIO_INTERVALO', 2))
+RASTREIO_FILA_MAXIMA = int(os.getenv('RASTREIO_FILA_MAXIMA', 10000))
+
+VARIAVEL_AMBIENTE = 'TRACEPARENT'
+
+logger = logging.getLogger(__name__)
+
+span_atual = contextvars.ContextVar('span', default=None)
+
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+# Códigos de status do OTLP
+_STATUS_OK = 1
+_STATUS_ERRO = 2
+
+
+def ler_traceparent(texto):
+    """(trace_id, span_id) de um traceparent W3C, ou None se ausente ou inválido."""
+    if not texto:
+        return None
+    encontrado = _TRACEPARENT.match(texto.strip().lower())
+    if not encontrado or set(encontrado.group(1)) == {'0'}:
+        return None
+    return encontrado.group(1), encontrado.group(2)
+
+
+class Span:
+    """Operação cronometrada de um rastreamento (trace_id comum a todo o desligamento)."""
+
+    def __init__(self, nome, trace_id, pai_id=None, atributos=None, inicio_ns=None):
+        self.nome = nome
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.pai_id = pai_id
+        self.atributos = {}
+        self.inicio_ns = inicio_ns or time.time_ns()
+        self.fim_ns = None
+        self.erro = None
+        self.definir(**(atributos or {}))
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def definir(self, **atributos):
+        """Acrescenta atributos ao span (valores None são ignorados)."""
+        self.atributos.update({chave: valor for chave, valor in atributos.items() if valor is not None})
+
+    def falhar(self, erro):
+        self.erro = str(erro)[:500] or type(erro).__name__
+
+    def encerrar(self, fim_ns=None):
+        """Encerra o span e o entrega ao exportador (só na primeira chamada)."""
+        if self.fim_ns is not None:
+            return
+        self.fim_ns = fim_ns or time.time_ns()
+        if RASTREIO:
+            exportador.adicionar(self.otlp())
+
+    def otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.nome,
+            'kind': 1,
+            'startTimeUnixNano': str(self.inicio_ns),
+            'endTimeUnixNano': str(self.fim_ns or time.time_ns()),
+            'attributes': [_atributo(chave, valor) for chave, valor in self.atributos.items()],
+            'status': {'code': _STATUS_ERRO, 'message': self.erro} if self.erro else {'code': _STATUS_OK}
+        }
+        if self.pai_id:
+            span['parentSpanId'] = self.pai_id
+        return span
+
+
+def _atributo(chave, valor):
+    if isinstance(valor, bool):
+        return {'key': chave, 'value': {'boolValue': valor}}
+    if isinstance(valor, int):
+        return {'key': chave, 'value': {'intValue': str(valor)}}
+    if isinstance(valor, float):
+        return {'key': chave, 'value': {'doubleValue': valor}}
+    return {'key': chave, 'value': {'stringValue': str(valor)}}
+
+
+def iniciar_span(nome, pai=None, inicio_ns=None, **atributos):
+    """Cria um span filho de `pai` (Span ou traceparent).
+
+    Sem pai, usa o span atual ou, em um script de RPA, o TRACEPARENT herdado do
+    servidor; sem nenhum deles, o span inicia um rastreamento novo.
+    """
+    if pai is None:
+        pai = span_atual.get() or os.environ.get(VARIAVEL_AMBIENTE)
+
+    if isinstance(pai, Span):
+        trace_id, pai_id = pai.trace_id, pai.span_id
+    else:
+        trace_id, pai_id = ler_traceparent(pai) or (os.urandom(16).hex(), None)
+    return Span(nome, trace_id, pai_id, atributos, inicio_ns)
+
+
+@contextmanager
+def ativar(span):
+    """Torna o span o atual dentro do bloco, sem encerrá-lo (ex.: span do job em outra faixa)."""
+    token = span_atual.set(span)
+    try:
+        yield span
+    finally:
+        span_atual.reset(token)
+
+
+@contextmanager
+def span(nome, pai=None, **atributos):
+    """Span filho do atual durante o bloco; exceções marcam o span com erro."""
+    atual = iniciar_span(nome, pai, **atributos)
+    try:
+        with ativar(atual):
+            yield atual
+    except Exception as erro:
+        atual.falhar(erro)
+        raise
+    finally:
+        atual.encerrar()
+
+
+def variaveis_rastreio():
+    """TRACEPARENT do span atual, para os subprocessos continuarem o rastreamento."""
+    atual = span_atual.get()
+    return {VARIAVEL_AMBIENTE: atual.traceparent} if atual else {}
+
+
+class ExportadorSpans:
+    """Fila de spans encerrados, gravada em lotes OTLP/JSON por uma thread em background."""
+
+    def __init__(self, arquivo=RASTREIO_ARQUIVO, url=RASTREIO_OTLP_URL, lote=RASTREIO_LOTE,
+                 intervalo=RASTREIO_INTERVALO, fila_maxima=RASTREIO_FILA_MAXIMA):
+        self.arquivo = arquivo.format(pid=os.getpid()) if arquivo else None
+        self.url = url
+        self.lote = lote
+        self.intervalo = intervalo
+        self._fila = queue.Queue(maxsize=fila_maxima)
+        self._lock = threading.Lock()
+        self._gravacao = threading.Lock()
+        # Spans aceitos e ainda não gravados (na fila ou no lote em gravação)
+        self._pendentes = 0
+        self._gravados = threading.Condition(self._lock)
+        self._thread = None
+        self.exportados = 0
+        self.descartados = 0
+        self.falhas = 0
+
+    def adicionar(self, span):
+        with self._lock:
+            try:
+                self._fila.put_nowait(span)
+            except queue.Full:
+                self.descartados += 1
+                return
+            self._pendentes += 1
+        self._iniciar()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._executar, name='rastreio-exportador', daemon=True)
+            self._thread.start()
+            atexit.register(self.descarregar)
+
+    def _executar(self):
+        while True:
+            try:
+                primeiro = self._fila.get(timeout=self.intervalo)
+            except queue.Empty:
+                continue
+            self._gravar([primeiro] + self._retirar(self.lote - 1))
+
+    def _retirar(self, quantidade):
+        spans = []
+        while len(spans) < quantidade:
+            try:
+                spans.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def descarregar(self, timeout=5):
+        """Grava os spans pendentes e aguarda o lote que a thread estiver gravando (no encerramento)."""
+        while True:
+            spans = self._retirar(self.lote)
+            if not spans:
+                break
+            self._gravar(spans)
+        with self._gravados:
+            self._gravados.wait_for(lambda: not self._pendentes, timeout)
+
+    def _gravar(self, spans):
+        # pid lido na gravação: os workers do gunicorn podem ter sido criados por fork
+        recurso = {'attributes': [
+            _atributo('service.name', RASTREIO_SERVICO),
+            _atributo('host.name', socket.gethostname()),
+            _atributo('process.pid', os.getpid())
+        ]}
+        documento = {'resourceSpans': [{
+            'resource': recurso,
+            'scopeSpans': [{'scope': {'name': 'rastreio'}, 'spans': spans}]
+        }]}
+        corpo = json.dumps(documento, ensure_ascii=False)
+
+        with self._gravacao:
+            try:
+                if self.arquivo:
+                    _anexar_linha(self.arquivo, corpo)
+                if self.url:
+                    requisicao = urllib.request.Request(
+                        self.url, data=corpo.encode('utf-8'), headers={'Content-Type': 'application/json'}
+                    )
+                    urllib.request.urlopen(requisicao, timeout=5).close()
+                self.exportados += len(spans)
+            except Exception as erro:
+                self.falhas += 1
+                logger.debug(f"[RASTREIO] Falha ao exportar {len(spans)} span(s): {erro}")
+
+        with self._gravados:
+            self._pendentes -= len(spans)
+            self._gravados.notify_all()
+
+    def estatisticas(self):
+        return {
+            'ativo': RASTREIO,
+            'arquivo': self.arquivo,
+            'otlp_url': self.url or None,
+            'pendentes': self._fila.qsize(),
+            'exportados': self.exportados,
+            'descartados': self.descartados,
+            'falhas': self.falhas
+        }
+
+
+def _anexar_linha(caminho, texto):
+    diretorio = os.path.dirname(caminho)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    dados = (texto + '\n').encode('utf-8')
+    # Uma única escrita em O_APPEND: linhas de processos diferentes não se misturam
+    descritor = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        estado = os.fstat(descritor)
+        excede = estado.st_size and estado.st_size + len(dados) > RASTREIO_ARQUIVO_MAX_BYTES
+        if RASTREIO_ARQUIVO_MAX_BYTES > 0 and excede:
+            os.close(descritor)
+            _rotacionar(caminho, estado.st_ino)
+            descritor = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(descritor, dados)
+    finally:
+        os.close(descritor)
+
+
+def _rotacionar(caminho, inode):
+    """caminho -> caminho.1 -> ... -> caminho.N (RASTREIO_ARQUIVO_BACKUPS), como o RotatingFileHandler."""
+    try:
+        if os.stat(caminho).st_ino != inode:
+            # Outro processo já rotacionou o arquivo
+            return
+        if RASTREIO_ARQUIVO_BACKUPS <= 0:
+            os.remove(caminho)
+            return
+        for indice in range(RASTREIO_ARQUIVO_BACKUPS - 1, 0, -1):
+            origem = f"{caminho}.{indice}"
+            if os.path.exists(origem):
+                os.replace(origem, f"{caminho}.{indice + 1}")
+        os.replace(caminho, f"{caminho}.1")
+    except OSError:
+        # Corrida com a rotação de outro processo: segue anexando ao arquivo atual
+        pass
+
+
+exportador = ExportadorSpans()
+
+
+# Relatório e coletor
+
+def _valor(atributo):
+    valor = atributo['value']
+    if 'intValue' in valor:
+        return int(valor['intValue'])
+    return next(iter(valor.values()), None)
+
+
+def carregar_spans(caminho=RASTREIO_ARQUIVO):
+    """Spans gravados no arquivo e nos backups da rotação, com os atributos como dicionário."""
+    spans = []
+    caminhos = [f"{caminho}.{indice}" for indice in range(RASTREIO_ARQUIVO_BACKUPS, 0, -1)] + [caminho]
+    for atual in caminhos:
+        if not os.path.exists(atual):
+            continue
+        with open(atual, encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                try:
+                    documento = json.loads(linha)
+                except ValueError:
+                    continue
+                for recurso in documento.get('resourceSpans', []):
+                    for escopo in recurso.get('scopeSpans', []):
+                        for span in escopo.get('spans', []):
+                            span['atributos'] = {a['key']: _valor(a) for a in span.get('attributes', [])}
+                            spans.append(span)
+    return spans
+
+
+def linha_do_tempo(spans, identificador):
+    """Spans do rastreamento (por trace_id ou job_id) em árvore, com o caminho crítico marcado."""
+    trace_id = identificador
+    if not any(s['traceId'] == identificador for s in spans):
+        trace_id = next((s['traceId'] for s in spans if s['atributos'].get('job_id') == identificador), None)
+    do_rastreio = [s for s in spans if s['traceId'] == trace_id]
+    if not do_rastreio:
+        return []
+
+    ids = {s['spanId'] for s in do_rastreio}
+    filhos = {}
+    for s in do_rastreio:
+        pai = s.get('parentSpanId') if s.get('parentSpanId') in ids else None
+        filhos.setdefault(pai, []).append(s)
+    for lista in filhos.values():
+        lista.sort(key=lambda s: int(s['startTimeUnixNano']))
+
+    inicio = min(int(s['startTimeUnixNano']) for s in do_rastreio)
+
+    # Caminho crítico: de cada span, desce pelo filho que termina por último
+    criticos = set()
+    atual = max(filhos.get(None, []), key=lambda s: int(s['endTimeUnixNano']), default=None)
+    while atual is not None:
+        criticos.add(atual['spanId'])
+        atual = max(filhos.get(atual['spanId'], []), key=lambda s: int(s['endTimeUnixNano']), default=None)
+
+    linhas = []
+
+    def visitar(span, nivel):
+        comeco = int(span['startTimeUnixNano'])
+        linhas.append({
+            'nivel': nivel,
+            'nome': span['name'],
+            'inicio': (comeco - inicio) / 1e9,
+            'duracao': (int(span['endTimeUnixNano']) - comeco) / 1e9,
+            'critico': span['spanId'] in criticos,
+            'erro': span.get('status', {}).get('message'),
+            'atributos': span['atributos']
+        })
+        for filho in filhos.get(span['spanId'], []):
+            visitar(filho, nivel + 1)
+
+    for raiz in filhos.get(None, []):
+        visitar(raiz, 0)
+    return linhas
+
+
+def _imprimir_linha_do_tempo(identificador, caminho):
+    linhas = linha_do_tempo(carregar_spans(caminho), identificador)
+    if not linhas:
+        print(f"Nenhum span encontrado para {identificador} em {caminho}")
+        return 1
+
+    print(f"{'INÍCIO':>9} {'DURAÇÃO':>9}  SPAN  (* = caminho crítico)")
+    for linha in linhas:
+        detalhe = linha['atributos'].get('sistema') or linha['atributos'].get('status') or ''
+        erro = f"  ERRO: {linha['erro']}" if linha['erro'] else ''
+        marca = '*' if linha['critico'] else ' '
+        print(f"{linha['inicio']:>8.2f}s {linha['duracao']:>8.2f}s {marca}{'  ' * linha['nivel']}{linha['nome']}"
+              f" {detalhe}{erro}")
+    return 0
+
+
+def executar_coletor(porta, caminho):
+    """Coletor OTLP/HTTP mínimo: grava cada POST /v1/traces (JSON) como uma linha do arquivo."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Receptor(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/traces':
+                self.send_response(404)
+                self.end_headers()
+                return
+            corpo = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                _anexar_linha(caminho, json.dumps(json.loads(corpo), ensure_ascii=False))
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    print(f"Coletor OTLP/HTTP em http://0.0.0.0:{porta}/v1/traces -> {caminho}")
+    ThreadingHTTPServer(('0.0.0.0', porta), Receptor).serve_forever()
+
+
+if __name__ == '__main__':
+    argumentos = sys.argv[1:]
+    arquivo = RASTREIO_ARQUIVO
+    if '--arquivo' in argumentos:
+        arquivo = argumentos[argumentos.index('--arquivo') + 1]
+
+    if '--coletor' in argumentos:
+        porta = int(argumentos[argumentos.index('--porta') + 1]) if '--porta' in argumentos else 4318
+        executar_coletor(porta, arquivo)
+    elif argumentos and not argumentos[0].startswith('--'):
+        sys.exit(_imprimir_linha_do_tempo(argumentos[0], arquivo))
+    else:
+        print("USO: python rastreio.py <job_id|trace_id> [--arquivo logs/rastreio.jsonl]")
+        print("  ou: python rastreio.py --coletor [--porta 4318] [--arquivo coletor.jsonl]")
+        sys.exit(1)
@@ -0,0 +1,189 @@
+"""
+Logging estruturado e não bloqueante do servidor.
+
+Os registros vão para uma QueueHandler; uma thread em background (QueueListener)
+grava linhas JSON em arquivos rotacionados por tamanho e no console. Cada linha
+carrega o job_id e o sistema do contexto em que foi gerada, permitindo seguir um
+desligamento pelo AD, pelos RPAs e pelo email.
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from rastreio import variaveis_rastreio
+
+LOG_ARQUIVO = os.getenv('LOG_ARQUIVO', 'logs/integracao.jsonl')
+LOG_NIVEL = os.getenv('LOG_NIVEL', 'INFO')
+LOG_ARQUIVO_MAX_BYTES = int(os.getenv('LOG_ARQUIVO_MAX_BYTES', 10 * 1024 * 1024))
+LOG_ARQUIVO_BACKUPS = int(os.getenv('LOG_ARQUIVO_BACKUPS', 5))
+LOG_PAYLOAD_MAX = int(os.getenv('LOG_PAYLOAD_MAX', 2000))
+LOG_PAYLOAD_AMOSTRAGEM = float(os.getenv('LOG_PAYLOAD_AMOSTRAGEM', 1.0))
+
+job_id_atual = contextvars.ContextVar('job_id', default=None)
+sistema_atual = contextvars.ContextVar('sistema', default=None)
+
+_listener = None
+_FORMATADOR_PADRAO = logging.Formatter()
+
+
+class FiltroContexto(logging.Filter):
+    """Anexa job_id e sistema do contexto atual ao registro (na thread de origem)."""
+
+    def filter(self, record):
+        record.job_id = job_id_atual.get()
+        record.sistema = sistema_atual.get()
+        return True
+
+
+class HandlerFila(logging.handlers.QueueHandler):
+    """QueueHandler que guarda o traceback à parte (excecao), e não dentro da mensagem."""
+
+    def prepare(self, record):
+        excecao = None
+        if record.exc_info:
+            excecao = _FORMATADOR_PADRAO.formatException(record.exc_info)
+        if record.stack_info:
+            excecao = '\n'.join(filter(None, [excecao, _FORMATADOR_PADRAO.formatStack(record.stack_info)]))
+
+        # Cópia sem objetos de traceback/argumentos, que não precisam atravessar a fila
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        record.excecao = excecao
+        return record
+
+
+class FormatadorConsole(logging.Formatter):
+    """Linha do console seguida do traceback, quando houver."""
+
+    def format(self, record):
+        texto = super().format(record)
+        if getattr(record, 'excecao', None):
+            texto = f"{texto}\n{record.excecao}"
+        return texto
+
+
+class FormatadorJSON(logging.Formatter):
+    """Formata cada registro como uma linha JSON."""
+
+    def format(self, record):
+        linha = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'job_id': getattr(record, 'job_id', None),
+            'sistema': getattr(record, 'sistema', None),
+            'thread': record.threadName,
+            'pid': record.process,
+            'mensagem': record.getMessage()
+        }
+
+        if getattr(record, 'excecao', None):
+            linha['excecao'] = record.excecao
+
+        return json.dumps(linha, ensure_ascii=False)
+
+
+def configurar_logging():
+    """Direciona o logging raiz para uma fila gravada por uma thread em background."""
+    global _listener
+
+    if _listener is not None:
+        return
+
+    caminho = LOG_ARQUIVO.format(pid=os.getpid())
+    diretorio = os.path.dirname(caminho)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+
+    arquivo = logging.handlers.RotatingFileHandler(
+        caminho,
+        maxBytes=LOG_ARQUIVO_MAX_BYTES,
+        backupCount=LOG_ARQUIVO_BACKUPS,
+        encoding='utf-8'
+    )
+    arquivo.setFormatter(FormatadorJSON())
+
+    console = logging.StreamHandler()
+    console.setFormatter(FormatadorConsole('%(levelname)s:%(name)s:[%(job_id)s] %(message)s'))
+
+    fila = queue.SimpleQueue()
+    handler_fila = HandlerFila(fila)
+    handler_fila.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(handler_fila)
+    raiz.setLevel(LOG_NIVEL)
+
+    _listener = logging.handlers.QueueListener(fila, arquivo, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(encerrar_logging)
+
+
+def encerrar_logging():
+    """Grava os registros pendentes e para a thread de escrita."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def novo_job_id():
+    """Gera um identificador curto para um job de desligamento."""
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def contexto_log(job_id=None, sistema=None):
+    """Define job_id e/ou sistema para os logs gerados dentro do bloco."""
+    tokens = []
+    if job_id is not None:
+        tokens.append((job_id_atual, job_id_atual.set(job_id)))
+    if sistema is not None:
+        tokens.append((sistema_atual, sistema_atual.set(sistema)))
+
+    try:
+        yield
+    finally:
+        for variavel, token in reversed(tokens):
+            variavel.reset(token)
+
+
+def variaveis_contexto():
+    """Variáveis de ambiente que propagam o contexto de log e o rastreamento para subprocessos (RPAs)."""
+    variaveis = variaveis_rastreio()
+    if job_id_atual.get():
+        variaveis['JOB_ID'] = job_id_atual.get()
+    if sistema_atual.get():
+        variaveis['SISTEMA_ID'] = sistema_atual.get()
+    return variaveis
+
+
+def resumir_payload(dados, limite=None):
+    """Serializa um payload para log, truncado, ou None se não foi sorteado na amostragem."""
+    if LOG_PAYLOAD_AMOSTRAGEM < 1.0 and random.random() >= LOG_PAYLOAD_AMOSTRAGEM:
+        return None
+
+    limite = LOG_PAYLOAD_MAX if limite is None else limite
+    texto = json.dumps(dados, ensure_ascii=False, default=str)
+
+    if len(texto) > limite:
+        return f"{texto[:limite]}... (+{len(texto) - limite} caracteres)"
+    return texto
@@ -0,0 +1,184 @@
+"""
+Resultado estruturado dos RPAs e captura limitada da saída dos scripts.
+
+O script do RPA continua informando o desfecho pelo código de saída e, ao fim,
+imprime uma linha com o resultado estruturado (PREFIXO + JSON): desfecho, conta
+localizada, status antes e depois, tempo por etapa e o erro truncado.
+
+Quem executa o script (servidor ou trabalhador da fila) lê stdout e stderr
+linha a linha, separa a linha do resultado e guarda o restante só em um buffer
+circular de RPA_LOG_LINHAS linhas (RPA_LOG_LINHA_MAX caracteres cada). Um
+script verboso não aumenta a memória do servidor nem o tamanho dos resultados
+guardados nos jobs e enviados nos emails.
+"""
+
+import json
+import os
+import subprocess
+import threading
+from collections import deque
+
+from processos_rpa import encerrar_arvore
+
+RPA_LOG_LINHAS = int(os.getenv('RPA_LOG_LINHAS', 100))
+RPA_LOG_LINHA_MAX = int(os.getenv('RPA_LOG_LINHA_MAX', 400))
+RPA_RESULTADO_ERRO_MAX = int(os.getenv('RPA_RESULTADO_ERRO_MAX', 500))
+
+PREFIXO = '@@RPA_RESULTADO '
+# Linha impressa pelo RPA aquecido ao terminar o login e passar a aguardar o usuário (aquecimento_rpa)
+SINAL_PRONTO = '@@RPA_PRONTO'
+
+DESFECHOS = {0: 'sucesso', 2: 'ja_inativo', 3: 'nao_encontrado', 4: 'ativo', 5: 'cancelado'}
+
+# Status presumidos pelo código de saída quando o script não os informa
+_STATUS_ANTES = {0: 'ativo', 2: 'inativo', 4: 'ativo'}
+_STATUS_DEPOIS = {0: 'inativo', 2: 'inativo', 4: 'ativo'}
+
+_CAMPOS_DETALHES = ('conta', 'status_antes', 'status_depois', 'duracao_segundos', 'etapas', 'seletores_obsoletos',
+                    'confirmacao')
+
+# Leitura de uma linha sem quebra não cresce além disso
+_LEITURA_MAXIMA = 64 * 1024
+# Espera pelas threads de leitura após o fim do processo (pipes herdados por filhos)
+_ESPERA_LEITORES = 5
+
+
+def desfecho(codigo):
+    return DESFECHOS.get(codigo, 'erro')
+
+
+def truncar(texto, limite=RPA_RESULTADO_ERRO_MAX, final=False):
+    """Limita o texto a `limite` caracteres (mantendo o final, se final=True)."""
+    if texto is None:
+        return None
+    texto = str(texto)
+    if len(texto) <= limite:
+        return texto
+    return '...' + texto[-(limite - 3):] if final else texto[:limite - 3] + '...'
+
+
+def emitir(codigo, perfil):
+    """Imprime a linha do resultado estruturado da execução (lado do script)."""
+    detalhes = perfil.detalhes
+    resumo = perfil.resumo()
+
+    erro = detalhes.get('erro')
+    if isinstance(erro, BaseException):
+        erro = f"{type(erro).__name__}: {erro}"
+    conta = detalhes.get('conta')
+    if conta is not None:
+        conta = truncar(' '.join(str(conta).split()), 120)
+
+    resultado = {
+        'sistema': perfil.sistema,
+        'desfecho': desfecho(codigo),
+        'codigo': codigo,
+        'conta': conta,
+        'status_antes': detalhes.get('status_antes', _STATUS_ANTES.get(codigo)),
+        'status_depois': detalhes.get('status_depois', _STATUS_DEPOIS.get(codigo)),
+        'duracao_segundos': resumo['duracao_total'],
+        'etapas': resumo['etapas'],
+        'erro': truncar(erro)
+    }
+    if detalhes.get('seletores_obsoletos'):
+        # Seletores alternativos que pararam de corresponder (rpa_seletores)
+        resultado['seletores_obsoletos'] = detalhes['seletores_obsoletos']
+    if detalhes.get('confirmacao'):
+        # De onde veio a confirmação da desativação (rpa_confirmacao)
+        resultado['confirmacao'] = detalhes['confirmacao']
+    print(PREFIXO + json.dumps(resultado, ensure_ascii=False), flush=True)
+    return resultado
+
+
+class ExecucaoRPA:
+    """Código de saída, resultado estruturado e final do log de uma execução do script."""
+
+    def __init__(self, codigo, resultado=None, log='', erro_saida=''):
+        self.codigo = codigo
+        self.resultado = resultado or {}
+        self.log = log or ''
+        self.erro_saida = erro_saida or ''
+
+    def detalhes(self):
+        """Campos do resultado estruturado que vão para o resultado do sistema."""
+        return {campo: self.resultado[campo] for campo in _CAMPOS_DETALHES if self.resultado.get(campo) is not None}
+
+    def mensagem_erro(self):
+        """Erro informado pelo script ou, sem ele, o final do stderr."""
+        if self.resultado.get('erro'):
+            return self.resultado['erro']
+        if self.erro_saida.strip():
+            return truncar(self.erro_saida.strip(), final=True)
+        return f"Código de saída {self.codigo}"
+
+    def log_completo(self):
+        """Final do stdout e do stderr (limitados pelo buffer circular)."""
+        return '\n'.join(parte for parte in (self.log, self.erro_saida) if parte)
+
+
+class CapturaSaida:
+    """Lê stdout e stderr do processo em threads, com um buffer circular por canal."""
+
+    def __init__(self, processo, linhas=RPA_LOG_LINHAS):
+        self.processo = processo
+        self.resultado = None
+        self.pronto = threading.Event()
+        self.descartadas = {'stdout': 0, 'stderr': 0}
+        self._buffers = {'stdout': deque(maxlen=linhas), 'stderr': deque(maxlen=linhas)}
+        self._leitores = [
+            threading.Thread(target=self._ler, args=(processo.stdout, 'stdout'), daemon=True),
+            threading.Thread(target=self._ler, args=(processo.stderr, 'stderr'), daemon=True)
+        ]
+        for leitor in self._leitores:
+            leitor.start()
+
+    def _ler(self, canal, nome):
+        buffer = self._buffers[nome]
+        try:
+            for linha in iter(lambda: canal.readline(_LEITURA_MAXIMA), ''):
+                linha = linha.rstrip('\r\n')
+                if nome == 'stdout' and linha.startswith(PREFIXO):
+                    try:
+                        self.resultado = json.loads(linha[len(PREFIXO):])
+                    except ValueError:
+                        pass
+                    continue
+                if nome == 'stdout' and linha == SINAL_PRONTO:
+                    self.pronto.set()
+                    continue
+                if len(buffer) == buffer.maxlen:
+                    self.descartadas[nome] += 1
+                buffer.append(truncar(linha, RPA_LOG_LINHA_MAX))
+        except (OSError, ValueError):
+            pass
+
+    def aguardar(self, timeout):
+        """Aguarda o fim do processo e retorna a ExecucaoRPA.
+
+        No timeout, encerra a árvore do processo (shell, script, driver e Chrome)
+        e levanta TimeoutExpired; o log capturado até ali continua disponível em
+        execucao().
+        """
+        try:
+            self.processo.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            encerrar_arvore(self.processo)
+            self._encerrar_leitura()
+            raise
+        # Navegador ou driver que o script deixou para trás
+        encerrar_arvore(self.processo)
+        self._encerrar_leitura()
+        return self.execucao()
+
+    def _encerrar_leitura(self):
+        for leitor in self._leitores:
+            leitor.join(_ESPERA_LEITORES)
+
+    def _final(self, nome):
+        linhas = list(self._buffers[nome])
+        if self.descartadas[nome]:
+            linhas.insert(0, f"[... {self.descartadas[nome]} linhas anteriores descartadas]")
+        return '\n'.join(linhas)
+
+    def execucao(self):
+        return ExecucaoRPA(self.processo.returncode, self.resultado, self._final('stdout'), self._final('stderr'))
@@ -0,0 +1,133 @@
+"""
+Cache persistente em disco para os RPAs.
+
+Guarda informações que evitam passos repetidos entre execuções, como a rota
+direta de uma tela ou o identificador de uma conta. Cada cache é um arquivo
+JSON em RPA_CACHE_DIR, gravado de forma atômica e protegido por lock de
+arquivo (quando disponível) para execuções concorrentes do mesmo sistema.
+
+IdentidadesRPA associa o CPF/email de um colaborador à URL do cadastro da
+conta em um sistema, para que novas execuções (reprocessamento, verificação,
+auditoria) abram o cadastro direto, sem pesquisa nem varredura da tabela.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+RPA_CACHE_DIR = os.getenv('RPA_CACHE_DIR', os.path.join('dados', 'rpa'))
+# Tempo (ms) para um cadastro salvo carregar antes de voltar à pesquisa
+RPA_CACHE_ESPERA = int(os.getenv('RPA_CACHE_ESPERA', 10000))
+
+
+class CacheRPA:
+    """Dicionário persistente chave -> valor, com expiração opcional."""
+
+    def __init__(self, nome, ttl=None):
+        self.nome = nome
+        self.ttl = ttl
+        self.caminho = os.path.join(RPA_CACHE_DIR, f"{nome}.json")
+
+    @contextmanager
+    def _bloqueio(self):
+        os.makedirs(RPA_CACHE_DIR, exist_ok=True)
+
+        if fcntl is None:
+            yield
+            return
+
+        with open(f"{self.caminho}.lock", 'w') as arquivo_lock:
+            fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+    def _ler(self):
+        try:
+            with open(self.caminho, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return {}
+
+    def _gravar(self, dados):
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, self.caminho)
+
+    def obter(self, chave):
+        """Retorna o valor armazenado ou None se ausente/expirado."""
+        item = self._ler().get(chave)
+        if not item:
+            return None
+        if self.ttl and time.time() - item.get('atualizado_em', 0) > self.ttl:
+            return None
+        return item.get('valor')
+
+    def definir(self, chave, valor):
+        """Armazena (ou substitui) o valor da chave."""
+        with self._bloqueio():
+            dados = self._ler()
+            dados[chave] = {'valor': valor, 'atualizado_em': time.time()}
+            self._gravar(dados)
+
+    def remover(self, chave):
+        """Remove a chave (ex.: quando o valor deixou de funcionar)."""
+        with self._bloqueio():
+            dados = self._ler()
+            if dados.pop(chave, None) is not None:
+                self._gravar(dados)
+
+
+class IdentidadesRPA(CacheRPA):
+    """CPF/email do colaborador -> URL do cadastro da conta em um sistema."""
+
+    def __init__(self, sistema):
+        super().__init__(f"{sistema}_identidades")
+
+    @staticmethod
+    def _chave(identificador):
+        identificador = identificador.strip().lower()
+        digitos = ''.join(c for c in identificador if c.isdigit())
+        # CPF com ou sem máscara vira a mesma chave
+        if len(digitos) == 11 and '@' not in identificador:
+            return digitos
+        return identificador
+
+    def obter_url(self, identificador):
+        """URL do cadastro salva para o colaborador, ou None."""
+        item = self.obter(self._chave(identificador))
+        return item.get('url') if item else None
+
+    def registrar(self, identificador, url):
+        """Salva a URL do cadastro encontrada na pesquisa."""
+        if url:
+            self.definir(self._chave(identificador), {'url': url})
+
+    def esquecer(self, identificador):
+        """Descarta a URL salva (o cadastro não abriu mais por ela)."""
+        self.remover(self._chave(identificador))
+
+
+def abrir_cadastro_salvo(page, url, seletor, texto=None, espera=None):
+    """Abre um cadastro salvo e confirma que é o esperado.
+
+    O cadastro é aceito quando o seletor aparece em até RPA_CACHE_ESPERA ms e,
+    se informado, o texto (email/CPF) consta na página. Retorna False em
+    qualquer falha, para que o RPA volte à pesquisa.
+    """
+    try:
+        page.goto(url, timeout=30000)
+        page.locator(seletor).first.wait_for(state="attached", timeout=espera or RPA_CACHE_ESPERA)
+        if texto and texto.lower() not in page.content().lower():
+            return False
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,141 @@
+"""
+Confirmação da desativação pela resposta do servidor.
+
+O clique de salvar/confirmar é feito dentro de page.expect_response, e a
+resposta que ele provoca decide o desfecho, sem pausas às cegas nem nova
+pesquisa para conferir a tela:
+
+- HTTP >= 400: falha;
+- corpo com um dos 'textos_falha' do sistema, ou JSON com success/sucesso
+  false ou com erro/error preenchido: falha;
+- qualquer outra resposta: sucesso.
+
+Vale a primeira resposta de documento/XHR/fetch depois do clique cuja URL
+contém o trecho 'url' do endpoint de salvar do sistema, com método de escrita
+(POST, PUT, PATCH, DELETE) ou um dos 'metodos' configurados. Sem 'url', nenhuma
+resposta é escolhida às cegas: a página decide (origem dom), depois da espera
+do sistema ('pausa' em segundos, 'espera' como load state e, se houver, até
+RPA_CONFIRMACAO_TIMEOUT ms pelo seletor de 'sucesso'). Com 'url' e sem resposta
+em RPA_CONFIRMACAO_TIMEOUT ms, a página atual é conferida da mesma forma, sem
+recarregar: o seletor de 'falha' presente reprova, o de 'sucesso' confirma e,
+sem nenhum dos dois, o sucesso é presumido como antes.
+
+A origem da confirmação (resposta, dom ou presumida), o status HTTP e o
+caminho da requisição seguem no resultado estruturado (confirmacao).
+"""
+
+import json
+import os
+from urllib.parse import urlsplit
+
+RPA_CONFIRMACAO_TIMEOUT = int(os.getenv('RPA_CONFIRMACAO_TIMEOUT', 15000))
+
+_METODOS_ESCRITA = ('POST', 'PUT', 'PATCH', 'DELETE')
+_TIPOS_RESPOSTA = ('document', 'xhr', 'fetch')
+
+
+def confirmar(page, perfil, acao, configuracao=None, timeout=None):
+    """Executa a ação (o clique) e retorna True se o servidor confirmou a desativação."""
+    configuracao = configuracao or {}
+    timeout = timeout or RPA_CONFIRMACAO_TIMEOUT
+    if not configuracao.get('url'):
+        # Endpoint de salvar desconhecido: qualquer outra escrita da tela poderia passar por ele
+        acao()
+        _aguardar_pagina(page, perfil, configuracao, timeout)
+        return _confirmar_pela_pagina(page, perfil, configuracao)
+
+    resposta = None
+    executada = False
+
+    try:
+        with page.expect_response(lambda r: _corresponde(r, configuracao), timeout=timeout) as evento:
+            acao()
+            executada = True
+        resposta = evento.value
+    except Exception:
+        # Erro do próprio clique segue para o RPA; sem resposta, vale a página
+        if not executada:
+            raise
+
+    if resposta is None:
+        return _confirmar_pela_pagina(page, perfil, configuracao)
+
+    perfil.anotar(confirmacao={'origem': 'resposta', 'http': resposta.status, 'url': urlsplit(resposta.url).path})
+    motivo = _motivo_falha(resposta, configuracao.get('textos_falha', ()))
+    if motivo:
+        perfil.anotar(status_depois='ativo', erro=f"Desativação recusada pelo servidor: {motivo}")
+        return False
+    perfil.anotar(status_depois='inativo')
+    return True
+
+
+def _corresponde(resposta, configuracao):
+    requisicao = resposta.request
+    metodos = configuracao.get('metodos', _METODOS_ESCRITA)
+    if metodos and requisicao.method.upper() not in metodos:
+        return False
+    if requisicao.resource_type not in _TIPOS_RESPOSTA:
+        return False
+    return configuracao['url'] in resposta.url
+
+
+def _motivo_falha(resposta, textos_falha):
+    if resposta.status >= 400:
+        return f"HTTP {resposta.status}"
+
+    try:
+        corpo = resposta.text()
+    except Exception:
+        # Redirecionamentos e respostas sem corpo: o status basta
+        return None
+
+    conteudo = corpo.lower()
+    for texto in textos_falha:
+        if texto.lower() in conteudo:
+            return texto
+
+    try:
+        dados = json.loads(corpo)
+    except ValueError:
+        return None
+    if not isinstance(dados, dict):
+        return None
+    for campo in ('success', 'sucesso'):
+        if dados.get(campo) is False:
+            return f"{campo}: false"
+    for campo in ('erro', 'error', 'erros', 'errors'):
+        if dados.get(campo):
+            return str(dados[campo])
+    return None
+
+
+def _aguardar_pagina(page, perfil, configuracao, timeout):
+    if configuracao.get('pausa'):
+        perfil.dormir(configuracao['pausa'])
+    try:
+        if configuracao.get('espera'):
+            page.wait_for_load_state(configuracao['espera'], timeout=timeout)
+        if configuracao.get('sucesso'):
+            page.locator(configuracao['sucesso']).first.wait_for(state='visible', timeout=timeout)
+    except Exception:
+        # Sem o sinal de sucesso no prazo: a conferência da página decide
+        pass
+
+
+def _confirmar_pela_pagina(page, perfil, configuracao):
+    if configuracao.get('falha') and _visivel(page, configuracao['falha']):
+        perfil.anotar(confirmacao={'origem': 'dom'}, status_depois='ativo',
+                      erro='Desativação não confirmada: servidor sem resposta e usuário ainda ativo na tela')
+        return False
+    if configuracao.get('sucesso') and _visivel(page, configuracao['sucesso']):
+        perfil.anotar(confirmacao={'origem': 'dom'}, status_depois='inativo')
+        return True
+    perfil.anotar(confirmacao={'origem': 'presumida'})
+    return True
+
+
+def _visivel(page, seletor):
+    try:
+        return page.locator(seletor).first.is_visible()
+    except Exception:
+        return False
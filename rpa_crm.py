@@ -1,11 +1,18 @@
 """RPA CRM JMJ - Desativa usuarios no CRM"""
 
 import sys
-import time
 import os
 from dotenv import load_dotenv
 from playwright.sync_api import sync_playwright
 
+from aquecimento_rpa import AGUARDAR, CANCELADO, Cancelado, receber_argumentos
+from resultado_rpa import emitir
+from rpa_cache import IdentidadesRPA, abrir_cadastro_salvo
+from rpa_confirmacao import confirmar
+from rpa_navegador import abrir_navegador
+from rpa_perfil import Perfilador
+from rpa_seletores import SeletoresAprendidos
+
 load_dotenv()
 
 CRM_URL = os.getenv('CRM_URL', 'https://oestedopara.jmjsistemas.com.br/crm')
@@ -16,23 +23,104 @@ SUCESSO = 0
 ERRO = 1
 JA_INATIVO = 2
 NAO_ENCONTRADO = 3
+ATIVO = 4  # Somente no modo --status: usuário encontrado e ativo
+
+identidades = IdentidadesRPA('crm_jmj')
+
+
+def executar_crm_automatico(email_usuario=None, somente_status=False):
+    perfil = Perfilador('crm_jmj')
+    resultado = _executar_crm(perfil, email_usuario, somente_status)
+    perfil.salvar(resultado)
+    emitir(resultado, perfil)
+    return resultado
 
 
-def executar_crm_automatico(email_usuario):
+def _localizar_cadastro(page, perfil, email_usuario):
     nome_usuario = email_usuario.split('@')[0].replace('.', ' ').lower()
     
+    perfil.etapa('navegacao')
+    page.goto(f"{CRM_URL}/#/configuracoes/usuarios", timeout=30000)
+    page.wait_for_load_state("domcontentloaded", timeout=15000)
+    perfil.dormir(3)
+    
+    perfil.etapa('busca')
+    page.fill("input[ng-model='search.email']", email_usuario)
+    page.click("button[ng-click='pesquisar(search)']")
+    perfil.dormir(3)
+    
+    perfil.etapa('varredura')
+    divs = page.locator("div").all()
+    usuario_divs = []
+    
+    for i, div in enumerate(divs):
+        try:
+            text = div.inner_text().lower()
+            if nome_usuario in text or email_usuario.lower() in text:
+                usuario_divs.append((i, div))
+        except:
+            continue
+    
+    if not usuario_divs:
+        try:
+            primeira_linha = page.locator("tr.ng-scope, div.usuario-item, div[ng-repeat]").first
+            if primeira_linha.is_visible():
+                usuario_divs.append((0, primeira_linha))
+        except:
+            pass
+    
+    if not usuario_divs:
+        return False
+    
+    sucesso = False
+    perfil.etapa('abrir_cadastro')
+    for i, div in usuario_divs:
+        try:
+            div.click()
+            perfil.dormir(2)
+            
+            menus = page.locator(".angular-bootstrap-contextmenu, .dropdown-menu, ul[role='menu'], .contextmenu").all()
+            menus_visiveis = [m for m in menus if m.is_visible()]
+            
+            for menu in menus_visiveis:
+                editar_elementos = menu.locator("a, span, div").all()
+                for elem in editar_elementos:
+                    try:
+                        if elem.is_visible():
+                            text = elem.inner_text().strip()
+                            if text and 'editar' in text.lower():
+                                elem.click()
+                                perfil.dormir(5)
+                                
+                                if page.locator("jmj-toggle").count() > 0 or page.locator("strong:has-text('Ativo')").count() > 0:
+                                    sucesso = True
+                                    break
+                    except:
+                        continue
+                if sucesso:
+                    break
+            if sucesso:
+                break
+        except:
+            continue
+    
+    return sucesso
+
+
+def _executar_crm(perfil, email_usuario, somente_status):
+    perfil.etapa('abrir_navegador')
     with sync_playwright() as p:
-        browser = p.chromium.launch(
-            channel="chrome",
-            headless=False,
+        browser, page = abrir_navegador(
+            p, 'crm_jmj',
             args=["--window-size=600,400", "--window-position=3000,3000"]
         )
-        page = browser.new_page()
+        page = perfil.envolver(page)
         
+        perfil.etapa('login')
         try:
             page.goto(f"{CRM_URL}/#/authenticate", timeout=60000)
             page.wait_for_load_state("domcontentloaded", timeout=30000)
-            time.sleep(3)
+            perfil.dormir(3)
             
             page.click("input[ng-model='credentials.username']")
             page.fill("input[ng-model='credentials.username']", "")
@@ -46,72 +134,30 @@ def executar_crm_automatico(email_usuario):
             page.evaluate("angular.element(document.querySelector(\"input[name='senha']\")).scope().$apply()")
             
             page.click("[ng-click='login(credentials)']")
-            time.sleep(8)
-            
-            page.goto(f"{CRM_URL}/#/configuracoes/usuarios", timeout=30000)
-            page.wait_for_load_state("domcontentloaded", timeout=15000)
-            time.sleep(3)
-            
-            page.fill("input[ng-model='search.email']", email_usuario)
-            page.click("button[ng-click='pesquisar(search)']")
-            time.sleep(3)
-            
-            divs = page.locator("div").all()
-            usuario_divs = []
-            
-            for i, div in enumerate(divs):
-                try:
-                    text = div.inner_text().lower()
-                    if nome_usuario in text or email_usuario.lower() in text:
-                        usuario_divs.append((i, div))
-                except:
-                    continue
-            
-            if not usuario_divs:
-                try:
-                    primeira_linha = page.locator("tr.ng-scope, div.usuario-item, div[ng-repeat]").first
-                    if primeira_linha.is_visible():
-                        usuario_divs.append((0, primeira_linha))
-                except:
-                    pass
-            
-            if not usuario_divs:
-                return NAO_ENCONTRADO
-            
-            sucesso = False
-            for i, div in usuario_divs:
-                try:
-                    div.click()
-                    time.sleep(2)
-                    
-                    menus = page.locator(".angular-bootstrap-contextmenu, .dropdown-menu, ul[role='menu'], .contextmenu").all()
-                    menus_visiveis = [m for m in menus if m.is_visible()]
-                    
-                    for menu in menus_visiveis:
-                        editar_elementos = menu.locator("a, span, div").all()
-                        for elem in editar_elementos:
-                            try:
-                                if elem.is_visible():
-                                    text = elem.inner_text().strip()
-                                    if text and 'editar' in text.lower():
-                                        elem.click()
-                                        time.sleep(5)
-                                        
-                                        if page.locator("jmj-toggle").count() > 0 or page.locator("strong:has-text('Ativo')").count() > 0:
-                                            sucesso = True
-                                            break
-                            except:
-                                continue
-                        if sucesso:
-                            break
-                    if sucesso:
-                        break
-                except:
-                    continue
-            
-            if not sucesso:
-                return NAO_ENCONTRADO
+            perfil.dormir(8)
+            
+            if email_usuario is None:
+                email_usuario = receber_argumentos(perfil)[0]
             
+            cadastro_aberto = False
+            url_cadastro = identidades.obter_url(email_usuario)
+            
+            if url_cadastro:
+                perfil.etapa('cadastro_salvo')
+                cadastro_aberto = abrir_cadastro_salvo(page, url_cadastro, "jmj-toggle")
+                if not cadastro_aberto:
+                    identidades.esquecer(email_usuario)
+            
+            if not cadastro_aberto:
+                if not _localizar_cadastro(page, perfil, email_usuario):
+                    return NAO_ENCONTRADO
+                
+                if page.url.rstrip('/') != f"{CRM_URL}/#/configuracoes/usuarios":
+                    identidades.registrar(email_usuario, page.url)
+            
+            perfil.anotar(conta=email_usuario)
+            
+            perfil.etapa('status')
             try:
                 toggle = page.locator("jmj-toggle button, button[tabindex='-1']").first
                 toggle_class = toggle.get_attribute("class") or ""
@@ -120,33 +166,48 @@ def executar_crm_automatico(email_usuario):
             except:
                 pass
             
-            try:
-                page.click("button[ng-click='ingDisabled ? ngModel = !ngModel : null']")
-            except:
-                try:
-                    page.click("jmj-toggle button")
-                except:
-                    page.click("button[tabindex='-1']")
+            if somente_status:
+                return ATIVO
+            
+            perfil.etapa('inativar')
+            SeletoresAprendidos('crm_jmj', perfil).localizar(page, [
+                "button[ng-click='ingDisabled ? ngModel = !ngModel : null']",
+                "jmj-toggle button",
+                "button[tabindex='-1']"
+            ]).click()
             
-            time.sleep(2)
+            perfil.dormir(2)
             
-            page.click("button.btn.btn-flat.btn-tumblr:has-text('Salvar')")
-            time.sleep(3)
+            perfil.etapa('salvar')
+            # Endpoint de salvar não mapeado e o toggle muda na tela antes de salvar: sem sinal
+            # na página, o sucesso é presumido depois da pausa de sempre
+            salvar = page.locator("button.btn.btn-flat.btn-tumblr:has-text('Salvar')").first
+            if not confirmar(page, perfil, salvar.click, {'pausa': 3}):
+                return ERRO
             
             return SUCESSO
                 
+        except Cancelado:
+            return CANCELADO
         except Exception as e:
+            perfil.anotar(erro=e)
             return ERRO
         finally:
+            perfil.etapa('encerramento')
             browser.close()
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        email = sys.argv[1]
+    somente_status = '--status' in sys.argv
+    argumentos = [a for a in sys.argv[1:] if a not in ('--status', AGUARDAR)]
+    
+    if argumentos:
+        email = argumentos[0]
+    elif AGUARDAR in sys.argv:
+        email = None
     else:
-        print("USO: python rpa_crm.py <email_usuario>")
+        print("USO: python rpa_crm.py <email_usuario> [--status] | --aguardar")
         sys.exit(1)
     
-    resultado = executar_crm_automatico(email)
+    resultado = executar_crm_automatico(email, somente_status)
     sys.exit(resultado)
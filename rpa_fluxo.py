@@ -0,0 +1,354 @@
+"""
+Motor de fluxos declarativos dos RPAs.
+
+Cada sistema descreve o próprio fluxo como dados (FLUXO no rpa_<sistema>.py):
+passos de login, passos para localizar o cadastro do usuário, detectores de
+status e passos de desativação. Este módulo interpreta o fluxo uma única vez
+para todos os sistemas:
+
+- Seletores aceitam uma lista de alternativas. Todas são aguardadas ao mesmo
+  tempo (locator.or_), em vez de uma por uma com timeouts somados, e vence a
+  que correspondeu na última execução do sistema, senão a primeira da lista
+  que estiver visível (rpa_seletores, que também aponta as obsoletas).
+- Antes de interagir, o motor espera o elemento (RPA_FLUXO_TIMEOUT), em vez de
+  pausas fixas. Pausas ficam explícitas no fluxo ('pausa') onde o site precisa.
+- goto é repetido (RPA_FLUXO_TENTATIVAS) em falhas transitórias.
+- Cada passo pode iniciar uma etapa do perfilador ('etapa').
+- Com 'identidade', a URL do cadastro fica em cache (rpa_cache) e as próximas
+  execuções pulam os passos de 'localizar'.
+- Com a variável 'buscas' (identificacao.chaves_busca), os passos de
+  'localizar' rodam com {busca} = cada chave, da mais seletiva para a mais
+  ampla, até o usuário aparecer. Linhas são comparadas sem acentos.
+- Um clique com 'confirmar' (salvar/confirmar da desativação) é decidido pela
+  resposta do endpoint de salvar do sistema ('url') ou, sem ele, pela página
+  atual (rpa_confirmacao); recusada, o RPA termina com ERRO.
+- Com VariaveisAdiadas (RPA aquecido, aquecimento_rpa), o login acontece antes
+  de o servidor conhecer o usuário; as variáveis do usuário chegam logo após.
+- Ao fim, a conta localizada, o status antes/depois e o erro seguem no
+  resultado estruturado (resultado_rpa) junto com o tempo por etapa.
+
+Passos ('acao'): goto, preencher, clicar, aguardar, selecionar, carregamento,
+pausa, avaliar, linha e python (função própria do sistema, para o que não
+cabe nos demais). Valores e URLs aceitam {variaveis} do sistema. Opções comuns:
+'opcional' (falha ignorada), 'nao_encontrado' (falha = usuário não
+encontrado), 'tentativas', 'timeout', 'espera' (load state após clique/tecla)
+e 'confirmar' (clique confirmado pela resposta do servidor).
+"""
+
+import os
+from urllib.parse import urljoin
+
+from playwright.sync_api import sync_playwright
+
+from aquecimento_rpa import CANCELADO, Cancelado, VariaveisAdiadas
+from identificacao import normalizar
+from resultado_rpa import emitir
+from rpa_cache import IdentidadesRPA, abrir_cadastro_salvo
+from rpa_confirmacao import confirmar
+from rpa_navegador import abrir_navegador
+from rpa_perfil import Perfilador
+from rpa_seletores import SeletoresAprendidos
+
+SUCESSO = 0
+ERRO = 1
+JA_INATIVO = 2
+NAO_ENCONTRADO = 3
+ATIVO = 4  # Somente no modo --status: usuário encontrado e ativo
+
+RPA_FLUXO_TIMEOUT = int(os.getenv('RPA_FLUXO_TIMEOUT', 10000))
+RPA_FLUXO_TENTATIVAS = int(os.getenv('RPA_FLUXO_TENTATIVAS', 2))
+
+ARGUMENTOS_JANELA_OCULTA = ["--window-size=600,400", "--window-position=3000,3000"]
+
+# Resultado dos detectores de status -> código de saída
+_CODIGOS_STATUS = {'inativo': JA_INATIVO, 'nao_encontrado': NAO_ENCONTRADO, 'erro': ERRO}
+
+
+class ResultadoFluxo(Exception):
+    """Interrompe o fluxo com um código de saída (ex.: usuário não encontrado)."""
+
+    def __init__(self, codigo):
+        super().__init__(codigo)
+        self.codigo = codigo
+
+
+def executar_fluxo(fluxo, variaveis, somente_status=False):
+    """Executa o fluxo do sistema e retorna o código de saída do RPA."""
+    perfil = Perfilador(fluxo['sistema'])
+    resultado = _executar(fluxo, variaveis, somente_status, perfil)
+    perfil.salvar(resultado)
+    emitir(resultado, perfil)
+    return resultado
+
+
+def _executar(fluxo, variaveis, somente_status, perfil):
+    perfil.etapa('abrir_navegador')
+    with sync_playwright() as p:
+        browser = None
+        try:
+            browser, page = abrir_navegador(
+                p, fluxo['sistema'],
+                args=fluxo.get('argumentos_navegador', ARGUMENTOS_JANELA_OCULTA)
+            )
+            sessao = Sessao(perfil.envolver(page), perfil, variaveis)
+
+            sessao.executar_passos(fluxo['login'])
+            if isinstance(variaveis, VariaveisAdiadas):
+                variaveis.resolver(perfil)
+            _abrir_cadastro(sessao, fluxo)
+
+            perfil.etapa('status')
+            status = sessao.detectar_status(fluxo['status'])
+            perfil.anotar(status_antes=status)
+            if status in _CODIGOS_STATUS:
+                return _CODIGOS_STATUS[status]
+
+            if somente_status:
+                # 'desconhecido' não confirma que o usuário está ativo
+                return ATIVO if status == 'ativo' else ERRO
+
+            sessao.executar_passos(fluxo['desativar'])
+            return ERRO if sessao.confirmado is False else SUCESSO
+
+        except ResultadoFluxo as resultado:
+            return resultado.codigo
+        except Cancelado:
+            return CANCELADO
+        except Exception as erro:
+            perfil.anotar(erro=erro)
+            return ERRO
+        finally:
+            perfil.etapa('encerramento')
+            if browser:
+                try:
+                    browser.close()
+                except Exception:
+                    pass
+
+
+def _abrir_cadastro(sessao, fluxo):
+    """Abre o cadastro do usuário pela URL salva ou pelos passos de 'localizar'."""
+    identidade = fluxo.get('identidade')
+    if not identidade:
+        _localizar(sessao, fluxo)
+        return
+
+    identidades = IdentidadesRPA(fluxo['sistema'])
+    chave = sessao.valor(identidade['chave'])
+    url_salva = identidades.obter_url(chave)
+
+    if url_salva:
+        sessao.perfil.etapa('cadastro_salvo')
+        texto = sessao.valor(identidade['texto']) if identidade.get('texto') else None
+        if abrir_cadastro_salvo(sessao.page, url_salva, identidade['pronto'], texto):
+            sessao.perfil.anotar(conta=chave)
+            return
+        identidades.esquecer(chave)
+
+    _localizar(sessao, fluxo)
+
+    url = sessao.page.url
+    if 'url_contem' in identidade:
+        registrar = identidade['url_contem'] in url
+    else:
+        # A edição pode abrir na mesma rota da lista (modal), sem URL própria
+        registrar = url.rstrip('/') != sessao.valor(identidade['url_lista']).rstrip('/')
+
+    if registrar:
+        identidades.registrar(chave, url)
+    sessao.perfil.detalhes.setdefault('conta', chave)
+
+
+def _localizar(sessao, fluxo):
+    """Passos de 'localizar', repetidos para cada chave de 'buscas' enquanto o usuário não aparece."""
+    buscas = sessao.variaveis.get('buscas')
+    if not buscas:
+        sessao.executar_passos(fluxo['localizar'])
+        return
+
+    for indice, busca in enumerate(buscas):
+        sessao.variaveis['busca'] = busca
+        try:
+            sessao.executar_passos(fluxo['localizar'])
+            return
+        except ResultadoFluxo as resultado:
+            if resultado.codigo != NAO_ENCONTRADO or indice + 1 == len(buscas):
+                raise
+
+
+class Sessao:
+    """Página, perfilador e variáveis de uma execução do fluxo."""
+
+    def __init__(self, page, perfil, variaveis):
+        self.page = page
+        self.perfil = perfil
+        self.variaveis = variaveis
+        self.linha = None
+        # Resultado do clique com 'confirmar' (None: o fluxo não confirma)
+        self.confirmado = None
+        self.seletores = SeletoresAprendidos(perfil.sistema, perfil)
+
+    def valor(self, modelo):
+        if not isinstance(modelo, str):
+            return modelo
+        return modelo.format_map(self.variaveis)
+
+    def localizar(self, seletores, escopo=None, timeout=None, estado='visible'):
+        """Espera a primeira alternativa disponível e retorna seu locator.
+
+        Todas as alternativas são aguardadas em paralelo; se mais de uma estiver
+        visível, vale a preferida do sistema e depois a ordem da lista.
+        """
+        return self.seletores.localizar(
+            escopo or self.page, seletores, timeout=timeout or RPA_FLUXO_TIMEOUT,
+            estado=estado, formatar=self.valor
+        )
+
+    def executar_passos(self, passos):
+        for passo in passos:
+            if 'etapa' in passo:
+                self.perfil.etapa(passo['etapa'])
+
+            tentativas = passo.get('tentativas', RPA_FLUXO_TENTATIVAS if passo['acao'] == 'goto' else 1)
+            for tentativa in range(tentativas):
+                try:
+                    self._executar_passo(passo)
+                    break
+                except ResultadoFluxo:
+                    raise
+                except Exception:
+                    if passo.get('opcional'):
+                        break
+                    if tentativa + 1 >= tentativas:
+                        if passo.get('nao_encontrado'):
+                            # Elemento que só existe quando a pesquisa acha o usuário
+                            raise ResultadoFluxo(NAO_ENCONTRADO)
+                        raise
+                    self.perfil.dormir(1)
+
+    def _executar_passo(self, passo):
+        acao = passo['acao']
+        timeout = passo.get('timeout')
+
+        if acao == 'goto':
+            self.page.goto(self.valor(passo['url']), timeout=timeout or 60000)
+            self.page.wait_for_load_state(passo.get('espera', 'domcontentloaded'))
+
+        elif acao == 'preencher':
+            campo = self.localizar(passo['seletor'], timeout=timeout)
+            campo.fill(self.valor(passo['valor']))
+            if passo.get('tecla'):
+                campo.press(passo['tecla'])
+                self._esperar_carregamento(passo)
+
+        elif acao == 'clicar':
+            elemento = self.localizar(passo['seletor'], timeout=timeout)
+            if 'confirmar' in passo:
+                self.confirmado = confirmar(self.page, self.perfil, elemento.click, passo['confirmar'])
+            else:
+                elemento.click()
+                self._esperar_carregamento(passo)
+
+        elif acao == 'aguardar':
+            self.localizar(passo['seletor'], timeout=timeout, estado=passo.get('estado', 'visible'))
+
+        elif acao == 'selecionar':
+            self.localizar(passo['seletor'], timeout=timeout).select_option(self.valor(passo['valor']))
+
+        elif acao == 'carregamento':
+            self.page.wait_for_load_state(passo.get('estado', 'networkidle'), timeout=timeout or 30000)
+
+        elif acao == 'pausa':
+            self.perfil.dormir(passo['segundos'])
+
+        elif acao == 'avaliar':
+            self.page.evaluate(passo['script'])
+
+        elif acao == 'linha':
+            self._localizar_linha(passo)
+
+        elif acao == 'python':
+            codigo = passo['funcao'](self)
+            if codigo is not None:
+                raise ResultadoFluxo(codigo)
+
+        else:
+            raise ValueError(f"Ação desconhecida no fluxo: {acao}")
+
+    def _esperar_carregamento(self, passo):
+        # Espera de acomodação após o clique/tecla; não interrompe o fluxo
+        if passo.get('espera'):
+            try:
+                self.page.wait_for_load_state(passo['espera'], timeout=passo.get('timeout_espera', 15000))
+            except Exception:
+                pass
+
+    def _localizar_linha(self, passo):
+        """Encontra a linha da tabela com o texto do usuário e abre o cadastro."""
+        texto = normalizar(self.valor(passo['texto']))
+
+        try:
+            self.localizar(passo['linhas'], timeout=passo.get('timeout'))
+        except Exception:
+            raise ResultadoFluxo(NAO_ENCONTRADO)
+
+        if passo.get('vazio'):
+            vazio = self.page.locator(passo['vazio'])
+            if vazio.count() > 0 and vazio.first.is_visible():
+                raise ResultadoFluxo(NAO_ENCONTRADO)
+
+        self.linha = None
+        for linha in self.page.locator(passo['linhas']).all():
+            try:
+                conteudo = linha.inner_text()
+                if texto in normalizar(conteudo):
+                    self.linha = linha
+                    self.perfil.anotar(conta=conteudo)
+                    break
+            except Exception:
+                continue
+
+        if self.linha is None:
+            raise ResultadoFluxo(NAO_ENCONTRADO)
+
+        for alternativa in passo.get('abrir', []):
+            if 'href' in alternativa:
+                link = self.linha.locator(alternativa['href']).first
+                if link.count() > 0:
+                    destino = urljoin(self.page.url, link.get_attribute('href'))
+                    self.page.goto(destino, timeout=30000)
+                    self.page.wait_for_load_state('domcontentloaded')
+                    return
+            elif 'clicar' in alternativa:
+                alvo = self.linha.locator(alternativa['clicar']).first
+                if alvo.count() > 0:
+                    alvo.click()
+                    self._esperar_carregamento(alternativa)
+                    return
+
+        if passo.get('abrir'):
+            raise ResultadoFluxo(NAO_ENCONTRADO)
+
+    def detectar_status(self, configuracao):
+        """Retorna o resultado do primeiro detector presente (ativo, inativo...) ou o padrão."""
+        detectores = configuracao['detectores']
+
+        try:
+            self.localizar([d['seletor'] for d in detectores], timeout=configuracao.get('timeout'))
+        except Exception:
+            return configuracao.get('padrao', 'erro')
+
+        for detector in detectores:
+            elemento = self.page.locator(self.valor(detector['seletor'])).first
+            try:
+                if not elemento.is_visible():
+                    continue
+                if 'texto' in detector:
+                    conteudo = elemento.inner_text().upper()
+                    if not any(t in conteudo for t in detector['texto']):
+                        continue
+            except Exception:
+                continue
+            return detector['resultado']
+
+        return configuracao.get('padrao', 'erro')
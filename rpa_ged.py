@@ -1,10 +1,12 @@
 """RPA GED Bye Bye Paper - Bloqueia usuarios no GED"""
 
 import sys
-import time
 import os
 from dotenv import load_dotenv
-from playwright.sync_api import sync_playwright
+
+from aquecimento_rpa import AGUARDAR, VariaveisAdiadas
+from identificacao import chaves_busca
+from rpa_fluxo import executar_fluxo
 
 load_dotenv()
 
@@ -13,137 +15,95 @@ GED_CONTA = os.getenv('GED_CONTA')
 GED_USERNAME = os.getenv('GED_USERNAME')
 GED_PASSWORD = os.getenv('GED_PASSWORD')
 
-SUCESSO = 0
-ERRO = 1
-JA_INATIVO = 2
-NAO_ENCONTRADO = 3
+SELETOR_STATUS = "span.genmed:has-text('BLOQUEADO'), span.genmed:has-text('ATIVO')"
 
+FLUXO = {
+    'sistema': 'ged',
+    'login': [
+        {'etapa': 'login', 'acao': 'goto', 'url': '{url}'},
+        {'acao': 'preencher', 'seletor': "input[name='conta']", 'valor': '{conta}'},
+        {'acao': 'preencher', 'seletor': "input[name='usuario']", 'valor': '{usuario}'},
+        {'acao': 'preencher', 'seletor': "input[name='senha']", 'valor': '{senha}'},
+        {'acao': 'clicar', 'seletor': "input.enviar", 'espera': 'domcontentloaded'},
+    ],
+    'identidade': {
+        'chave': '{email}',
+        'pronto': SELETOR_STATUS,
+        'texto': '{email}',
+        'url_contem': 'idocs_usuario_manu',
+    },
+    'localizar': [
+        {'etapa': 'navegacao', 'acao': 'goto', 'url': '{url}/idocs_main.php?seta_html=idocs_usuario_cons.php'},
+        {'etapa': 'busca', 'acao': 'preencher', 'valor': '{busca}', 'seletor': [
+            "input[name='trecho']",
+            "input.post[name='trecho']",
+            "input[class*='post']",
+            "form input[type='text']",
+            "input[type='text']"
+        ]},
+        {'acao': 'clicar', 'seletor': "button.btn.btn-success:has-text('Pesquisar')", 'espera': 'domcontentloaded'},
+        # A tabela de resultados não tem sinal próprio de atualização
+        {'acao': 'pausa', 'segundos': 3},
+        {'etapa': 'varredura', 'acao': 'linha', 'linhas': "table.table-striped.table-bordered.table-hover tbody tr",
+         'texto': '{email}', 'abrir': [
+             {'href': "a[href*='idocs_usuario_manu']"},
+             {'clicar': "img[alt='Editar']", 'espera': 'domcontentloaded'}
+         ]},
+    ],
+    'status': {
+        'detectores': [
+            {'seletor': "span.genmed:has-text('BLOQUEADO')", 'resultado': 'inativo'},
+            {'seletor': "span.genmed:has-text('ATIVO')", 'resultado': 'ativo'},
+        ],
+        # Sem status na tela, o bloqueio ainda é tentado (no modo --status vira ERRO)
+        'padrao': 'desconhecido',
+        'timeout': 5000,
+    },
+    'desativar': [
+        {'etapa': 'bloquear', 'acao': 'clicar', 'seletor': "button.btn.btn-yellow"},
+        {'acao': 'selecionar', 'seletor': "select[name='cp5']", 'valor': 'BLOQUEADO'},
+        {'etapa': 'salvar', 'acao': 'clicar', 'seletor': "button.btn.btn-success:has-text('Confirmar')",
+         'confirmar': {'url': 'idocs_', 'sucesso': "span.genmed:has-text('BLOQUEADO')"}},
+    ],
+}
 
-def executar_ged_automatico(email_usuario):
-    nome_busca = email_usuario.split('@')[0].split('.')[0]
-    
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            channel="chrome",
-            headless=False,
-            args=["--window-size=600,400", "--window-position=3000,3000"]
-        )
-        page = browser.new_page()
-        
-        try:
-            page.goto(GED_URL, timeout=60000)
-            page.wait_for_load_state("domcontentloaded")
-            time.sleep(2)
-            
-            page.fill("input[name='conta']", GED_CONTA)
-            time.sleep(0.3)
-            page.fill("input[name='usuario']", GED_USERNAME)
-            time.sleep(0.3)
-            page.fill("input[name='senha']", GED_PASSWORD)
-            time.sleep(0.3)
-            page.click("input.enviar")
-            time.sleep(3)
-            
-            page.goto(f"{GED_URL}/idocs_main.php?seta_html=idocs_usuario_cons.php", timeout=30000)
-            page.wait_for_load_state("domcontentloaded")
-            time.sleep(2)
-            
-            campo_busca = None
-            seletores_busca = [
-                "input[name='trecho']",
-                "input.post[name='trecho']",
-                "input[class*='post']",
-                "form input[type='text']"
-            ]
-            
-            for seletor in seletores_busca:
-                try:
-                    elemento = page.locator(seletor).first
-                    if elemento.is_visible():
-                        campo_busca = elemento
-                        break
-                except:
-                    continue
-            
-            if campo_busca:
-                campo_busca.fill(nome_busca)
-            else:
-                page.locator("input[type='text']").first.fill(nome_busca)
-            
-            time.sleep(0.5)
-            page.click("button.btn.btn-success:has-text('Pesquisar')")
-            time.sleep(3)
-            
-            linhas = page.locator("table.table-striped.table-bordered.table-hover tbody tr").all()
-            usuario_encontrado = False
-            link_editar = None
-            
-            for linha in linhas:
-                try:
-                    texto_linha = linha.inner_text()
-                    
-                    if email_usuario.lower() in texto_linha.lower():
-                        link = linha.locator("a[href*='idocs_usuario_manu']").first
-                        if link.count() > 0:
-                            link_editar = link.get_attribute("href")
-                            usuario_encontrado = True
-                            break
-                        else:
-                            img_editar = linha.locator("img[alt='Editar']").first
-                            if img_editar.count() > 0:
-                                img_editar.click()
-                                usuario_encontrado = True
-                                break
-                except:
-                    continue
-            
-            if not usuario_encontrado:
-                return NAO_ENCONTRADO
-            
-            if link_editar:
-                if not link_editar.startswith('http'):
-                    link_editar = f"{GED_URL}/{link_editar}"
-                page.goto(link_editar, timeout=30000)
-                time.sleep(2)
-            
-            page.wait_for_load_state("domcontentloaded")
-            time.sleep(2)
-            
-            status_atual = None
-            try:
-                status_element = page.locator("span.genmed:has-text('BLOQUEADO'), span.genmed:has-text('ATIVO')").first
-                if status_element.count() > 0:
-                    status_atual = status_element.inner_text().strip()
-            except:
-                pass
-            
-            if status_atual and 'BLOQUEADO' in status_atual.upper():
-                return JA_INATIVO
-            
-            page.click("button.btn.btn-yellow")
-            time.sleep(2)
-            
-            page.select_option("select[name='cp5']", "BLOQUEADO")
-            time.sleep(1)
-            
-            page.click("button.btn.btn-success:has-text('Confirmar')")
-            time.sleep(3)
-            
-            return SUCESSO
-            
-        except Exception as e:
-            return ERRO
-        finally:
-            time.sleep(2)
-            browser.close()
+
+def _variaveis_usuario(email_usuario, nome_completo='', primeiro_nome='', sobrenome=''):
+    # Só o primeiro nome traz centenas de linhas: começa pelo nome completo
+    primeiro_nome = primeiro_nome or email_usuario.split('@')[0].split('.')[0]
+    return {
+        'email': email_usuario,
+        'buscas': chaves_busca(
+            nome_completo,
+            f"{primeiro_nome} {sobrenome}" if sobrenome else '',
+            primeiro_nome
+        ),
+    }
+
+
+def executar_ged_automatico(email_usuario=None, somente_status=False, nome_completo='', primeiro_nome='', sobrenome=''):
+    # Sem email_usuario: RPA aquecido, que recebe o usuário do servidor após o login
+    variaveis = VariaveisAdiadas({
+        'url': GED_URL,
+        'conta': GED_CONTA,
+        'usuario': GED_USERNAME,
+        'senha': GED_PASSWORD,
+    }, _variaveis_usuario, None if email_usuario is None else [email_usuario, nome_completo, primeiro_nome, sobrenome])
+    return executar_fluxo(FLUXO, variaveis, somente_status)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        email = sys.argv[1]
+    somente_status = '--status' in sys.argv
+    argumentos = [a for a in sys.argv[1:] if a not in ('--status', AGUARDAR)]
+    
+    if argumentos:
+        email = argumentos[0]
+    elif AGUARDAR in sys.argv:
+        email = None
     else:
-        print("USO: python rpa_ged.py <email_usuario>")
+        print("USO: python rpa_ged.py <email_usuario> [nome_completo] [primeiro_nome] [sobrenome] [--status]")
+        print("  ou: python rpa_ged.py --aguardar")
         sys.exit(1)
     
-    resultado = executar_ged_automatico(email)
+    resultado = executar_ged_automatico(email, somente_status, *argumentos[1:4])
     sys.exit(resultado)
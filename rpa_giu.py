@@ -1,10 +1,11 @@
 """RPA GIU Unimed - Desativa usuarios no GIU"""
 
 import sys
-import time
 import os
 from dotenv import load_dotenv
-from playwright.sync_api import sync_playwright
+
+from aquecimento_rpa import AGUARDAR, VariaveisAdiadas
+from rpa_fluxo import executar_fluxo
 
 load_dotenv()
 
@@ -12,96 +13,75 @@ GIU_URL = os.getenv('GIU_URL', 'https://giu.unimed.coop.br')
 GIU_USERNAME = os.getenv('GIU_USERNAME')
 GIU_PASSWORD = os.getenv('GIU_PASSWORD')
 
-SUCESSO = 0
-ERRO = 1
-JA_INATIVO = 2
-NAO_ENCONTRADO = 3
+SELETOR_STATUS = "span.fonte-secundaria.texto.label-campo"
+
+FLUXO = {
+    'sistema': 'giu',
+    'login': [
+        {'etapa': 'login', 'acao': 'goto', 'url': '{url}/login'},
+        {'acao': 'preencher', 'seletor': "input[placeholder='Insira o CPF ou CNPJ']", 'valor': '{usuario}'},
+        {'acao': 'preencher', 'seletor': "input[type='password'][placeholder='Insira a senha']", 'valor': '{senha}'},
+        {'acao': 'clicar', 'seletor': "button.unicomp-botao.primario", 'espera': 'networkidle'},
+    ],
+    'identidade': {
+        'chave': '{cpf}',
+        'pronto': SELETOR_STATUS,
+        # O cadastro pode abrir na mesma rota da lista
+        'url_lista': '{url}/gerenciarUsuarios',
+    },
+    'localizar': [
+        {'etapa': 'navegacao', 'acao': 'goto', 'url': '{url}/gerenciarUsuarios'},
+        {'etapa': 'busca', 'acao': 'preencher', 'seletor': "input[placeholder*='Buscar Nome']", 'valor': '{cpf}'},
+        {'acao': 'clicar', 'seletor': "button.fonte-secundaria.texto"},
+        # A lista é atualizada de forma assíncrona, sem sinal na página
+        {'acao': 'pausa', 'segundos': 3},
+        {'etapa': 'abrir_cadastro', 'acao': 'clicar', 'seletor': "div.icone-acao.habilitado",
+         'timeout': 3000, 'nao_encontrado': True},
+    ],
+    'status': {
+        'detectores': [
+            {'seletor': SELETOR_STATUS, 'texto': ['INATIVA', 'INATIVO'], 'resultado': 'inativo'},
+        ],
+        'padrao': 'ativo',
+        'timeout': 5000,
+    },
+    'desativar': [
+        {'etapa': 'inativar', 'acao': 'clicar', 'seletor': ["span.slider.round", "label.switch", "input[type='checkbox']"]},
+        {'etapa': 'salvar', 'acao': 'clicar', 'seletor': "button.unicomp-botao.primario:has-text('SALVAR')",
+         'confirmar': {'espera': 'networkidle', 'sucesso': f"{SELETOR_STATUS}:has-text('INATIV')"}},
+        {'acao': 'clicar', 'seletor': "button.unicomp-botao.primario:has-text('FECHAR')",
+         'timeout': 5000, 'opcional': True},
+    ],
+}
+
 
+def _variaveis_usuario(cpf_usuario):
+    return {
+        'cpf': cpf_usuario,
+    }
 
-def executar_giu_automatico(cpf_usuario):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            channel="chrome",
-            headless=False,
-            args=["--window-size=600,400", "--window-position=3000,3000"]
-        )
-        page = browser.new_page()
-        
-        try:
-            page.goto(f"{GIU_URL}/login", timeout=60000)
-            page.wait_for_load_state("domcontentloaded")
-            time.sleep(2)
-            
-            page.fill("input[placeholder='Insira o CPF ou CNPJ']", GIU_USERNAME)
-            time.sleep(0.5)
-            page.fill("input[type='password'][placeholder='Insira a senha']", GIU_PASSWORD)
-            time.sleep(0.5)
-            page.click("button.unicomp-botao.primario")
-            time.sleep(5)
-            
-            page.goto("https://giu.unimed.coop.br/gerenciarUsuarios", timeout=30000)
-            page.wait_for_load_state("domcontentloaded")
-            time.sleep(3)
-            
-            campo_busca = page.locator("input[placeholder*='Buscar Nome']")
-            campo_busca.fill(cpf_usuario)
-            time.sleep(1)
-            page.click("button.fonte-secundaria.texto")
-            time.sleep(3)
-            
-            try:
-                icone_editar = page.locator("div.icone-acao.habilitado")
-                if icone_editar.count() == 0:
-                    return NAO_ENCONTRADO
-            except Exception:
-                return NAO_ENCONTRADO
-            
-            page.click("div.icone-acao.habilitado")
-            time.sleep(3)
-            
-            try:
-                status_texto = page.locator("span.fonte-secundaria.texto.label-campo").first
-                status_atual = status_texto.inner_text().strip().upper()
-                
-                if "INATIVA" in status_atual or "INATIVO" in status_atual:
-                    return JA_INATIVO
-            except Exception:
-                pass
-            
-            try:
-                page.click("span.slider.round")
-            except Exception:
-                try:
-                    page.click("label.switch")
-                except Exception:
-                    page.click("input[type='checkbox']")
-            
-            time.sleep(2)
-            
-            page.click("button.unicomp-botao.primario:has-text('SALVAR')")
-            time.sleep(3)
-            
-            try:
-                page.click("button.unicomp-botao.primario:has-text('FECHAR')", timeout=5000)
-                time.sleep(2)
-            except Exception:
-                pass
-            
-            return SUCESSO
-            
-        except Exception as e:
-            return ERRO
-        finally:
-            time.sleep(2)
-            browser.close()
+
+def executar_giu_automatico(cpf_usuario=None, somente_status=False):
+    # Sem cpf_usuario: RPA aquecido, que recebe o usuário do servidor após o login
+    variaveis = VariaveisAdiadas({
+        'url': GIU_URL,
+        'usuario': GIU_USERNAME,
+        'senha': GIU_PASSWORD,
+    }, _variaveis_usuario, None if cpf_usuario is None else [cpf_usuario])
+    return executar_fluxo(FLUXO, variaveis, somente_status)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        cpf = sys.argv[1]
+    somente_status = '--status' in sys.argv
+    argumentos = [a for a in sys.argv[1:] if a not in ('--status', AGUARDAR)]
+    
+    if argumentos:
+        cpf = argumentos[0]
+    elif AGUARDAR in sys.argv:
+        cpf = None
     else:
-        print("USO: python rpa_giu.py <cpf_usuario>")
+        print("USO: python rpa_giu.py <cpf_usuario> [--status] | --aguardar")
         sys.exit(1)
     
-    resultado = executar_giu_automatico(cpf)
+    resultado = executar_giu_automatico(cpf, somente_status)
     sys.exit(resultado)
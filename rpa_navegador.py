@@ -0,0 +1,286 @@
+"""
+Navegador dos RPAs com cache em disco persistente por sistema.
+
+Com um perfil vazio a cada execução, o Chrome baixa e compila de novo os
+bundles pesados (Tasy, AngularJS do CRM, app shell do GIU...). Aqui cada
+sistema tem até RPA_NAVEGADOR_SLOTS perfis persistentes em
+RPA_NAVEGADOR_DIR/<sistema>/slot-N. Cada execução trava um slot livre (lock
+de arquivo) e, sem slot livre, usa um navegador comum, sem cache.
+
+Antes de abrir, o slot é limpo: só ficam o cache HTTP, o cache de código
+compilado (V8) e os de shaders. Cookies, storage e sessões são apagados, e o
+login acontece sempre do zero, como antes. O cache HTTP é limitado pelo
+Chrome a RPA_NAVEGADOR_CACHE_MB. Se o slot passar desse tamanho (o cache de
+código conta à parte), ele é esvaziado. Slots sem uso há
+RPA_NAVEGADOR_RETENCAO_DIAS também são apagados.
+
+Os acertos do cache são contados pelo protocolo do Chrome (respostas vindas do
+disco x rede) e acumulados em RPA_NAVEGADOR_DIR/<sistema>/estatisticas.json.
+"""
+
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock de arquivo, sem perfis persistentes
+    fcntl = None
+
+RPA_NAVEGADOR_PERSISTENTE = os.getenv('RPA_NAVEGADOR_PERSISTENTE', '1').lower() in ('1', 'true')
+RPA_NAVEGADOR_DIR = os.getenv('RPA_NAVEGADOR_DIR', os.path.join('dados', 'navegador'))
+RPA_NAVEGADOR_SLOTS = int(os.getenv('RPA_NAVEGADOR_SLOTS', 2))
+RPA_NAVEGADOR_CACHE_MB = int(os.getenv('RPA_NAVEGADOR_CACHE_MB', 300))
+RPA_NAVEGADOR_RETENCAO_DIAS = int(os.getenv('RPA_NAVEGADOR_RETENCAO_DIAS', 14))
+
+MB = 1024 * 1024
+
+# Únicos itens do perfil mantidos entre execuções
+_MANTER_RAIZ = {'Default', 'ShaderCache', 'GrShaderCache', 'GraphiteDawnCache', '.lock'}
+_MANTER_DEFAULT = {'Cache', 'Code Cache', 'GPUCache', 'DawnGraphiteCache', 'DawnWebGPUCache'}
+
+
+def abrir_navegador(p, sistema, headless=False, args=None):
+    """Abre o Chrome do RPA e retorna (navegador, page).
+
+    navegador.close() encerra o Chrome, grava as estatísticas do cache e libera
+    o slot do perfil.
+    """
+    args = list(args or [])
+    slot = _travar_slot(sistema) if RPA_NAVEGADOR_PERSISTENTE and fcntl else None
+
+    if slot is None:
+        browser = p.chromium.launch(channel="chrome", headless=headless, args=args)
+        if RPA_NAVEGADOR_PERSISTENTE and fcntl:
+            _acumular(sistema, {'sem_slot': 1})
+        return browser, browser.new_page()
+
+    diretorio, arquivo_lock = slot
+    try:
+        _preparar_slot(diretorio)
+        contexto = p.chromium.launch_persistent_context(
+            diretorio,
+            channel="chrome",
+            headless=headless,
+            args=args + [f"--disk-cache-size={RPA_NAVEGADOR_CACHE_MB * MB}"]
+        )
+    except Exception:
+        _liberar_slot(arquivo_lock)
+        raise
+
+    page = contexto.pages[0] if contexto.pages else contexto.new_page()
+    navegador = _NavegadorPersistente(sistema, contexto, arquivo_lock)
+    navegador.contar(contexto, page)
+    return navegador, page
+
+
+class _NavegadorPersistente:
+    """Contexto persistente do Chrome em um slot travado, com contagem de acertos do cache."""
+
+    def __init__(self, sistema, contexto, arquivo_lock):
+        self.sistema = sistema
+        self.contexto = contexto
+        self.arquivo_lock = arquivo_lock
+        self.contagem = {'requisicoes': 0, 'do_disco': 0, 'da_memoria': 0, 'bytes_rede': 0}
+        self._fechado = False
+
+    def contar(self, contexto, page):
+        try:
+            cdp = contexto.new_cdp_session(page)
+            cdp.send('Network.enable')
+        except Exception:
+            return
+
+        def resposta(evento):
+            self.contagem['requisicoes'] += 1
+            if evento['response'].get('fromDiskCache'):
+                self.contagem['do_disco'] += 1
+
+        def servida_da_memoria(evento):
+            self.contagem['da_memoria'] += 1
+
+        def carregada(evento):
+            self.contagem['bytes_rede'] += int(evento.get('encodedDataLength') or 0)
+
+        cdp.on('Network.responseReceived', resposta)
+        cdp.on('Network.requestServedFromCache', servida_da_memoria)
+        cdp.on('Network.loadingFinished', carregada)
+
+    def close(self):
+        if self._fechado:
+            return
+        self._fechado = True
+        try:
+            self.contexto.close()
+        finally:
+            _acumular(self.sistema, {'execucoes': 1, **self.contagem})
+            _liberar_slot(self.arquivo_lock)
+
+
+def _diretorio_sistema(sistema):
+    return os.path.join(RPA_NAVEGADOR_DIR, sistema)
+
+
+def _travar_slot(sistema):
+    """Trava o primeiro slot livre do sistema; None se todos estiverem em uso."""
+    os.makedirs(_diretorio_sistema(sistema), exist_ok=True)
+    _remover_slots_antigos(sistema)
+
+    for indice in range(1, RPA_NAVEGADOR_SLOTS + 1):
+        diretorio = os.path.join(_diretorio_sistema(sistema), f"slot-{indice}")
+        os.makedirs(diretorio, exist_ok=True)
+        arquivo_lock = open(os.path.join(diretorio, '.lock'), 'a')
+        try:
+            fcntl.flock(arquivo_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo_lock.close()
+            continue
+        os.utime(arquivo_lock.name)
+        return diretorio, arquivo_lock
+
+    return None
+
+
+def _liberar_slot(arquivo_lock):
+    try:
+        fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+    finally:
+        arquivo_lock.close()
+
+
+def _tamanho(caminho):
+    total = 0
+    for raiz, _, arquivos in os.walk(caminho):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except OSError:
+                pass
+    return total
+
+
+def _apagar(caminho):
+    if os.path.isdir(caminho) and not os.path.islink(caminho):
+        shutil.rmtree(caminho, ignore_errors=True)
+    else:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def _esvaziar(diretorio):
+    for nome in os.listdir(diretorio):
+        if nome != '.lock':
+            _apagar(os.path.join(diretorio, nome))
+
+
+def _preparar_slot(diretorio):
+    """Mantém só os caches do perfil e aplica o limite de tamanho."""
+    for nome in os.listdir(diretorio):
+        if nome not in _MANTER_RAIZ:
+            _apagar(os.path.join(diretorio, nome))
+
+    padrao = os.path.join(diretorio, 'Default')
+    if os.path.isdir(padrao):
+        for nome in os.listdir(padrao):
+            if nome not in _MANTER_DEFAULT:
+                _apagar(os.path.join(padrao, nome))
+
+    if _tamanho(diretorio) > RPA_NAVEGADOR_CACHE_MB * MB:
+        _esvaziar(diretorio)
+        _acumular(os.path.basename(os.path.dirname(diretorio)), {'limpezas': 1})
+
+
+def _remover_slots_antigos(sistema):
+    limite = time.time() - RPA_NAVEGADOR_RETENCAO_DIAS * 86400
+    base = _diretorio_sistema(sistema)
+
+    for nome in os.listdir(base):
+        diretorio = os.path.join(base, nome)
+        caminho_lock = os.path.join(diretorio, '.lock')
+        if not nome.startswith('slot-') or not os.path.exists(caminho_lock):
+            continue
+        if os.path.getmtime(caminho_lock) >= limite:
+            continue
+
+        with open(caminho_lock, 'a') as arquivo_lock:
+            try:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue
+            try:
+                _esvaziar(diretorio)
+                os.utime(caminho_lock)
+            finally:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _bloqueio_estatisticas(sistema):
+    with open(os.path.join(_diretorio_sistema(sistema), 'estatisticas.lock'), 'w') as arquivo_lock:
+        fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+
+def _ler_estatisticas(sistema):
+    try:
+        with open(os.path.join(_diretorio_sistema(sistema), 'estatisticas.json'), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return {}
+
+
+def _acumular(sistema, valores):
+    """Soma os contadores da execução às estatísticas do sistema."""
+    try:
+        os.makedirs(_diretorio_sistema(sistema), exist_ok=True)
+        with _bloqueio_estatisticas(sistema):
+            dados = _ler_estatisticas(sistema)
+            for chave, valor in valores.items():
+                dados[chave] = dados.get(chave, 0) + valor
+            dados['atualizado_em'] = time.time()
+
+            caminho = os.path.join(_diretorio_sistema(sistema), 'estatisticas.json')
+            temporario = f"{caminho}.{os.getpid()}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as arquivo:
+                json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+            os.replace(temporario, caminho)
+    except OSError:
+        pass
+
+
+def estatisticas():
+    """Tamanho em disco e acertos do cache por sistema."""
+    if not os.path.isdir(RPA_NAVEGADOR_DIR):
+        return {'ativo': RPA_NAVEGADOR_PERSISTENTE, 'sistemas': {}}
+
+    sistemas = {}
+    for sistema in sorted(os.listdir(RPA_NAVEGADOR_DIR)):
+        if not os.path.isdir(_diretorio_sistema(sistema)):
+            continue
+        dados = _ler_estatisticas(sistema)
+        requisicoes = dados.get('requisicoes', 0)
+        sistemas[sistema] = {
+            'execucoes': dados.get('execucoes', 0),
+            'execucoes_sem_slot': dados.get('sem_slot', 0),
+            'requisicoes': requisicoes,
+            'do_disco': dados.get('do_disco', 0),
+            'da_memoria': dados.get('da_memoria', 0),
+            'taxa_acerto_disco': round(dados.get('do_disco', 0) / requisicoes, 3) if requisicoes else 0.0,
+            'mb_rede': round(dados.get('bytes_rede', 0) / MB, 1),
+            'limpezas': dados.get('limpezas', 0),
+            'tamanho_mb': round(_tamanho(_diretorio_sistema(sistema)) / MB, 1)
+        }
+
+    return {
+        'ativo': RPA_NAVEGADOR_PERSISTENTE,
+        'slots_por_sistema': RPA_NAVEGADOR_SLOTS,
+        'limite_cache_mb': RPA_NAVEGADOR_CACHE_MB,
+        'sistemas': sistemas
+    }
@@ -1,11 +1,15 @@
 """RPA NextQS Manager - Inativa usuarios no NextQS"""
 
 import sys
-import time
 import os
 from dotenv import load_dotenv
 from playwright.sync_api import sync_playwright
 
+from resultado_rpa import emitir
+from rpa_cache import IdentidadesRPA, abrir_cadastro_salvo
+from rpa_navegador import abrir_navegador
+from rpa_perfil import Perfilador
+
 load_dotenv()
 
 NEXTQS_URL = os.getenv('NEXTQS_URL', 'https://manager.nextqs.com')
@@ -16,36 +20,96 @@ SUCESSO = 0
 ERRO = 1
 JA_INATIVO = 2
 NAO_ENCONTRADO = 3
+ATIVO = 4  # Somente no modo --status: usuário encontrado e ativo
+
+identidades = IdentidadesRPA('nextqs')
+
+
+def executar_nextqs_automatico(email_usuario, somente_status=False):
+    perfil = Perfilador('nextqs')
+    resultado = _executar_nextqs(perfil, email_usuario, somente_status)
+    perfil.salvar(resultado)
+    emitir(resultado, perfil)
+    return resultado
+
+
+def _localizar_cadastro(page, perfil, email_usuario):
+    perfil.etapa('navegacao')
+    page.goto(f"{NEXTQS_URL}/users.html", timeout=60000)
+    page.wait_for_load_state("domcontentloaded")
+    perfil.dormir(2)
+    
+    perfil.etapa('busca')
+    campo_pesquisa = page.locator("input[type='search'][aria-controls='usersDataTable']")
+    campo_pesquisa.wait_for(state="visible", timeout=10000)
+    campo_pesquisa.fill(email_usuario)
+    perfil.dormir(2)
+    
+    perfil.dormir(1)
+    
+    perfil.etapa('varredura')
+    tabela = page.locator("table#usersDataTable tbody")
+    linhas = tabela.locator("tr").all()
+    
+    usuario_encontrado = False
+    botao_editar = None
+    
+    for linha in linhas:
+        try:
+            texto_linha = linha.inner_text()
+            if email_usuario.lower() in texto_linha.lower():
+                usuario_encontrado = True
+                botao_editar = linha.locator("a.btn-primary").first
+                break
+        except Exception:
+            continue
+    
+    try:
+        sem_dados = page.locator("td.dataTables_empty")
+        if sem_dados.count() > 0 and sem_dados.is_visible():
+            return False
+    except Exception:
+        pass
+    
+    if not usuario_encontrado or not botao_editar:
+        return False
+    
+    perfil.etapa('abrir_cadastro')
+    botao_editar.click()
+    perfil.dormir(2)
+    page.wait_for_load_state("domcontentloaded")
+    
+    return True
 
 
-def executar_nextqs_automatico(email_usuario):
+def _executar_nextqs(perfil, email_usuario, somente_status):
     if not NEXTQS_USERNAME or not NEXTQS_PASSWORD:
+        perfil.anotar(erro="NEXTQS_USERNAME/NEXTQS_PASSWORD não configurados")
         return ERRO
     
+    perfil.etapa('abrir_navegador')
     with sync_playwright() as p:
-        browser = p.chromium.launch(
-            channel="chrome",
-            headless=False,
-            args=["--window-size=1200,800"]
-        )
-        page = browser.new_page()
+        browser, page = abrir_navegador(p, 'nextqs', args=["--window-size=1200,800"])
+        page = perfil.envolver(page)
         
+        perfil.etapa('login')
         try:
             page.goto(f"{NEXTQS_URL}/login.html", timeout=60000)
             page.wait_for_load_state("domcontentloaded")
-            time.sleep(2)
+            perfil.dormir(2)
             
             campo_usuario = page.locator("input#loginform-username")
             campo_usuario.fill(NEXTQS_USERNAME)
-            time.sleep(0.5)
+            perfil.dormir(0.5)
             
             campo_usuario.press("Enter")
-            time.sleep(2)
+            perfil.dormir(2)
             
             page.wait_for_selector("input#loginform-password", state="visible", timeout=10000)
             page.fill("input#loginform-password", NEXTQS_PASSWORD)
-            time.sleep(1)
+            perfil.dormir(1)
             
+            perfil.etapa('captcha')
             turnstile_resolvido = False
             tentativas = 0
             max_tentativas = 45
@@ -74,59 +138,39 @@ def executar_nextqs_automatico(email_usuario):
                     pass
                 
                 tentativas += 1
-                time.sleep(1)
+                perfil.dormir(1)
             
-            time.sleep(2)
+            perfil.dormir(2)
             
+            perfil.etapa('login_envio')
             page.click("button#submitLoginBtn")
-            time.sleep(5)
+            perfil.dormir(5)
             
             try:
                 page.wait_for_load_state("networkidle", timeout=60000)
             except Exception:
-                time.sleep(5)
+                perfil.dormir(5)
             
-            page.goto(f"{NEXTQS_URL}/users.html", timeout=60000)
-            page.wait_for_load_state("domcontentloaded")
-            time.sleep(2)
-            
-            campo_pesquisa = page.locator("input[type='search'][aria-controls='usersDataTable']")
-            campo_pesquisa.wait_for(state="visible", timeout=10000)
-            campo_pesquisa.fill(email_usuario)
-            time.sleep(2)
-            
-            time.sleep(1)
-            
-            tabela = page.locator("table#usersDataTable tbody")
-            linhas = tabela.locator("tr").all()
+            cadastro_aberto = False
+            url_cadastro = identidades.obter_url(email_usuario)
             
-            usuario_encontrado = False
-            botao_editar = None
-            
-            for linha in linhas:
-                try:
-                    texto_linha = linha.inner_text()
-                    if email_usuario.lower() in texto_linha.lower():
-                        usuario_encontrado = True
-                        botao_editar = linha.locator("a.btn-primary").first
-                        break
-                except Exception:
-                    continue
+            if url_cadastro:
+                perfil.etapa('cadastro_salvo')
+                cadastro_aberto = abrir_cadastro_salvo(page, url_cadastro, "input#swtActivated", email_usuario)
+                if not cadastro_aberto:
+                    identidades.esquecer(email_usuario)
             
-            try:
-                sem_dados = page.locator("td.dataTables_empty")
-                if sem_dados.count() > 0 and sem_dados.is_visible():
+            if not cadastro_aberto:
+                if not _localizar_cadastro(page, perfil, email_usuario):
                     return NAO_ENCONTRADO
-            except Exception:
-                pass
-            
-            if not usuario_encontrado or not botao_editar:
-                return NAO_ENCONTRADO
+                
+                # A edição pode abrir em modal, sem URL própria
+                if 'users.html' not in page.url:
+                    identidades.registrar(email_usuario, page.url)
             
-            botao_editar.click()
-            time.sleep(2)
-            page.wait_for_load_state("domcontentloaded")
+            perfil.anotar(conta=email_usuario)
             
+            perfil.etapa('status')
             toggle_ativar = page.locator("input#swtActivated")
             toggle_ativar.wait_for(state="attached", timeout=10000)
             
@@ -135,24 +179,31 @@ def executar_nextqs_automatico(email_usuario):
             if not esta_ativo:
                 return JA_INATIVO
             
+            if somente_status:
+                return ATIVO
+            
+            perfil.etapa('inativar')
             label_toggle = page.locator("label[for='swtActivated']")
             if label_toggle.count() > 0:
                 label_toggle.click()
             else:
                 toggle_ativar.click()
-            time.sleep(1)
+            perfil.dormir(1)
             
+            perfil.etapa('salvar')
             page.click("button#btnUpdate")
-            time.sleep(3)
+            perfil.dormir(3)
             
             page.wait_for_load_state("networkidle", timeout=30000)
             
             return SUCESSO
             
         except Exception as e:
+            perfil.anotar(erro=e)
             return ERRO
         finally:
-            time.sleep(2)
+            perfil.etapa('encerramento')
+            perfil.dormir(2)
             try:
                 browser.close()
             except Exception:
@@ -160,11 +211,14 @@ def executar_nextqs_automatico(email_usuario):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        email = sys.argv[1]
+    somente_status = '--status' in sys.argv
+    argumentos = [a for a in sys.argv[1:] if a != '--status']
+    
+    if argumentos:
+        email = argumentos[0]
     else:
-        print("USO: python rpa_nextqs.py <email_usuario>")
+        print("USO: python rpa_nextqs.py <email_usuario> [--status]")
         sys.exit(1)
     
-    resultado = executar_nextqs_automatico(email)
+    resultado = executar_nextqs_automatico(email, somente_status)
     sys.exit(resultado)
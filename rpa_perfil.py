@@ -0,0 +1,335 @@
+"""
+Perfilador de latência por etapa para os RPAs (opcional, RPA_PERFIL=1).
+
+Envolve a página do Playwright para cronometrar cada ação (goto, fill, click,
+waits, consultas de locator) e cada pausa fixa, registrando a etapa e o seletor.
+Ao fim de cada execução grava uma linha do tempo em RPA_PERFIL_DIR/<sistema>/ e
+atualiza os agregados entre execuções (etapas mais lentas, sono x tempo ativo).
+
+Independente de RPA_PERFIL, cada etapa vira um span (rastreio) filho do span do
+RPA no servidor, recebido pelo TRACEPARENT.
+
+Relatório: python rpa_perfil.py [sistema] [--top N]
+"""
+
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+from rastreio import Span, iniciar_span
+
+logger = logging.getLogger(__name__)
+
+RPA_PERFIL = os.getenv('RPA_PERFIL', '').lower() in ('1', 'true')
+RPA_PERFIL_DIR = os.getenv('RPA_PERFIL_DIR', 'perfis')
+RPA_PERFIL_MAX_EXECUCOES = int(os.getenv('RPA_PERFIL_MAX_EXECUCOES', 200))
+
+# Métodos que só constroem locators (sem ir ao navegador) não são cronometrados
+_FABRICAS_LOCATOR = {'locator', 'nth', 'filter', 'frame_locator', 'get_by_text', 'get_by_role', 'or_', 'and_'}
+_TIPOS_ENVOLVIDOS = {'Locator', 'Keyboard', 'Mouse', 'FrameLocator'}
+
+
+class Perfilador:
+    """Coleta os tempos e os detalhes do resultado de uma execução de RPA."""
+
+    def __init__(self, sistema, ativo=None):
+        self.sistema = sistema
+        self.ativo = RPA_PERFIL if ativo is None else ativo
+        self.job_id = os.getenv('JOB_ID')
+        self.eventos = []
+        self.etapas = []
+        self.detalhes = {}
+        self._inicio = time.perf_counter()
+        self._inicio_data = datetime.now()
+        self._span = iniciar_span(f"rpa.{sistema}", sistema=sistema, job_id=self.job_id)
+        self._etapa_atual = None
+        self.etapa('inicio')
+
+    def etapa(self, nome):
+        """Encerra a etapa atual e inicia uma nova (login, navegacao, busca...)."""
+        agora = time.perf_counter()
+
+        if self._etapa_atual is not None:
+            self._etapa_atual['duracao'] = agora - self._etapa_atual['inicio']
+
+        self._etapa_atual = {'nome': nome, 'inicio': agora, 'duracao': 0.0}
+        self.etapas.append(self._etapa_atual)
+
+    def anotar(self, **campos):
+        """Registra detalhes do resultado (conta, status_antes, status_depois, erro)."""
+        self.detalhes.update(campos)
+
+    def dormir(self, segundos):
+        """Pausa fixa (time.sleep), registrada como sono quando o perfil está ativo."""
+        inicio = time.perf_counter()
+        time.sleep(segundos)
+
+        if self.ativo:
+            self._registrar('sleep', None, inicio, time.perf_counter())
+
+    def envolver(self, page):
+        """Retorna a página envolvida pelo perfilador (ou a própria página, se inativo)."""
+        if not self.ativo:
+            return page
+        return _ObjetoPerfilado(page, self, None)
+
+    def _registrar(self, acao, seletor, inicio, fim, erro=None):
+        evento = {
+            'etapa': self._etapa_atual['nome'],
+            'acao': acao,
+            'seletor': seletor,
+            'inicio': round(inicio - self._inicio, 4),
+            'duracao': round(fim - inicio, 4)
+        }
+        if erro:
+            evento['erro'] = erro
+        self.eventos.append(evento)
+
+    def resumo(self):
+        """Totais da execução: duração, sono, tempo ativo e tempo por etapa."""
+        self.etapa('fim')
+        total = time.perf_counter() - self._inicio
+        sono = sum(e['duracao'] for e in self.eventos if e['acao'] == 'sleep')
+
+        return {
+            'duracao_total': round(total, 3),
+            'tempo_sono': round(sono, 3),
+            'tempo_ativo': round(total - sono, 3),
+            'etapas': {
+                e['nome']: round(e['duracao'], 3) for e in self.etapas if e['nome'] != 'fim'
+            }
+        }
+
+    def exportar_spans(self, resultado):
+        """Encerra o span da execução com um span filho por etapa."""
+        agora = time.perf_counter()
+        base = self._span.inicio_ns
+
+        def ns(instante):
+            return base + int((instante - self._inicio) * 1e9)
+
+        for indice, etapa in enumerate(self.etapas):
+            if etapa['nome'] == 'fim':
+                continue
+            fim = self.etapas[indice + 1]['inicio'] if indice + 1 < len(self.etapas) else agora
+            Span(f"etapa.{etapa['nome']}", self._span.trace_id, self._span.span_id,
+                 {'sistema': self.sistema}, ns(etapa['inicio'])).encerrar(ns(fim))
+
+        erro = self.detalhes.get('erro')
+        self._span.definir(codigo=resultado, conta=self.detalhes.get('conta'))
+        if erro:
+            self._span.falhar(erro)
+        self._span.encerrar(ns(agora))
+
+    def salvar(self, resultado):
+        """Grava a linha do tempo da execução e atualiza os agregados do sistema."""
+        self.exportar_spans(resultado)
+        if not self.ativo:
+            return None
+
+        execucao = {
+            'sistema': self.sistema,
+            'job_id': self.job_id,
+            'data': self._inicio_data.isoformat(timespec='seconds'),
+            'resultado': resultado,
+            **self.resumo(),
+            'eventos': self.eventos
+        }
+
+        diretorio = os.path.join(RPA_PERFIL_DIR, self.sistema)
+        os.makedirs(diretorio, exist_ok=True)
+
+        nome = self._inicio_data.strftime('%Y%m%d-%H%M%S')
+        caminho = os.path.join(diretorio, f"{nome}-{self.job_id or os.getpid()}.json")
+        _gravar_json(caminho, execucao)
+        _podar_execucoes(self.sistema)
+
+        try:
+            _gravar_json(os.path.join(diretorio, 'agregado.json'), agregar(self.sistema))
+        except (OSError, ValueError) as erro:
+            logger.warning(f"[PERFIL] Falha ao atualizar o agregado de {self.sistema}: {erro}")
+
+        return caminho
+
+
+class _ObjetoPerfilado:
+    """Proxy de Page/Locator/Keyboard que cronometra as chamadas de método."""
+
+    def __init__(self, alvo, perfil, descricao):
+        self._alvo = alvo
+        self._perfil = perfil
+        self._descricao = descricao
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._alvo, nome)
+
+        if not callable(atributo):
+            return self._envolver_resultado(atributo, f"{self._descricao}.{nome}")
+
+        if nome in _FABRICAS_LOCATOR:
+            def fabrica(*args, **kwargs):
+                seletor = _descrever(args, self._descricao)
+                args, kwargs = _desembrulhar(args, kwargs)
+                return self._envolver_resultado(atributo(*args, **kwargs), seletor)
+            return fabrica
+
+        def acao_cronometrada(*args, **kwargs):
+            seletor = self._descricao or _descrever(args, None)
+            # Locators envolvidos passados como argumento (ex.: or_, and_) voltam ao original
+            args, kwargs = _desembrulhar(args, kwargs)
+            inicio = time.perf_counter()
+            try:
+                retorno = atributo(*args, **kwargs)
+            except Exception as erro:
+                self._perfil._registrar(nome, seletor, inicio, time.perf_counter(), type(erro).__name__)
+                raise
+            self._perfil._registrar(nome, seletor, inicio, time.perf_counter())
+            return self._envolver_resultado(retorno, seletor)
+
+        return acao_cronometrada
+
+    def _envolver_resultado(self, valor, descricao):
+        if isinstance(valor, list):
+            return [self._envolver_resultado(item, descricao) for item in valor]
+        if type(valor).__name__ in _TIPOS_ENVOLVIDOS:
+            return _ObjetoPerfilado(valor, self._perfil, descricao)
+        return valor
+
+
+def _desembrulhar(args, kwargs):
+    def original(valor):
+        return valor._alvo if isinstance(valor, _ObjetoPerfilado) else valor
+    return [original(a) for a in args], {k: original(v) for k, v in kwargs.items()}
+
+
+def _descrever(args, base):
+    """Monta a descrição do seletor a partir do primeiro argumento textual."""
+    texto = args[0] if args and isinstance(args[0], str) else None
+    if texto and len(texto) > 120:
+        texto = texto[:117] + '...'
+    if base and texto:
+        return f"{base} >> {texto}"
+    return texto or base
+
+
+def _gravar_json(caminho, dados):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def _arquivos_execucoes(sistema):
+    # Nomes começam pela data: a ordem alfabética é a cronológica
+    return sorted(
+        f for f in glob.glob(os.path.join(RPA_PERFIL_DIR, sistema, '*.json'))
+        if not f.endswith('agregado.json')
+    )
+
+
+def _podar_execucoes(sistema):
+    """Apaga as linhas do tempo além das RPA_PERFIL_MAX_EXECUCOES mais recentes."""
+    for arquivo in _arquivos_execucoes(sistema)[:-RPA_PERFIL_MAX_EXECUCOES]:
+        try:
+            os.remove(arquivo)
+        except OSError as erro:
+            logger.warning(f"[PERFIL] Falha ao apagar a execução antiga {arquivo}: {erro}")
+
+
+def _carregar_execucoes(sistema):
+    arquivos = _arquivos_execucoes(sistema)[-RPA_PERFIL_MAX_EXECUCOES:]
+
+    execucoes = []
+    for arquivo in arquivos:
+        try:
+            with open(arquivo, encoding='utf-8') as f:
+                execucoes.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return execucoes
+
+
+def agregar(sistema, top=20):
+    """Agrega as últimas execuções de um sistema: etapas e ações mais lentas."""
+    execucoes = _carregar_execucoes(sistema)
+    acoes = {}
+    etapas = {}
+
+    for execucao in execucoes:
+        for nome, duracao in execucao.get('etapas', {}).items():
+            etapa = etapas.setdefault(nome, {'etapa': nome, 'total': 0.0, 'execucoes': 0})
+            etapa['total'] += duracao
+            etapa['execucoes'] += 1
+
+        for evento in execucao.get('eventos', []):
+            chave = (evento['etapa'], evento['acao'], evento.get('seletor'))
+            acao = acoes.setdefault(chave, {
+                'etapa': chave[0], 'acao': chave[1], 'seletor': chave[2],
+                'chamadas': 0, 'total': 0.0, 'maximo': 0.0, 'erros': 0
+            })
+            acao['chamadas'] += 1
+            acao['total'] += evento['duracao']
+            acao['maximo'] = max(acao['maximo'], evento['duracao'])
+            if evento.get('erro'):
+                acao['erros'] += 1
+
+    for acao in acoes.values():
+        acao['media'] = round(acao['total'] / acao['chamadas'], 4)
+        acao['total'] = round(acao['total'], 3)
+    for etapa in etapas.values():
+        etapa['media'] = round(etapa['total'] / etapa['execucoes'], 3)
+        etapa['total'] = round(etapa['total'], 3)
+
+    total = sum(e.get('duracao_total', 0) for e in execucoes)
+    sono = sum(e.get('tempo_sono', 0) for e in execucoes)
+
+    return {
+        'sistema': sistema,
+        'execucoes': len(execucoes),
+        'duracao_media': round(total / len(execucoes), 3) if execucoes else 0.0,
+        'tempo_sono_total': round(sono, 3),
+        'tempo_ativo_total': round(total - sono, 3),
+        'percentual_sono': round(100 * sono / total, 1) if total else 0.0,
+        'etapas': sorted(etapas.values(), key=lambda e: e['total'], reverse=True),
+        'acoes_mais_lentas': sorted(acoes.values(), key=lambda a: a['total'], reverse=True)[:top]
+    }
+
+
+def _imprimir_relatorio(sistema, top):
+    dados = agregar(sistema, top)
+    print("=" * 60)
+    print(f"PERFIL: {sistema} ({dados['execucoes']} execuções)")
+    print("=" * 60)
+    print(f"Duração média: {dados['duracao_media']}s | "
+          f"Sono: {dados['percentual_sono']}% ({dados['tempo_sono_total']}s) | "
+          f"Ativo: {dados['tempo_ativo_total']}s")
+    print("\nEtapas:")
+    for etapa in dados['etapas']:
+        print(f"  {etapa['etapa']:<20} média {etapa['media']:>8}s  total {etapa['total']:>9}s")
+    print(f"\nTop {top} ações:")
+    for acao in dados['acoes_mais_lentas']:
+        print(f"  {acao['total']:>9}s  {acao['chamadas']:>4}x  [{acao['etapa']}] {acao['acao']} {acao['seletor'] or ''}")
+
+
+if __name__ == '__main__':
+    argumentos = sys.argv[1:]
+    top = 20
+    if '--top' in argumentos:
+        indice = argumentos.index('--top')
+        top = int(argumentos[indice + 1])
+        del argumentos[indice:indice + 2]
+
+    sistemas = argumentos or sorted(
+        os.path.basename(d) for d in glob.glob(os.path.join(RPA_PERFIL_DIR, '*')) if os.path.isdir(d)
+    )
+
+    if not sistemas:
+        print(f"Nenhum perfil encontrado em {RPA_PERFIL_DIR}/ (execute os RPAs com RPA_PERFIL=1)")
+        sys.exit(1)
+
+    for sistema in sistemas:
+        _imprimir_relatorio(sistema, top)
@@ -1,10 +1,11 @@
 """RPA SAW - Desativa usuarios no SAW"""
 
 import sys
-import time
 import os
 from dotenv import load_dotenv
-from playwright.sync_api import sync_playwright
+
+from aquecimento_rpa import AGUARDAR, VariaveisAdiadas
+from rpa_fluxo import executar_fluxo
 
 load_dotenv()
 
@@ -12,98 +13,70 @@ SAW_URL = os.getenv('SAW_URL', 'https://saw.trixti.com.br/saw')
 SAW_USERNAME = os.getenv('SAW_USERNAME')
 SAW_PASSWORD = os.getenv('SAW_PASSWORD')
 
-SUCESSO = 0
-ERRO = 1
-JA_INATIVO = 2
-NAO_ENCONTRADO = 3
+CAMPO_EMAIL = "input[name='filtroDePesquisaDeUsuarios.usuario.email']"
+ICONE_DESATIVAR = "img[src*='desativarUsuario']"
+ICONE_ATIVAR = "img[src*='ativarUsuario']"
+
+FLUXO = {
+    'sistema': 'saw',
+    'login': [
+        {'etapa': 'login', 'acao': 'goto', 'url': '{url}/Logar.do?method=abrirSAW'},
+        {'acao': 'preencher', 'seletor': "input[name='j_username']", 'valor': '{usuario}'},
+        {'acao': 'preencher', 'seletor': "input[name='j_password']", 'valor': '{senha}'},
+        {'acao': 'clicar', 'seletor': "input#submitForm", 'espera': 'domcontentloaded'},
+    ],
+    'localizar': [
+        {'etapa': 'navegacao', 'acao': 'goto', 'url': '{url}/ManterUsuario.do?comando=abrirTelaInicialDeUsuario'},
+        {'etapa': 'busca', 'acao': 'preencher', 'seletor': CAMPO_EMAIL, 'valor': '{email}', 'tecla': 'Enter',
+         'espera': 'domcontentloaded'},
+        # O resultado da pesquisa não tem sinal próprio; sem a pausa os ícones da tela anterior valeriam
+        {'acao': 'pausa', 'segundos': 3},
+    ],
+    'status': {
+        # "ativarUsuario" também casa com "desativarUsuario": a ordem dos detectores importa
+        'detectores': [
+            {'seletor': ICONE_DESATIVAR, 'resultado': 'ativo'},
+            {'seletor': ICONE_ATIVAR, 'resultado': 'inativo'},
+        ],
+        'padrao': 'nao_encontrado',
+        'timeout': 3000,
+    },
+    'desativar': [
+        {'etapa': 'desativar', 'acao': 'avaliar', 'script': "window.confirm = () => true;"},
+        # O ícone chama o ManterUsuario.do (pode ser GET); o ícone de desativar ainda na tela reprova
+        {'acao': 'clicar', 'seletor': [ICONE_DESATIVAR, "img[title*='Desativar']", "img[alt*='Desativar']"],
+         'confirmar': {'url': 'ManterUsuario.do', 'metodos': (), 'falha': ICONE_DESATIVAR, 'sucesso': ICONE_ATIVAR}},
+    ],
+}
+
 
+def _variaveis_usuario(email_usuario):
+    return {
+        'email': email_usuario,
+    }
 
-def executar_saw_automatico(email_usuario):
-    with sync_playwright() as p:
-        browser = None
-        try:
-            browser = p.chromium.launch(
-                channel="chrome",
-                headless=False,
-                args=["--window-size=600,400", "--window-position=3000,3000"]
-            )
-            page = browser.new_page()
-            
-            try:
-                page.goto(f"{SAW_URL}/Logar.do?method=abrirSAW", timeout=60000)
-                page.fill("input[name='j_username']", SAW_USERNAME)
-                page.fill("input[name='j_password']", SAW_PASSWORD)
-                page.click("input#submitForm")
-                page.wait_for_load_state("domcontentloaded", timeout=30000)
-                time.sleep(2)
-                
-                page.goto(f"{SAW_URL}/ManterUsuario.do?comando=abrirTelaInicialDeUsuario", timeout=60000)
-                page.wait_for_load_state("domcontentloaded", timeout=30000)
-                time.sleep(2)
-                
-                campo = "input[name='filtroDePesquisaDeUsuarios.usuario.email']"
-                page.fill(campo, email_usuario)
-                page.press(campo, "Enter")
-                time.sleep(3)
-                
-                icone_desativar = page.locator("img[src*='desativarUsuario']")
-                icone_ativar = page.locator("img[src*='ativarUsuario']")
-                
-                if icone_desativar.count() == 0 and icone_ativar.count() == 0:
-                    return NAO_ENCONTRADO
-                
-                if icone_desativar.count() == 0 and icone_ativar.count() > 0:
-                    return JA_INATIVO
-                
-                page.evaluate("window.confirm = () => true;")
-                
-                try:
-                    icone_desativar.first.click()
-                except:
-                    try:
-                        page.click("img[src*='desativarUsuario']")
-                    except:
-                        page.click("img[title*='Desativar'], img[alt*='Desativar']")
-                
-                time.sleep(3)
-                
-                page.reload()
-                time.sleep(2)
-                
-                page.fill(campo, email_usuario)
-                page.press(campo, "Enter")
-                time.sleep(3)
-                
-                icone_ativar_depois = page.locator("img[src*='ativarUsuario']")
-                icone_desativar_depois = page.locator("img[src*='desativarUsuario']")
-                
-                if icone_ativar_depois.count() > 0 and icone_desativar_depois.count() == 0:
-                    return SUCESSO
-                elif icone_desativar_depois.count() > 0:
-                    return ERRO
-                else:
-                    return SUCESSO
-                
-            except Exception as e:
-                return ERRO
-            
-        except Exception as e:
-            return ERRO
-        finally:
-            if browser:
-                try:
-                    time.sleep(2)
-                    browser.close()
-                except:
-                    pass
+
+def executar_saw_automatico(email_usuario=None, somente_status=False):
+    # Sem email_usuario: RPA aquecido, que recebe o usuário do servidor após o login
+    variaveis = VariaveisAdiadas({
+        'url': SAW_URL,
+        'usuario': SAW_USERNAME,
+        'senha': SAW_PASSWORD,
+    }, _variaveis_usuario, None if email_usuario is None else [email_usuario])
+    return executar_fluxo(FLUXO, variaveis, somente_status)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        email = sys.argv[1]
+    somente_status = '--status' in sys.argv
+    argumentos = [a for a in sys.argv[1:] if a not in ('--status', AGUARDAR)]
+    
+    if argumentos:
+        email = argumentos[0]
+    elif AGUARDAR in sys.argv:
+        email = None
     else:
-        print("USO: python rpa_saw.py <email_usuario>")
+        print("USO: python rpa_saw.py <email_usuario> [--status] | --aguardar")
         sys.exit(1)
     
-    resultado = executar_saw_automatico(email)
+    resultado = executar_saw_automatico(email, somente_status)
     sys.exit(resultado)
@@ -0,0 +1,155 @@
+"""
+Seletores alternativos com preferência aprendida por sistema.
+
+Os sites mudam o HTML sem aviso, por isso vários passos dos RPAs têm mais de um
+seletor para o mesmo elemento. Tentar um por vez custa o timeout inteiro do
+Playwright a cada alternativa que falha. SeletoresAprendidos aguarda todas as
+alternativas ao mesmo tempo (locator.or_) e, assim que uma aparece, descobre
+qual correspondeu com consultas instantâneas (is_visible/count).
+
+A alternativa que correspondeu fica gravada por sistema em
+RPA_CACHE_DIR/<sistema>_seletores.json e é consultada primeiro nas próximas
+execuções. Uma alternativa que já correspondeu e deixa de corresponder em
+RPA_SELETOR_FALHAS consultas seguidas é marcada como obsoleta: o RPA avisa no
+log e o seletor segue no resultado estruturado (seletores_obsoletos) para ser
+revisado no fluxo. O arquivo só é regravado quando algo muda.
+
+Relatório: python rpa_seletores.py [sistema]
+"""
+
+import glob
+import os
+import sys
+
+from rpa_cache import RPA_CACHE_DIR, CacheRPA
+
+# Espera total pelo grupo (todas as alternativas juntas); o padrão é o do Playwright
+RPA_SELETOR_TIMEOUT = int(os.getenv('RPA_SELETOR_TIMEOUT', 30000))
+RPA_SELETOR_FALHAS = int(os.getenv('RPA_SELETOR_FALHAS', 3))
+
+_SUFIXO = '_seletores'
+
+
+class SeletoresAprendidos(CacheRPA):
+    """Grupo de seletores alternativos -> alternativa preferida e falhas seguidas de cada uma."""
+
+    def __init__(self, sistema, perfil=None):
+        super().__init__(f"{sistema}{_SUFIXO}")
+        self.sistema = sistema
+        self.perfil = perfil
+        self._dados = None
+
+    def _grupo(self, chave):
+        # Lido uma vez por execução; as alterações são gravadas com lock em definir()
+        if self._dados is None:
+            self._dados = self._ler()
+        item = self._dados.get(chave) or {}
+        return dict(item.get('valor') or {})
+
+    def ordenar(self, seletores, chave=None):
+        """Alternativas com a preferida (a última que correspondeu) primeiro."""
+        preferido = self._grupo(chave or _chave(seletores)).get('preferido')
+        if preferido not in seletores:
+            return list(seletores)
+        return [preferido] + [s for s in seletores if s != preferido]
+
+    def localizar(self, escopo, seletores, timeout=None, estado='visible', formatar=None, chave=None):
+        """Aguarda todas as alternativas em paralelo e retorna o locator da que correspondeu.
+
+        seletores podem ser modelos ({variaveis}); formatar os converte no seletor
+        real, e a preferência fica associada ao modelo.
+        """
+        if isinstance(seletores, str):
+            seletores = [seletores]
+        formatar = formatar or (lambda seletor: seletor)
+        timeout = timeout or RPA_SELETOR_TIMEOUT
+
+        if len(seletores) == 1:
+            locator = escopo.locator(formatar(seletores[0])).first
+            locator.wait_for(state=estado, timeout=timeout)
+            return locator
+
+        chave = chave or _chave(seletores)
+        ordem = self.ordenar(seletores, chave)
+        locators = {seletor: escopo.locator(formatar(seletor)).first for seletor in ordem}
+
+        combinado = locators[ordem[0]]
+        for seletor in ordem[1:]:
+            combinado = combinado.or_(locators[seletor])
+        combinado.first.wait_for(state=estado, timeout=timeout)
+
+        correspondentes = [s for s in ordem if _corresponde(locators[s], estado)]
+        self._registrar(chave, ordem, correspondentes)
+        if not correspondentes:
+            # Elemento sumiu entre a espera e a consulta: fica com o combinado
+            return combinado.first
+        return locators[correspondentes[0]]
+
+    def _registrar(self, chave, ordem, correspondentes):
+        grupo = self._grupo(chave)
+        falhas = dict(grupo.get('falhas') or {})
+        novos_obsoletos = []
+
+        for seletor in ordem:
+            if seletor in correspondentes:
+                falhas[seletor] = 0
+            elif seletor in falhas and falhas[seletor] < RPA_SELETOR_FALHAS:
+                # Só conta falhas de quem já correspondeu: as demais são de outras versões da tela
+                falhas[seletor] += 1
+                if falhas[seletor] == RPA_SELETOR_FALHAS:
+                    novos_obsoletos.append(seletor)
+
+        preferido = correspondentes[0] if correspondentes else grupo.get('preferido')
+        for seletor in novos_obsoletos:
+            print(f"[SELETOR] {self.sistema}: '{seletor}' não corresponde há {RPA_SELETOR_FALHAS} consultas "
+                  f"(usando '{preferido}')", flush=True)
+
+        obsoletos = [s for s in ordem if falhas.get(s, 0) >= RPA_SELETOR_FALHAS]
+        if obsoletos and self.perfil is not None:
+            atuais = self.perfil.detalhes.get('seletores_obsoletos', [])
+            self.perfil.anotar(seletores_obsoletos=atuais + [s for s in obsoletos if s not in atuais])
+
+        novo = {'preferido': preferido, 'falhas': falhas}
+        if novo != {'preferido': grupo.get('preferido'), 'falhas': grupo.get('falhas') or {}}:
+            self.definir(chave, novo)
+            self._dados[chave] = {'valor': novo}
+
+
+def _chave(seletores):
+    return ' || '.join(seletores)
+
+
+def _corresponde(locator, estado):
+    try:
+        if estado == 'visible':
+            return locator.is_visible()
+        if estado in ('hidden', 'detached'):
+            return not locator.is_visible()
+        return locator.count() > 0
+    except Exception:
+        return False
+
+
+def _imprimir_relatorio(sistema):
+    aprendidos = SeletoresAprendidos(sistema)
+    grupos = aprendidos._ler()
+    print(f"{sistema}: {len(grupos)} grupo(s) de seletores")
+    for item in grupos.values():
+        grupo = item.get('valor') or {}
+        print(f"  preferido: {grupo.get('preferido')}")
+        for seletor, falhas in (grupo.get('falhas') or {}).items():
+            if seletor != grupo.get('preferido'):
+                marca = 'OBSOLETO' if falhas >= RPA_SELETOR_FALHAS else 'ok'
+                print(f"    {marca:<8} {seletor} ({falhas} falha(s) seguida(s))")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sistemas = sys.argv[1:]
+    else:
+        arquivos = glob.glob(os.path.join(RPA_CACHE_DIR, f"*{_SUFIXO}.json"))
+        sistemas = sorted(os.path.basename(a)[:-len(f"{_SUFIXO}.json")] for a in arquivos)
+    if not sistemas:
+        print(f"Nenhum seletor aprendido em {RPA_CACHE_DIR}/")
+    for sistema in sistemas:
+        _imprimir_relatorio(sistema)
@@ -1,114 +1,182 @@
 """RPA Tasy EMR - Inativa usuarios no Tasy"""
 
 import sys
-import time
 import os
 from dotenv import load_dotenv
 from playwright.sync_api import sync_playwright
 
+from aquecimento_rpa import AGUARDAR, CANCELADO, Cancelado, receber_argumentos
+from identificacao import chaves_busca, normalizar
+from resultado_rpa import emitir
+from rpa_cache import CacheRPA
+from rpa_confirmacao import confirmar
+from rpa_navegador import abrir_navegador
+from rpa_perfil import Perfilador
+from rpa_seletores import SeletoresAprendidos
+
 load_dotenv()
 
 TASY_URL = os.getenv('TASY_URL', 'https://tasy.unimedoestedopara.coop.br')
 TASY_USERNAME = os.getenv('TASY_USERNAME')
 TASY_PASSWORD = os.getenv('TASY_PASSWORD')
 
+# Rota direta da tela de usuários, capturada após a primeira navegação pelo menu
+TASY_ROTA_ESPERA = int(os.getenv('TASY_ROTA_ESPERA', 15000))
+CHAVE_ROTA_USUARIOS = 'rota_cadastro_usuarios'
+SELETOR_CAMPO_NOME = "input[name='NM_PESSOA'], input[placeholder='Nome']"
+
+cache_navegacao = CacheRPA('tasy_navegacao')
+
+# Endpoint de salvar não mapeado: depois da espera, o rádio Ativo ainda marcado reprova.
+# O Inativo marcado não confirma nada: ele muda na tela antes de salvar
+CONFIRMACAO = {'pausa': 3, 'espera': 'networkidle', 'falha': "input[type='radio'][value='A']:checked"}
+
 SUCESSO = 0
 ERRO = 1
 JA_INATIVO = 2
 NAO_ENCONTRADO = 3
+ATIVO = 4  # Somente no modo --status: usuário encontrado e ativo
+
+
+def _identificacao(argumentos):
+    """(nome_completo, nome_conta, nome_ad) a partir de [nome_completo, nome_conta, nome_ad] ou [email]."""
+    if len(argumentos) >= 2:
+        return argumentos[0], argumentos[1], argumentos[2] if len(argumentos) > 2 else ''
+    nome_conta = argumentos[0].split('@')[0]
+    return nome_conta.replace('.', ' ').title(), nome_conta, ''
+
+
+def _linha_do_usuario(page, partes):
+    """Linha da lista filtrada que contém todas as partes do nome (sem acentos)."""
+    for linha in page.locator("div.ui-widget-content.slick-row").all():
+        try:
+            texto_linha = normalizar(linha.inner_text())
+            if all(parte in texto_linha for parte in partes):
+                return linha, texto_linha
+        except Exception:
+            continue
+    return None, None
+
+
+def executar_tasy_automatico(nome_completo=None, nome_conta=None, somente_status=False, nome_ad=''):
+    perfil = Perfilador('tasy')
+    resultado = _executar_tasy(perfil, nome_completo, nome_conta, nome_ad, somente_status)
+    perfil.salvar(resultado)
+    emitir(resultado, perfil)
+    return resultado
 
 
-def executar_tasy_automatico(nome_completo, nome_conta):
+def _abrir_rota_usuarios(page, rota):
+    try:
+        page.goto(rota, timeout=30000)
+        campo_nome = page.locator(SELETOR_CAMPO_NOME).first
+        campo_nome.wait_for(state="visible", timeout=TASY_ROTA_ESPERA)
+        return campo_nome
+    except Exception:
+        return None
+
+
+def _navegar_ate_usuarios(page, perfil, seletores):
+    perfil.etapa('navegacao_modulo')
+    seletores.localizar(page, [
+        "span.w-feature-app__name:has-text('Administração do Sistema')",
+        "a:has-text('Administração do Sistema')",
+        "text=Administração do Sistema"
+    ]).click()
+    
+    perfil.dormir(3)
+    page.wait_for_load_state("networkidle", timeout=30000)
+    
+    perfil.dormir(2)
+    
+    perfil.etapa('abrir_usuarios')
+    try:
+        seletores.localizar(page, ["text=Cadastro de usuários", "span:has-text('Usuários')"]).click()
+    except Exception:
+        pass
+    
+    perfil.dormir(3)
+
+
+def _executar_tasy(perfil, nome_completo, nome_conta, nome_ad, somente_status):
     if not TASY_USERNAME or not TASY_PASSWORD:
+        perfil.anotar(erro="TASY_USERNAME/TASY_PASSWORD não configurados")
         return ERRO
     
-    nome_conta_comparacao = nome_conta.lower().replace('.', ' ')
-    
+    perfil.etapa('abrir_navegador')
     with sync_playwright() as p:
-        browser = p.chromium.launch(
-            channel="chrome",
-            headless=True
-        )
-        page = browser.new_page()
+        browser, page = abrir_navegador(p, 'tasy', headless=True)
+        page = perfil.envolver(page)
+        seletores = SeletoresAprendidos('tasy', perfil)
         
+        perfil.etapa('login')
         try:
             page.goto(f"{TASY_URL}/#/", timeout=60000)
             page.wait_for_load_state("domcontentloaded")
-            time.sleep(3)
+            perfil.dormir(3)
             
             page.fill("input#loginUsername", TASY_USERNAME)
-            time.sleep(0.5)
+            perfil.dormir(0.5)
             
             page.fill("input#loginPassword", TASY_PASSWORD)
-            time.sleep(0.5)
+            perfil.dormir(0.5)
             
             page.click("input.btn-green.w-login-button")
-            time.sleep(5)
+            perfil.dormir(5)
             
             page.wait_for_load_state("networkidle", timeout=30000)
-            time.sleep(3)
-            
-            try:
-                admin_modulo = page.locator("span.w-feature-app__name:has-text('Administração do Sistema')")
-                if admin_modulo.count() > 0:
-                    admin_modulo.first.click()
-                else:
-                    page.click("a:has-text('Administração do Sistema')")
-            except Exception:
-                page.locator("text=Administração do Sistema").first.click()
-            
-            time.sleep(3)
-            page.wait_for_load_state("networkidle", timeout=30000)
-            
-            time.sleep(2)
-            
-            try:
-                usuarios_link = page.locator("text=Cadastro de usuários").first
-                if usuarios_link.is_visible():
-                    usuarios_link.click()
-                else:
-                    page.locator("span:has-text('Usuários')").first.click()
-            except Exception:
-                pass
-            
-            time.sleep(3)
-            
-            campo_nome = page.locator("input[name='NM_PESSOA'], input[placeholder='Nome']").first
-            campo_nome.wait_for(state="visible", timeout=10000)
-            campo_nome.fill(nome_completo)
-            time.sleep(1)
-            
-            botao_filtrar = page.locator("button:has-text('Filtrar')").first
-            botao_filtrar.click()
-            time.sleep(3)
-            
-            page.wait_for_load_state("networkidle", timeout=15000)
-            time.sleep(2)
-            
-            lista_vazia = page.locator("text=Esta lista está vazia").count()
-            if lista_vazia > 0:
-                return NAO_ENCONTRADO
-            
-            linhas = page.locator("div.ui-widget-content.slick-row").all()
-            
-            usuario_encontrado = False
+            perfil.dormir(3)
+            
+            campo_nome = None
+            rota_salva = cache_navegacao.obter(CHAVE_ROTA_USUARIOS)
+            
+            if rota_salva:
+                perfil.etapa('navegacao_direta')
+                campo_nome = _abrir_rota_usuarios(page, rota_salva)
+                if campo_nome is None:
+                    cache_navegacao.remover(CHAVE_ROTA_USUARIOS)
+            
+            if campo_nome is None:
+                _navegar_ate_usuarios(page, perfil, seletores)
+                
+                campo_nome = page.locator(SELETOR_CAMPO_NOME).first
+                campo_nome.wait_for(state="visible", timeout=10000)
+                
+                if page.url.rstrip('/') != f"{TASY_URL}/#":
+                    cache_navegacao.definir(CHAVE_ROTA_USUARIOS, page.url)
+            
+            # RPA aquecido: estaciona na tela de usuários até o servidor entregar o colaborador
+            if nome_conta is None:
+                nome_completo, nome_conta, nome_ad = _identificacao(receber_argumentos(perfil))
+            partes = normalizar(nome_conta.replace('.', ' ')).split() or normalizar(nome_completo).split()
+            
+            # Nome da Solides, depois o do AD; cada um também sem acentos
             linha_usuario = None
-            
-            for linha in linhas:
-                try:
-                    texto_linha = linha.inner_text().lower()
-                    nome_partes = nome_conta_comparacao.split()
-                    
-                    if all(parte in texto_linha for parte in nome_partes):
-                        usuario_encontrado = True
-                        linha_usuario = linha
-                        break
-                except Exception:
+            for filtro in chaves_busca(nome_completo, nome_ad):
+                perfil.etapa('filtro')
+                campo_nome.fill(filtro)
+                perfil.dormir(1)
+                
+                botao_filtrar = page.locator("button:has-text('Filtrar')").first
+                botao_filtrar.click()
+                perfil.dormir(3)
+                
+                page.wait_for_load_state("networkidle", timeout=15000)
+                perfil.dormir(2)
+                
+                perfil.etapa('varredura')
+                if page.locator("text=Esta lista está vazia").count() > 0:
                     continue
+                
+                linha_usuario, texto_linha = _linha_do_usuario(page, partes)
+                if linha_usuario is not None:
+                    perfil.anotar(conta=texto_linha)
+                    break
             
-            if not usuario_encontrado:
+            if linha_usuario is None:
                 return NAO_ENCONTRADO
             
+            perfil.etapa('abrir_cadastro')
             try:
                 checkbox = linha_usuario.locator("input[type='checkbox'], label.wcheckbox-inputlabel").first
                 if checkbox.count() > 0:
@@ -118,21 +186,19 @@ def executar_tasy_automatico(nome_completo, nome_conta):
             except Exception:
                 linha_usuario.click()
             
-            time.sleep(1)
+            perfil.dormir(1)
             
-            try:
-                botao_ver = page.locator("span.handlebar-button-label:has-text('Ver')").first
-                botao_ver.click()
-            except Exception:
-                try:
-                    page.locator("button:has-text('Ver')").first.click()
-                except Exception:
-                    page.locator(".handlebar-button:has-text('Ver'), .ng-scope.handlebar-button:has-text('Ver')").first.click()
+            seletores.localizar(page, [
+                "span.handlebar-button-label:has-text('Ver')",
+                "button:has-text('Ver')",
+                ".handlebar-button:has-text('Ver'), .ng-scope.handlebar-button:has-text('Ver')"
+            ]).click()
             
-            time.sleep(3)
+            perfil.dormir(3)
             
             page.wait_for_load_state("networkidle", timeout=15000)
             
+            perfil.etapa('status')
             radio_ativo = page.locator("input[type='radio'][value='A'], label:has-text('Ativo') input[type='radio']").first
             radio_inativo = page.locator("input[type='radio'][value='I'], label:has-text('Inativo') input[type='radio']").first
             
@@ -143,7 +209,7 @@ def executar_tasy_automatico(nome_completo, nome_conta):
                 elif radio_inativo.is_checked():
                     esta_ativo = False
                     page.locator("span:has-text('Cancelar'), button:has-text('Cancelar')").first.click()
-                    time.sleep(2)
+                    perfil.dormir(2)
                     return JA_INATIVO
             except Exception:
                 esta_ativo = True
@@ -153,41 +219,42 @@ def executar_tasy_automatico(nome_completo, nome_conta):
                     inativo_selecionado = page.locator("label:has-text('Inativo').selected, input[type='radio']:checked + label:has-text('Inativo')").count()
                     if inativo_selecionado > 0:
                         page.locator("span:has-text('Cancelar'), button:has-text('Cancelar')").first.click()
-                        time.sleep(2)
+                        perfil.dormir(2)
                         return JA_INATIVO
                 except Exception:
                     pass
             
-            try:
-                label_inativo = page.locator("label:has-text('Inativo')").first
-                label_inativo.click()
-            except Exception:
-                try:
-                    radio_inativo.click()
-                except Exception:
-                    page.click("text=Inativo")
+            if somente_status:
+                return ATIVO if esta_ativo else ERRO
             
-            time.sleep(1)
+            perfil.etapa('inativar')
+            seletores.localizar(page, [
+                "label:has-text('Inativo')",
+                "input[type='radio'][value='I'], label:has-text('Inativo') input[type='radio']",
+                "text=Inativo"
+            ]).click()
             
-            try:
-                botao_salvar = page.locator("span.wbutton-text:has-text('Salvar')").first
-                botao_salvar.click()
-            except Exception:
-                try:
-                    page.locator("div.wbutton-container.btn-blue:has-text('Salvar')").first.click()
-                except Exception:
-                    page.locator("button:has-text('Salvar')").first.click()
+            perfil.dormir(1)
             
-            time.sleep(3)
-            
-            page.wait_for_load_state("networkidle", timeout=15000)
+            perfil.etapa('salvar')
+            salvar = seletores.localizar(page, [
+                "span.wbutton-text:has-text('Salvar')",
+                "div.wbutton-container.btn-blue:has-text('Salvar')",
+                "button:has-text('Salvar')"
+            ])
+            if not confirmar(page, perfil, salvar.click, CONFIRMACAO):
+                return ERRO
             
             return SUCESSO
             
-        except Exception:
+        except Cancelado:
+            return CANCELADO
+        except Exception as e:
+            perfil.anotar(erro=e)
             return ERRO
         finally:
-            time.sleep(2)
+            perfil.etapa('encerramento')
+            perfil.dormir(2)
             try:
                 browser.close()
             except Exception:
@@ -195,17 +262,19 @@ def executar_tasy_automatico(nome_completo, nome_conta):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) >= 3:
-        nome_completo = sys.argv[1]
-        nome_conta = sys.argv[2]
-    elif len(sys.argv) == 2:
-        email = sys.argv[1]
-        nome_conta = email.split('@')[0]
-        nome_completo = nome_conta.replace('.', ' ').title()
+    somente_status = '--status' in sys.argv
+    argumentos = [a for a in sys.argv[1:] if a not in ('--status', AGUARDAR)]
+    
+    if argumentos:
+        nome_completo, nome_conta, nome_ad = _identificacao(argumentos)
+    elif AGUARDAR in sys.argv:
+        nome_completo = nome_conta = None
+        nome_ad = ''
     else:
-        print("USO: python rpa_tasy.py <nome_completo> <nome_conta>")
-        print("  ou: python rpa_tasy.py <email>")
+        print("USO: python rpa_tasy.py <nome_completo> <nome_conta> [nome_ad] [--status]")
+        print("  ou: python rpa_tasy.py <email> [--status]")
+        print("  ou: python rpa_tasy.py --aguardar")
         sys.exit(1)
     
-    resultado = executar_tasy_automatico(nome_completo, nome_conta)
+    resultado = executar_tasy_automatico(nome_completo, nome_conta, somente_status, nome_ad)
     sys.exit(resultado)
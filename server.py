@@ -8,25 +8,48 @@ Autor: Marcos Vinicius Viana Lima
 Versão: 2.4
 """
 
+import contextvars
 import json
 import logging
 import os
 import re
+import shlex
 import smtplib
+import sqlite3
 import subprocess
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from ldap3 import ALL, Connection, MODIFY_REPLACE, Server
+from ldap3 import ALL, ASYNC, Connection, MODIFY_REPLACE, Server, SYNC
+
+import rpa_navegador
+from admissao import AdmissaoMemoria
+from aquecimento_rpa import RPA_AQUECIMENTO, AquecimentoRPA
+from cache_ad import CacheTTL
+from duplicatas import IndiceDuplicatas, RegistroDuplicatasSQLite, chave_payload
+from eventos import BarramentoEventos
+from fila_rpa import FilaArrendamentos, TrabalhadorRPA
+from historico import PAGINA_PADRAO, HistoricoDesligamentos
+from identificacao import argumentos_sistema, montar_identificacao
+from limites_rpa import LimitesSistemas
+from pipeline import Faixa
+from processos_rpa import coletor_orfaos, iniciar_processo
+from rastreio import ativar, exportador as exportador_spans, iniciar_span, span
+from registro_log import (
+    configurar_logging, contexto_log, job_id_atual, novo_job_id, resumir_payload, variaveis_contexto
+)
+from resultado_rpa import CapturaSaida, ExecucaoRPA
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
+configurar_logging()
 logger = logging.getLogger(__name__)
 
 AD_URL = os.getenv('AD_URL')
@@ -34,6 +57,11 @@ AD_USER = os.getenv('AD_USER')
 AD_PASS = os.getenv('AD_PASS')
 BASE_DN = os.getenv('BASE_DN')
 
+cache_consultas_ad = CacheTTL(
+    tamanho_maximo=int(os.getenv('AD_CACHE_TAMANHO', 1000)),
+    ttl=int(os.getenv('AD_CACHE_TTL', 300))
+)
+
 EMAIL_CONFIG = {
     'smtp_server': os.getenv('EMAIL_SMTP_SERVER', 'smtp.gmail.com'),
     'smtp_port': int(os.getenv('EMAIL_SMTP_PORT', 587)),
@@ -44,9 +72,105 @@ EMAIL_CONFIG = {
 WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
 TI_EMAILS = os.getenv('TI_EMAILS', '').split(',')
 
-cpfs_processados = {}
 TEMPO_BLOQUEIO_DUPLICATA = 300
 
+DUPLICATAS_BACKEND = os.getenv('DUPLICATAS_BACKEND', 'memoria')
+DUPLICATAS_MAXIMO = int(os.getenv('DUPLICATAS_MAXIMO', 100000))
+DUPLICATAS_CHAVE_PAYLOAD = os.getenv('DUPLICATAS_CHAVE_PAYLOAD', '').lower() in ('1', 'true')
+DUPLICATAS_TTL_PAYLOAD = int(os.getenv('DUPLICATAS_TTL_PAYLOAD', 86400))
+
+if DUPLICATAS_BACKEND == 'sqlite':
+    # Compartilhado entre workers do gunicorn
+    registro_duplicatas = RegistroDuplicatasSQLite(
+        os.getenv('DUPLICATAS_DB', 'dados/duplicatas.db'),
+        TEMPO_BLOQUEIO_DUPLICATA
+    )
+else:
+    registro_duplicatas = IndiceDuplicatas(
+        TEMPO_BLOQUEIO_DUPLICATA,
+        maximo=DUPLICATAS_MAXIMO,
+        arquivo_snapshot=os.getenv('DUPLICATAS_SNAPSHOT', 'dados/duplicatas.json')
+    )
+
+# Jobs de demissão em andamento neste processo (drenados no encerramento)
+jobs_em_andamento = {}
+_condicao_jobs = threading.Condition()
+servidor_encerrando = threading.Event()
+
+# Eventos de progresso dos jobs (/jobs e /jobs/<id>/events)
+eventos_jobs = BarramentoEventos(
+    maximo_por_job=int(os.getenv('EVENTOS_MAXIMO_POR_JOB', 200)),
+    maximo_jobs=int(os.getenv('EVENTOS_MAXIMO_JOBS', 500))
+)
+EVENTOS_SSE_HEARTBEAT = int(os.getenv('EVENTOS_SSE_HEARTBEAT', 15))
+EVENTOS_SSE_DURACAO_MAXIMA = int(os.getenv('EVENTOS_SSE_DURACAO_MAXIMA', 900))
+# Intervalo de consulta ao histórico no stream de um job que está em outro worker
+EVENTOS_SSE_SONDAGEM = float(os.getenv('EVENTOS_SSE_SONDAGEM', 2))
+
+# Histórico dos desligamentos (/historico), compartilhado entre workers
+historico = HistoricoDesligamentos()
+
+# Faixas do pipeline: AD (rápida, prioritária) e RPAs (lenta, concorrência limitada)
+PIPELINE_TRABALHADORES_AD = int(os.getenv('PIPELINE_TRABALHADORES_AD', 2))
+PIPELINE_TRABALHADORES_RPA = int(os.getenv('PIPELINE_TRABALHADORES_RPA', 2))
+PIPELINE_BACKLOG_MAXIMO = int(os.getenv('PIPELINE_BACKLOG_MAXIMO', 50))
+PIPELINE_RETRY_AFTER = int(os.getenv('PIPELINE_RETRY_AFTER', 120))
+
+# Admissão dos RPAs por memória: cada Chrome ocupa centenas de MB. O orçamento é do host:
+# as reservas dos workers do gunicorn e dos trabalhadores da fila ficam em RPA_ADMISSAO_DB
+admissao_rpa = AdmissaoMemoria(
+    orcamento_mb=int(os.getenv('RPA_MEMORIA_ORCAMENTO_MB', 0)),
+    margem_mb=int(os.getenv('RPA_MEMORIA_MARGEM_MB', 512)),
+    padrao_mb=int(os.getenv('RPA_MEMORIA_PADRAO_MB', 400)),
+    maximo_simultaneos=int(os.getenv('RPA_MAXIMO_SIMULTANEOS', 0)),
+    intervalo_amostragem=float(os.getenv('RPA_MEMORIA_AMOSTRAGEM', 2)),
+    caminho=os.getenv('RPA_ADMISSAO_DB', 'dados/admissao_rpa.db') or None
+)
+
+# Sessões simultâneas e logins por sistema (SISTEMAS_CONFIG['limites']), entre workers e hosts
+limites_rpa = LimitesSistemas(os.getenv('RPA_LIMITES_DB', 'dados/limites_rpa.db'))
+
+# RPAs aquecidos (login feito) enquanto o AD é processado; recebem o usuário quando a faixa RPA
+# assume o job. Cada job aquecido ocupa uma vaga de PIPELINE_TRABALHADORES_RPA até entrar na faixa
+aquecimento_rpa = AquecimentoRPA(admissao_rpa, limites_rpa)
+_lock_aquecimento = threading.Lock()
+_vagas_aquecimento = {'jobs_aquecendo': 0, 'sem_vaga_faixa': 0}
+
+# Fila distribuída: os RPAs dos desligamentos rodam em trabalhadores de um ou mais hosts
+RPA_DISTRIBUIDO = os.getenv('RPA_DISTRIBUIDO', '').lower() in ('1', 'true')
+RPA_DISTRIBUIDO_TRABALHADORES_LOCAIS = int(os.getenv('RPA_DISTRIBUIDO_TRABALHADORES_LOCAIS', 1))
+RPA_DISTRIBUIDO_ESPERA_MAXIMA = int(os.getenv('RPA_DISTRIBUIDO_ESPERA_MAXIMA', 3600))
+
+if RPA_DISTRIBUIDO:
+    fila_rpa = FilaArrendamentos()
+    trabalhador_rpa_local = TrabalhadorRPA(
+        fila_rpa,
+        admissao=admissao_rpa,
+        limites=limites_rpa,
+        ao_aguardar=lambda *espera: _publicar_espera_rpa(*espera)
+    )
+else:
+    fila_rpa = None
+    trabalhador_rpa_local = None
+
+# Limita consultas simultâneas ao AD para não ocupar todas as threads do worker
+AD_CONSULTA_MAX_CONCORRENTES = int(os.getenv('AD_CONSULTA_MAX_CONCORRENTES', 4))
+AD_CONSULTA_ESPERA = float(os.getenv('AD_CONSULTA_ESPERA', 2))
+_semaforo_consulta_ad = threading.BoundedSemaphore(AD_CONSULTA_MAX_CONCORRENTES)
+
+# Desativação em lote no AD (/ad/desativar-lote)
+AD_LOTE_MAXIMO = int(os.getenv('AD_LOTE_MAXIMO', 500))
+AD_LOTE_FILTRO_TAMANHO = int(os.getenv('AD_LOTE_FILTRO_TAMANHO', 50))
+
+# Prazo total da auditoria de acessos (/auditoria/<cpf>)
+AUDITORIA_PRAZO = int(os.getenv('AUDITORIA_PRAZO', 90))
+
+# userAccountControl: bit ACCOUNTDISABLE
+UAC_CONTA_DESATIVADA = 0x2
+
+# Códigos de saída dos RPAs no modo --status
+RPA_CODIGOS_STATUS = {4: 'ativo', 2: 'inativo', 3: 'nao_encontrado'}
+
 STATUS_NAO_EXECUTADO = "Não executado"
 STATUS_DESATIVADO = "Desativado"
 STATUS_BLOQUEADO = "Bloqueado"
@@ -54,62 +178,81 @@ STATUS_JA_INATIVO = "Já estava inativo"
 STATUS_JA_BLOQUEADO = "Já estava bloqueado"
 STATUS_SEM_ACESSO = "Não possui acesso"
 
+# 'argumentos': campos da identificação (identificacao.py) passados ao script, o primeiro obrigatório
 SISTEMAS_CONFIG = {
     'crm_jmj': {
         'ativo': True,
         'script': 'rpa_crm.py',
         'timeout': 300,
         'nome': 'CRM JMJ',
-        'requer_ad': True  # Precisa do email do AD
+        'requer_ad': True,  # Precisa do email do AD
+        'argumentos': ['email'],
+        # Sem aquecimento: a sessão única ficaria presa até a faixa RPA assumir o job
+        # Uma sessão por conta admin: logins simultâneos derrubam um ao outro
+        'limites': {'sessoes_simultaneas': 1, 'logins_por_minuto': 6, 'rajada_logins': 2, 'conta_env': 'CRM_USERNAME'}
     },
     'saw': {
         'ativo': True,
         'script': 'rpa_saw.py',
         'timeout': 300,
         'nome': 'SAW',
-        'requer_ad': True  # Precisa do email do AD
+        'requer_ad': True,  # Precisa do email do AD
+        'argumentos': ['email'],
+        'aquecimento': True  # Login enquanto o AD é processado (aquecimento_rpa)
     },
     'giu': {
         'ativo': True,
         'script': 'rpa_giu.py',
         'timeout': 300,
         'nome': 'GIU Unimed',
-        'requer_ad': False  # Usa somente CPF
+        'requer_ad': False,  # Usa somente CPF
+        'argumentos': ['cpf'],
+        'aquecimento': True
     },
     'ged': {
         'ativo': True,
         'script': 'rpa_ged.py',
         'timeout': 300,
         'nome': 'GED Bye Bye Paper',
-        'requer_ad': True  # Precisa do email do AD
+        'requer_ad': True,  # Precisa do email do AD
+        'argumentos': ['email', 'nome', 'primeiro_nome', 'sobrenome'],
+        'aquecimento': True
     },
     'sso_email': {
         'ativo': False,
         'script': 'rpa_sso_email.py',
         'timeout': 300,
         'nome': 'SSO Email Unimed',
-        'requer_ad': True  # Precisa do email do AD
+        'requer_ad': True,  # Precisa do email do AD
+        'argumentos': ['email']
     },
     'nextqs': {
         'ativo': False,
         'script': 'rpa_nextqs.py',
         'timeout': 300,
         'nome': 'NextQS Manager',
-        'requer_ad': True  # Precisa do email do AD
+        'requer_ad': True,  # Precisa do email do AD
+        'argumentos': ['email']
     },
     'bplus': {
         'ativo': True,
         'script': 'rpa_bplus.py',
         'timeout': 300,
         'nome': 'B+ Reembolso',
-        'requer_ad': True  # Precisa do email do AD
+        'requer_ad': True,  # Precisa do email do AD
+        'argumentos': ['email', 'login'],
+        'aquecimento': True
     },
     'tasy': {
         'ativo': True,
         'script': 'rpa_tasy.py',
         'timeout': 300,
         'nome': 'Tasy EMR',
-        'requer_ad': True  # Precisa do nome/email do AD
+        'requer_ad': True,  # Precisa do nome/email do AD
+        'argumentos': ['nome', 'conta_email', 'nome_ad'],
+        # Sem aquecimento, como o CRM: a sessão única ficaria presa até a faixa RPA assumir o job
+        # Uma sessão por conta admin e logins em sequência bloqueados pelo Tasy
+        'limites': {'sessoes_simultaneas': 1, 'logins_por_minuto': 4, 'rajada_logins': 1, 'conta_env': 'TASY_USERNAME'}
     }
 }
 
@@ -158,8 +301,8 @@ def obter_status_formatado(sistema, usar_bloqueado=False):
     return STATUS_NAO_EXECUTADO
 
 
-def executar_sistema_rpa(sistema_id, email_usuario, cpf_usuario=None, nome_completo=None):
-    """Executa o script RPA de um sistema específico."""
+def executar_sistema_rpa(sistema_id, identificacao):
+    """Executa o script RPA de um sistema específico com a identificação do colaborador."""
     config = SISTEMAS_CONFIG.get(sistema_id)
     
     if not config or not config['ativo']:
@@ -169,20 +312,67 @@ def executar_sistema_rpa(sistema_id, email_usuario, cpf_usuario=None, nome_compl
             'motivo': f'Sistema {sistema_id} não configurado ou inativo'
         }
     
+    job_id = job_id_atual.get()
+    eventos_jobs.publicar(job_id, 'rpa_iniciado', sistema=sistema_id, nome=config['nome'])
+    inicio = time.monotonic()
+    
+    with contexto_log(sistema=sistema_id), span('rpa', sistema=sistema_id) as rastro:
+        resultado = _executar_script_rpa(sistema_id, config, identificacao)
+        rastro.definir(status=resultado['status'])
+        if resultado['status'] == 'erro':
+            rastro.falhar(resultado.get('erro', 'erro'))
+    
+    duracao = round(time.monotonic() - inicio, 2)
+    eventos_jobs.publicar(
+        job_id, 'rpa_concluido',
+        sistema=sistema_id,
+        nome=config['nome'],
+        status=resultado['status'],
+        duracao_segundos=duracao
+    )
+    if job_id:
+        historico.registrar_tentativa(job_id, sistema_id, identificacao['cpf'], resultado, duracao)
+    return resultado
+
+
+def _argumentos_rpa(sistema_id, identificacao):
+    """Argumentos do script do sistema (None se faltar a chave principal)."""
+    return argumentos_sistema(SISTEMAS_CONFIG[sistema_id]['argumentos'], identificacao)
+
+
+def _montar_comando_rpa(sistema_id, config, identificacao, somente_status=False):
+    """Monta a linha de comando do script RPA com as chaves de busca do sistema.
+    
+    Retorna None se a identificação não tiver a chave principal do sistema.
+    """
+    argumentos = _argumentos_rpa(sistema_id, identificacao)
+    if argumentos is None:
+        return None
+    
+    acao = "Consultando status" if somente_status else "Executando"
+    logger.info(f"[RPA] {acao} {config['nome']} para {config['argumentos'][0]}: {argumentos[0]}")
+    
+    cmd = f"python {config['script']} {' '.join(shlex.quote(argumento) for argumento in argumentos)}"
+    if somente_status:
+        cmd += ' --status'
+    return cmd
+
+
+def _executar_script_rpa(sistema_id, config, identificacao):
+    """Monta os parâmetros e executa o script RPA em um subprocesso."""
     script = config['script']
     timeout = config['timeout']
     nome = config['nome']
     
-    if sistema_id == 'giu' and cpf_usuario:
-        parametro = cpf_usuario
-        logger.info(f"[RPA] Executando {nome} para CPF: {cpf_usuario}")
-    elif sistema_id == 'tasy' and nome_completo:
-        nome_conta = email_usuario.split('@')[0] if email_usuario else ''
-        parametro = f'"{nome_completo}" {nome_conta}'
-        logger.info(f"[RPA] Executando {nome} para: {nome_completo} ({nome_conta})")
-    else:
-        parametro = email_usuario
-        logger.info(f"[RPA] Executando {nome} para email: {email_usuario}")
+    cmd = _montar_comando_rpa(sistema_id, config, identificacao)
+    
+    if cmd is None:
+        logger.error(f"[ERRO] {nome}: identificação sem {config['argumentos'][0]}")
+        return {
+            'status': 'erro',
+            'sistema': nome,
+            'erro': f"Identificação do usuário sem {config['argumentos'][0]}"
+        }
     
     if not os.path.exists(script):
         logger.error(f"[ERRO] Script {script} não encontrado")
@@ -193,17 +383,17 @@ def executar_sistema_rpa(sistema_id, email_usuario, cpf_usuario=None, nome_compl
         }
     
     try:
-        cmd = f'python {script} "{parametro}"'
-        process = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            cwd=os.getcwd(),
-            shell=True
-        )
-        
-        return _interpretar_resultado_rpa(process, nome)
+        sessao = _retirar_rpa_aquecido(sistema_id)
+        if sessao is not None and sessao.aproveitavel():
+            logger.info(f"[AQUECIMENTO] {nome} já iniciado durante o AD; aguardando o resultado")
+            execucao = sessao.aguardar(timeout)
+        elif RPA_DISTRIBUIDO:
+            execucao = _executar_rpa_distribuido(sistema_id, cmd, timeout)
+        else:
+            if sessao is not None:
+                sessao.descartar()
+            execucao = _executar_subprocesso_rpa(sistema_id, cmd, timeout)
+        return _interpretar_resultado_rpa(execucao, nome)
         
     except subprocess.TimeoutExpired:
         logger.error(f"[ERRO] Timeout no {nome}")
@@ -221,41 +411,261 @@ def executar_sistema_rpa(sistema_id, email_usuario, cpf_usuario=None, nome_compl
         }
 
 
-def _interpretar_resultado_rpa(process, nome):
-    """Interpreta o código de retorno do RPA."""
-    codigo = process.returncode
+def _executar_subprocesso_rpa(sistema_id, cmd, timeout, espera_admissao=None):
+    """Executa o comando do RPA dentro dos limites do sistema e da admissão por memória.
+    
+    O timeout vale a partir do início do script; a espera pelos limites e pela
+    admissão é limitada por espera_admissao (TimeoutError se expirar).
+    """
+    inicio = time.monotonic()
+    limites = SISTEMAS_CONFIG.get(sistema_id, {}).get('limites')
+    
+    with limites_rpa.adquirir(
+        sistema_id, limites, duracao_maxima=timeout + 60, timeout=espera_admissao,
+        ao_aguardar=lambda *espera: _publicar_espera_rpa(sistema_id, *espera)
+    ) as sessao, admissao_rpa.reservar(
+        sistema_id, timeout=None if espera_admissao is None else max(espera_admissao - (time.monotonic() - inicio), 0)
+    ) as reserva:
+        # O prazo da sessão conta a partir do início do script, não da espera por memória
+        sessao.estender(timeout + 60)
+        process = iniciar_processo(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=os.getcwd(),
+            env={**os.environ, **variaveis_contexto()},
+            shell=True
+        )
+        reserva.monitorar(process.pid)
+        
+        # stdout/stderr vão para buffers circulares; o resultado vem da linha estruturada
+        return CapturaSaida(process).aguardar(timeout)
+
+
+def _iniciar_aquecimento(job):
+    """Dispara o aquecimento em outra thread: a desativação no AD nunca espera pelos navegadores."""
+    job['aquecidas'] = {}
+    if not RPA_AQUECIMENTO or RPA_DISTRIBUIDO:
+        return None
+    
+    thread = threading.Thread(
+        target=contextvars.copy_context().run, args=(_aquecer_rpas, job),
+        name=f"aquecimento-{job['job_id']}", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _aquecer_rpas(job):
+    """Inicia os RPAs com --aguardar enquanto o AD é processado (login em paralelo ao AD)."""
+    if not _reservar_vaga_aquecimento(job):
+        return
+    
+    for sistema_id, config in SISTEMAS_CONFIG.items():
+        if not (config['ativo'] and config.get('aquecimento')) or not os.path.exists(config['script']):
+            continue
+        if (config.get('limites') or {}).get('sessoes_simultaneas'):
+            # A sessão estacionada prenderia o lock do sistema enquanto outros jobs da faixa esperam por ele
+            continue
+        try:
+            with contexto_log(sistema=sistema_id):
+                sessao = aquecimento_rpa.iniciar(
+                    sistema_id, config['script'], config.get('limites'), config['timeout']
+                )
+        except Exception as e:
+            logger.error(f"[AQUECIMENTO] Falha ao iniciar {config['nome']}: {str(e)}")
+            continue
+        if sessao is not None:
+            job['aquecidas'][sistema_id] = sessao
+    
+    if not job['aquecidas']:
+        _liberar_vaga_aquecimento(job)
+
+
+def _reservar_vaga_aquecimento(job):
+    """Reserva para o job uma vaga da faixa RPA; False se a faixa já estiver tomada.
+    
+    Jobs em execução, na fila da faixa e com sessões aquecidas somam no máximo
+    PIPELINE_TRABALHADORES_RPA: o aquecimento não abre navegadores além do limite da faixa.
+    """
+    with _lock_aquecimento:
+        ocupadas = faixa_rpa.em_execucao + faixa_rpa.profundidade() + _vagas_aquecimento['jobs_aquecendo']
+        if ocupadas >= PIPELINE_TRABALHADORES_RPA:
+            _vagas_aquecimento['sem_vaga_faixa'] += 1
+            return False
+        _vagas_aquecimento['jobs_aquecendo'] += 1
+        job['vaga_aquecimento'] = True
+        return True
+
+
+def _liberar_vaga_aquecimento(job):
+    """Devolve a vaga reservada pelo aquecimento (o job entrou na faixa RPA ou terminou)."""
+    if job.pop('vaga_aquecimento', False):
+        with _lock_aquecimento:
+            _vagas_aquecimento['jobs_aquecendo'] -= 1
+
+
+def _podar_rpas_aquecidos(job):
+    """Ao fim do AD, cancela as sessões aquecidas que não serão usadas pelo job."""
+    for sistema_id, sessao in list(job['aquecidas'].items()):
+        if not _argumentos_rpa_aquecido(job, sistema_id):
+            # Usuário fora do AD ou sem o dado que o sistema usa: o RPA não será executado assim
+            job['aquecidas'].pop(sistema_id)
+            sessao.cancelar()
+    
+    if not job['aquecidas']:
+        _liberar_vaga_aquecimento(job)
+
+
+def _entregar_rpas_aquecidos(job):
+    """Entrega o usuário aos RPAs aquecidos quando a faixa RPA assume o job.
+    
+    Até aqui as sessões só fizeram o login: nenhuma desativação acontece fora da faixa.
+    """
+    with _condicao_jobs:
+        sessoes = list(job.get('aquecidas', {}).items())
+    
+    for sistema_id, sessao in sessoes:
+        argumentos = _argumentos_rpa_aquecido(job, sistema_id)
+        if argumentos:
+            sessao.entregar(argumentos)
+
+
+def _argumentos_rpa_aquecido(job, sistema_id):
+    """Argumentos que o RPA aquecido receberá; None se o sistema não rodará para o job."""
+    if job['usuario_encontrado_ad'] or not SISTEMAS_CONFIG[sistema_id].get('requer_ad', True):
+        return _argumentos_rpa(sistema_id, job['identificacao'])
+    return None
+
+
+def _cancelar_rpas_aquecidos(job):
+    """Cancela as sessões aquecidas que não chegaram a ser usadas pelo job."""
+    with _condicao_jobs:
+        sessoes = list(job.get('aquecidas', {}).values())
+        job['aquecidas'] = {}
+    
+    for sessao in sessoes:
+        if sessao.entregue:
+            # Já recebeu o usuário: segue até o fim e libera os recursos sozinha
+            continue
+        sessao.cancelar()
+
+
+def _retirar_rpa_aquecido(sistema_id):
+    """Sessão aquecida do job atual para o sistema (None se não houver)."""
+    with _condicao_jobs:
+        job = jobs_em_andamento.get(job_id_atual.get())
+        if not job:
+            return None
+        return job.get('aquecidas', {}).pop(sistema_id, None)
+
+
+def _publicar_espera_rpa(sistema_id, posicao, motivo, esperou):
+    """Informa no progresso do job que o RPA aguarda a vez dentro dos limites do sistema."""
+    eventos_jobs.publicar(
+        job_id_atual.get(), 'rpa_aguardando',
+        sistema=sistema_id, posicao=posicao, motivo=motivo, espera_segundos=esperou
+    )
+
+
+def _executar_rpa_distribuido(sistema_id, cmd, timeout):
+    """Publica o RPA na fila distribuída e aguarda o resultado de um trabalhador.
+    
+    Levanta TimeoutExpired se nenhum trabalhador concluir dentro de
+    RPA_DISTRIBUIDO_ESPERA_MAXIMA (a unidade é cancelada).
+    """
+    job_id = job_id_atual.get() or novo_job_id()
+    
+    if RPA_DISTRIBUIDO_TRABALHADORES_LOCAIS:
+        trabalhador_rpa_local.iniciar(RPA_DISTRIBUIDO_TRABALHADORES_LOCAIS)
+    
+    fila_rpa.publicar(
+        job_id, sistema_id, cmd, timeout, SISTEMAS_CONFIG[sistema_id].get('limites'),
+        traceparent=variaveis_contexto().get('TRACEPARENT')
+    )
+    unidade = fila_rpa.aguardar(job_id, sistema_id, timeout=RPA_DISTRIBUIDO_ESPERA_MAXIMA)
+    
+    if unidade is None:
+        fila_rpa.cancelar(job_id, sistema_id)
+        raise subprocess.TimeoutExpired(cmd, RPA_DISTRIBUIDO_ESPERA_MAXIMA)
+    
+    if unidade['trabalhador']:
+        logger.info(f"[FILA] {sistema_id} executado por {unidade['trabalhador']} (tentativa {unidade['tentativas']})")
+    
+    resultado = json.loads(unidade['resultado']) if unidade['resultado'] else None
+    
+    if unidade['codigo'] is None:
+        # Timeout no trabalhador, arrendamentos esgotados ou cancelamento
+        erro = unidade['erro'] or f"Unidade {unidade['estado']} sem resultado"
+        return ExecucaoRPA(1, {**(resultado or {}), 'erro': erro}, unidade['stdout'], unidade['stderr'])
+    
+    return ExecucaoRPA(unidade['codigo'], resultado, unidade['stdout'], unidade['stderr'])
+
+
+def _publicar_rpas_distribuidos(sistemas, identificacao):
+    """Publica de uma vez as unidades do job, para que trabalhadores de vários hosts as executem em paralelo."""
+    job_id = job_id_atual.get()
+    if not RPA_DISTRIBUIDO or not job_id:
+        return
+    
+    for sistema_id in sistemas:
+        config = SISTEMAS_CONFIG[sistema_id]
+        cmd = _montar_comando_rpa(sistema_id, config, identificacao)
+        if cmd is None or not os.path.exists(config['script']):
+            continue
+        fila_rpa.publicar(
+            job_id, sistema_id, cmd, config['timeout'], config.get('limites'),
+            traceparent=variaveis_contexto().get('TRACEPARENT')
+        )
+
+
+def _interpretar_resultado_rpa(execucao, nome):
+    """Interpreta o código de retorno e o resultado estruturado do RPA.
+    
+    O log (final do stdout/stderr, limitado) só acompanha o resultado em caso de erro.
+    """
+    codigo = execucao.codigo
+    detalhes = execucao.detalhes()
     
     if codigo == 0:
         logger.info(f"[OK] {nome}: Desativado com sucesso!")
-        return {'status': 'sucesso', 'sistema': nome, 'log': process.stdout}
+        return {'status': 'sucesso', 'sistema': nome, **detalhes}
     
     elif codigo == 2:
         logger.info(f"[AVISO] {nome}: Já estava inativo/bloqueado")
-        return {'status': 'ja_inativo', 'sistema': nome, 'log': process.stdout}
+        return {'status': 'ja_inativo', 'sistema': nome, **detalhes}
     
     elif codigo == 3:
         logger.info(f"[INFO] {nome}: Usuário não possui acesso")
-        return {'status': 'nao_encontrado', 'sistema': nome, 'log': process.stdout}
+        return {'status': 'nao_encontrado', 'sistema': nome, **detalhes}
     
     else:
-        logger.error(f"[ERRO] Erro no {nome}: {process.stderr}")
+        erro = execucao.mensagem_erro()
+        logger.error(f"[ERRO] Erro no {nome}: {erro}")
         return {
             'status': 'erro',
             'sistema': nome,
-            'erro': process.stderr,
-            'log': process.stdout
+            'erro': erro,
+            'log': execucao.log_completo(),
+            **detalhes
         }
 
 
-def _criar_conexao_ad():
-    """Cria e retorna uma conexão com o Active Directory."""
+def _criar_conexao_ad(estrategia=SYNC):
+    """Cria e retorna uma conexão com o Active Directory.
+    
+    Com estrategia=ASYNC as operações retornam o id da mensagem e várias podem
+    ser enviadas antes de ler as respostas (usado na desativação em lote).
+    """
     server = Server(AD_URL, get_info=ALL, use_ssl=True)
     return Connection(
         server,
         user=AD_USER,
         password=AD_PASS,
         auto_bind=True,
-        authentication='SIMPLE'
+        authentication='SIMPLE',
+        client_strategy=estrategia
     )
 
 
@@ -263,14 +673,20 @@ def desativar_usuario_por_cpf(cpf):
     """Desativa um usuário no AD pelo CPF (employeeID)."""
     logger.info(f"[PROC] Iniciando desativação do usuário com CPF: {cpf}")
     
-    conn = _criar_conexao_ad()
+    with span('ad.conexao'):
+        conn = _criar_conexao_ad()
     logger.info("Conectado no AD para desativação")
     
     try:
         search_filter = f"(&(objectClass=user)(employeeID={cpf}))"
-        attributes = ['userAccountControl', 'sAMAccountName', 'employeeID', 'cn', 'displayName']
+        attributes = [
+            'userAccountControl', 'sAMAccountName', 'employeeID', 'cn', 'displayName',
+            'mail', 'userPrincipalName', 'givenName', 'sn'
+        ]
         
-        conn.search(BASE_DN, search_filter, attributes=attributes)
+        with span('ad.busca') as rastro:
+            conn.search(BASE_DN, search_filter, attributes=attributes)
+            rastro.definir(encontrados=len(conn.entries))
         
         if not conn.entries:
             raise ValueError(f"Usuário com CPF/EmployeeID {cpf} não encontrado no AD")
@@ -286,8 +702,11 @@ def desativar_usuario_por_cpf(cpf):
         user_dn = str(usuario.entry_dn)
         modificacao = {'userAccountControl': [(MODIFY_REPLACE, [514])]}
         
-        if not conn.modify(user_dn, modificacao):
-            raise RuntimeError(f"Erro ao desativar usuário: {conn.result}")
+        with span('ad.modificacao'):
+            if not conn.modify(user_dn, modificacao):
+                raise RuntimeError(f"Erro ao desativar usuário: {conn.result}")
+        
+        cache_consultas_ad.invalidar(_chave_cache_cpf(cpf), _chave_cache_login(usuario.sAMAccountName.value))
         
         logger.info(f"[OK] Usuário {usuario.sAMAccountName.value} (CPF: {cpf}) desativado com sucesso no AD")
         
@@ -296,6 +715,10 @@ def desativar_usuario_por_cpf(cpf):
             'login': usuario.sAMAccountName.value,
             'nome': nome_usuario,
             'employeeID': usuario.employeeID.value,
+            'email': _extrair_email(usuario),
+            'upn': usuario.userPrincipalName.value if usuario.userPrincipalName else None,
+            'primeiro_nome': usuario.givenName.value if usuario.givenName else None,
+            'sobrenome': usuario.sn.value if usuario.sn else None,
             'dn': user_dn,
             'status': 'desativado'
         }
@@ -304,8 +727,173 @@ def desativar_usuario_por_cpf(cpf):
         conn.unbind()
 
 
+def desativar_usuarios_em_lote(cpfs):
+    """Desativa vários usuários no AD pelo CPF usando uma única conexão.
+    
+    Os employeeIDs são resolvidos com buscas em blocos de filtros OR, e as
+    alterações de userAccountControl são enviadas em sequência antes de ler as
+    respostas. Contas já desativadas (bit 0x2) não são alteradas. Retorna um
+    resultado por CPF, na ordem recebida, incluindo inválidos e não encontrados.
+    """
+    ordem = []
+    resultados = {}
+    
+    for bruto in cpfs:
+        cpf = limpar_cpf(str(bruto)) if bruto is not None else None
+        if not cpf or len(cpf) != 11 or not cpf.isdigit():
+            chave = f"invalido:{bruto}"
+            resultados[chave] = {'cpf': bruto, 'status': 'invalido'}
+        else:
+            chave = cpf
+            resultados.setdefault(cpf, None)
+        if chave not in ordem:
+            ordem.append(chave)
+    
+    validos = [chave for chave in ordem if resultados[chave] is None]
+    logger.info(f"[PROC] Desativação em lote no AD: {len(validos)} CPF(s)")
+    
+    if validos:
+        conn = _criar_conexao_ad(ASYNC)
+        try:
+            encontrados = _buscar_usuarios_por_cpfs(conn, validos)
+            pendentes = []
+            
+            for cpf in validos:
+                usuario = encontrados.get(cpf)
+                if usuario is None:
+                    resultados[cpf] = {'cpf': cpf, 'status': 'nao_encontrado'}
+                    continue
+                
+                resultado = {
+                    'cpf': cpf,
+                    'login': usuario['login'],
+                    'nome': usuario['nome'],
+                    'email': usuario['email'],
+                    'dn': usuario['dn']
+                }
+                
+                if usuario['userAccountControl'] & UAC_CONTA_DESATIVADA:
+                    resultados[cpf] = {**resultado, 'status': 'ja_inativo'}
+                    continue
+                
+                # Mantém os demais bits (ex.: senha sem expiração) e liga ACCOUNTDISABLE
+                novo_uac = usuario['userAccountControl'] | UAC_CONTA_DESATIVADA
+                id_mensagem = conn.modify(usuario['dn'], {'userAccountControl': [(MODIFY_REPLACE, [novo_uac])]})
+                pendentes.append((id_mensagem, resultado))
+            
+            for id_mensagem, resultado in pendentes:
+                _, resposta = conn.get_response(id_mensagem)
+                cpf = resultado['cpf']
+                
+                if resposta['result'] == 0:
+                    resultados[cpf] = {**resultado, 'status': 'desativado'}
+                    cache_consultas_ad.invalidar(_chave_cache_cpf(cpf), _chave_cache_login(resultado['login']))
+                else:
+                    logger.error(f"[ERRO] Falha ao desativar CPF {cpf} no AD: {resposta['description']}")
+                    resultados[cpf] = {**resultado, 'status': 'erro', 'erro': resposta['description']}
+        finally:
+            conn.unbind()
+    
+    return [resultados[chave] for chave in ordem]
+
+
+def _buscar_usuarios_por_cpfs(conn, cpfs):
+    """Busca os usuários dos CPFs em blocos de filtros OR (conexão ASYNC).
+    
+    Todas as buscas são enviadas antes de ler as respostas.
+    Retorna {cpf: dados do usuário} apenas para os encontrados.
+    """
+    attributes = [
+        'userAccountControl', 'sAMAccountName', 'employeeID', 'cn', 'displayName',
+        'mail', 'userPrincipalName'
+    ]
+    
+    ids_mensagens = []
+    for inicio in range(0, len(cpfs), AD_LOTE_FILTRO_TAMANHO):
+        bloco = cpfs[inicio:inicio + AD_LOTE_FILTRO_TAMANHO]
+        filtro_ids = ''.join(f"(employeeID={cpf})" for cpf in bloco)
+        ids_mensagens.append(conn.search(BASE_DN, f"(&(objectClass=user)(|{filtro_ids}))", attributes=attributes))
+    
+    encontrados = {}
+    for id_mensagem in ids_mensagens:
+        entradas, resposta = conn.get_response(id_mensagem)
+        if resposta['result'] != 0:
+            raise RuntimeError(f"Erro na busca em lote no AD: {resposta['description']}")
+        
+        for entrada in entradas:
+            if entrada.get('type') != 'searchResEntry':
+                continue
+            
+            atributos = entrada['attributes']
+            cpf = str(_valor_atributo(atributos, 'employeeID'))
+            if cpf in encontrados:
+                continue
+            
+            login = _valor_atributo(atributos, 'sAMAccountName')
+            encontrados[cpf] = {
+                'dn': entrada['dn'],
+                'login': login,
+                'nome': _valor_atributo(atributos, 'displayName') or _valor_atributo(atributos, 'cn'),
+                'email': _escolher_email(
+                    _valor_atributo(atributos, 'mail'),
+                    _valor_atributo(atributos, 'userPrincipalName'),
+                    login
+                ),
+                'userAccountControl': int(_valor_atributo(atributos, 'userAccountControl') or 0)
+            }
+    
+    return encontrados
+
+
+def _valor_atributo(atributos, nome):
+    """Primeiro valor de um atributo de resposta LDAP (lista ou valor único)."""
+    valor = atributos.get(nome)
+    if isinstance(valor, list):
+        return valor[0] if valor else None
+    return valor
+
+
+def _chave_cache_cpf(cpf):
+    """Chave do cache AD para consultas por CPF."""
+    return ('cpf', cpf)
+
+
+def _chave_cache_login(login):
+    """Chave do cache AD para consultas por login (sAMAccountName)."""
+    return ('login', str(login).lower())
+
+
+def _extrair_email(usuario):
+    """Obtém o email de uma entrada do AD (mail, UPN ou login + domínio)."""
+    return _escolher_email(
+        usuario.mail.value if usuario.mail else None,
+        usuario.userPrincipalName.value if usuario.userPrincipalName else None,
+        usuario.sAMAccountName.value
+    )
+
+
+def _escolher_email(mail, upn, login):
+    """Email do usuário: mail, UPN ou login + domínio."""
+    if mail:
+        return str(mail)
+    if upn:
+        return str(upn)
+    return f"{login}@unimedoestedopara.coop.br"
+
+
 def consultar_email_por_cpf(cpf):
-    """Consulta o email de um usuário no AD pelo CPF."""
+    """Consulta o email de um usuário no AD pelo CPF (com cache TTL)."""
+    dados = cache_consultas_ad.obter_ou_carregar(_chave_cache_cpf(cpf), lambda: _buscar_email_por_cpf(cpf))
+    
+    if dados is None:
+        raise ValueError(f"Usuário com CPF {cpf} não encontrado")
+    
+    logger.info(f"[EMAIL] Email encontrado: {dados['email']}")
+    return dados['email']
+
+
+def _buscar_email_por_cpf(cpf):
+    """Busca no AD o email e o login de um usuário pelo CPF."""
     logger.info(f"[EMAIL] Consultando email no AD para CPF: {cpf}")
     
     conn = _criar_conexao_ad()
@@ -317,19 +905,14 @@ def consultar_email_por_cpf(cpf):
         conn.search(BASE_DN, search_filter, attributes=attributes)
         
         if not conn.entries:
-            raise ValueError(f"Usuário com CPF {cpf} não encontrado")
+            return None
         
         usuario = conn.entries[0]
         
-        if usuario.mail and usuario.mail.value:
-            email = str(usuario.mail.value)
-        elif usuario.userPrincipalName and usuario.userPrincipalName.value:
-            email = str(usuario.userPrincipalName.value)
-        else:
-            email = f"{usuario.sAMAccountName.value}@unimedoestedopara.coop.br"
-        
-        logger.info(f"[EMAIL] Email encontrado: {email}")
-        return email
+        return {
+            'email': _extrair_email(usuario),
+            'login': str(usuario.sAMAccountName.value)
+        }
         
     finally:
         conn.unbind()
@@ -639,66 +1222,195 @@ def _gerar_html_email_parcial(nome, cpf, dados, setor, cargo, resultado_sistemas
     """
 
 
-def processar_demissao_async(dados, cpf):
-    """Processa a demissão em background (thread separada)."""
-    try:
-        logger.info("🏢 PASSO 1: Desativando usuário no Active Directory...")
-        resultado_ad = None
-        usuario_encontrado_ad = True
+def _processar_etapa_ad(job):
+    """Faixa AD: desativa o usuário no AD e encaminha o job para a faixa de RPAs."""
+    with contexto_log(job_id=job['job_id']), ativar(job['span']), span('etapa.ad'):
+        cpf = job['cpf']
+        dados = job['dados']
+        job['etapa'] = 'ad'
+        aquecimento = _iniciar_aquecimento(job)
         
         try:
-            resultado_ad = desativar_usuario_por_cpf(cpf)
-            logger.info(f"[OK] Usuário desativado no AD: {resultado_ad}")
-        except ValueError as ad_error:
-            # Usuário não encontrado no AD
-            if "não encontrado no AD" in str(ad_error):
-                usuario_encontrado_ad = False
-                logger.warning("[AVISO] Usuário não encontrado no AD. Prosseguindo com sistemas que usam somente CPF...")
-                resultado_ad = {
-                    'cpf': cpf,
-                    'status': 'nao_encontrado',
-                    'erro': str(ad_error)
-                }
-            else:
-                raise ad_error
-        
-        nome_completo = dados.get('nome', '')
-        logger.info(f"[NOME] Nome completo: {nome_completo}")
-        
-        if usuario_encontrado_ad:
-            # Fluxo normal: usuário encontrado no AD
-            email_usuario = _obter_email_usuario(resultado_ad, dados, cpf)
-            logger.info(f"[EMAIL] Email capturado: {email_usuario}")
+            logger.info("🏢 PASSO 1: Desativando usuário no Active Directory...")
+            resultado_ad = None
+            usuario_encontrado_ad = True
             
-            logger.info("[RPA] PASSO 2: Desativando usuário nos sistemas externos...")
-            resultado_sistemas = _executar_rpas(email_usuario, cpf, nome_completo)
-            
-            logger.info("[EMAIL] PASSO 3: Enviando email de notificação...")
             try:
-                enviar_email_notificacao(dados, resultado_ad, resultado_sistemas)
-                logger.info("[OK] Email de notificação enviado com sucesso!")
-            except Exception as email_error:
-                logger.error(f"[ERRO] ERRO ao enviar email: {str(email_error)}")
-        else:
-            # Fluxo parcial: usuário NÃO encontrado no AD
-            # Executa apenas sistemas que não requerem AD (usam somente CPF)
-            logger.info("[RPA] PASSO 2: Executando APENAS sistemas que usam somente CPF...")
-            resultado_sistemas = _executar_rpas_somente_cpf(cpf, nome_completo)
+                resultado_ad = desativar_usuario_por_cpf(cpf)
+                logger.info(f"[OK] Usuário desativado no AD: {resultado_ad}")
+            except ValueError as ad_error:
+                # Usuário não encontrado no AD
+                if "não encontrado no AD" in str(ad_error):
+                    usuario_encontrado_ad = False
+                    logger.warning("[AVISO] Usuário não encontrado no AD. Prosseguindo com sistemas que usam somente CPF...")
+                    resultado_ad = {
+                        'cpf': cpf,
+                        'status': 'nao_encontrado',
+                        'erro': str(ad_error)
+                    }
+                else:
+                    raise ad_error
             
-            logger.info("[EMAIL] PASSO 3: Enviando email de notificação PARCIAL...")
-            try:
-                enviar_email_notificacao_parcial(dados, cpf, resultado_sistemas)
-                logger.info("[OK] Email de notificação parcial enviado com sucesso!")
-            except Exception as email_error:
-                logger.error(f"[ERRO] ERRO ao enviar email parcial: {str(email_error)}")
+            job['resultado_ad'] = resultado_ad
+            job['usuario_encontrado_ad'] = usuario_encontrado_ad
+            
+            if usuario_encontrado_ad:
+                job['email_usuario'] = _obter_email_usuario(resultado_ad, dados, cpf)
+                logger.info(f"[EMAIL] Email capturado: {job['email_usuario']}")
+            
+            # Chaves de busca dos RPAs, montadas uma vez a partir do AD e da Solides
+            job['identificacao'] = montar_identificacao(cpf, job.get('email_usuario'), resultado_ad, dados)
+            
+            # O AD já foi desativado: só o encaminhamento para a faixa RPA espera o aquecimento
+            if aquecimento:
+                aquecimento.join()
+            _podar_rpas_aquecidos(job)
+            eventos_jobs.publicar(job['job_id'], 'ad_concluido', status=resultado_ad['status'])
+            
+        except Exception as e:
+            logger.error(f"[ERRO] Erro no processamento async: {str(e)}")
+            eventos_jobs.publicar(job['job_id'], 'ad_concluido', status='erro', erro=str(e))
+            if aquecimento:
+                aquecimento.join()
+            _finalizar_job(job)
+            return
         
-        logger.info(f"[OK] Processamento completo para CPF: {cpf}")
+        job['etapa'] = 'fila_rpa'
+        faixa_rpa.enfileirar(job)
+        # Na fila da faixa o job já conta pela profundidade
+        _liberar_vaga_aquecimento(job)
+
+
+def _processar_etapa_rpa(job):
+    """Faixa RPA: executa os RPAs dos sistemas externos e envia o email de notificação."""
+    with contexto_log(job_id=job['job_id']), ativar(job['span']), span('etapa.rpa'):
+        cpf = job['cpf']
+        dados = job['dados']
+        resultado_ad = job['resultado_ad']
+        job['etapa'] = 'rpa'
+        _entregar_rpas_aquecidos(job)
         
-    except Exception as e:
-        logger.error(f"[ERRO] Erro no processamento async: {str(e)}")
-    finally:
-        if cpf in cpfs_processados:
-            cpfs_processados[cpf]['processando'] = False
+        try:
+            identificacao = job['identificacao']
+            logger.info(f"[NOME] Nome completo: {identificacao['nome']}")
+            
+            if job['usuario_encontrado_ad']:
+                # Fluxo normal: usuário encontrado no AD
+                logger.info("[RPA] PASSO 2: Desativando usuário nos sistemas externos...")
+                resultado_sistemas = _executar_rpas(identificacao)
+                
+                job['etapa'] = 'email'
+                logger.info("[EMAIL] PASSO 3: Enviando email de notificação...")
+                try:
+                    with span('smtp'):
+                        enviar_email_notificacao(dados, resultado_ad, resultado_sistemas)
+                    logger.info("[OK] Email de notificação enviado com sucesso!")
+                    job['email_enviado'] = True
+                    eventos_jobs.publicar(job['job_id'], 'email_enviado')
+                except Exception as email_error:
+                    job['email_enviado'] = False
+                    logger.error(f"[ERRO] ERRO ao enviar email: {str(email_error)}")
+                    eventos_jobs.publicar(job['job_id'], 'email_erro', erro=str(email_error))
+            else:
+                # Fluxo parcial: usuário NÃO encontrado no AD
+                # Executa apenas sistemas que não requerem AD (usam somente CPF)
+                logger.info("[RPA] PASSO 2: Executando APENAS sistemas que usam somente CPF...")
+                resultado_sistemas = _executar_rpas_somente_cpf(identificacao)
+                
+                job['etapa'] = 'email'
+                logger.info("[EMAIL] PASSO 3: Enviando email de notificação PARCIAL...")
+                try:
+                    with span('smtp', parcial=True):
+                        enviar_email_notificacao_parcial(dados, cpf, resultado_sistemas)
+                    logger.info("[OK] Email de notificação parcial enviado com sucesso!")
+                    job['email_enviado'] = True
+                    eventos_jobs.publicar(job['job_id'], 'email_enviado', parcial=True)
+                except Exception as email_error:
+                    job['email_enviado'] = False
+                    logger.error(f"[ERRO] ERRO ao enviar email parcial: {str(email_error)}")
+                    eventos_jobs.publicar(job['job_id'], 'email_erro', parcial=True, erro=str(email_error))
+            
+            job['status_geral'] = resultado_sistemas['status_geral']
+            logger.info(f"[OK] Processamento completo para CPF: {cpf}")
+            
+        except Exception as e:
+            logger.error(f"[ERRO] Erro no processamento async: {str(e)}")
+        finally:
+            _finalizar_job(job)
+
+
+faixa_ad = Faixa('ad', PIPELINE_TRABALHADORES_AD, _processar_etapa_ad)
+faixa_rpa = Faixa('rpa', PIPELINE_TRABALHADORES_RPA, _processar_etapa_rpa)
+
+
+def iniciar_job_demissao(dados, cpf, job_id, chaves_duplicata):
+    """Registra o job e o coloca na faixa do AD."""
+    job = {
+        'job_id': job_id,
+        'cpf': cpf,
+        'dados': dados,
+        'chaves_duplicata': chaves_duplicata,
+        'etapa': 'fila_ad',
+        'recebido_em': datetime.now().isoformat(),
+        # Span do desligamento inteiro: as faixas o ativam e os spans das etapas ficam abaixo dele
+        'span': iniciar_span('desligamento', job_id=job_id)
+    }
+    
+    with _condicao_jobs:
+        jobs_em_andamento[job_id] = job
+    
+    eventos_jobs.registrar_job(job_id, cpf=cpf, colaborador=dados.get('nome'), trace_id=job['span'].trace_id)
+    historico.iniciar_job(job_id, cpf, dados.get('nome'), job['recebido_em'])
+    faixa_ad.enfileirar(job)
+    return job
+
+
+def _finalizar_job(job):
+    """Libera o CPF no registro de duplicatas, grava o histórico e remove o job dos jobs em andamento."""
+    _cancelar_rpas_aquecidos(job)
+    _liberar_vaga_aquecimento(job)
+    registro_duplicatas.finalizar(job['chaves_duplicata'])
+    
+    status_geral = job.get('status_geral', 'erro')
+    duracao = round((datetime.now() - datetime.fromisoformat(job['recebido_em'])).total_seconds(), 2)
+    eventos_jobs.publicar(job['job_id'], 'concluido', status_geral=status_geral, duracao_segundos=duracao)
+    job['span'].definir(status_geral=status_geral)
+    if status_geral == 'erro':
+        job['span'].falhar('Desligamento concluído com erro')
+    job['span'].encerrar()
+    historico.finalizar_job(
+        job['job_id'], status_geral, duracao,
+        status_ad=(job.get('resultado_ad') or {}).get('status', 'erro'),
+        email=job.get('email_usuario'),
+        email_enviado=job.get('email_enviado')
+    )
+    
+    with _condicao_jobs:
+        jobs_em_andamento.pop(job['job_id'], None)
+        _condicao_jobs.notify_all()
+
+
+def backlog_pipeline():
+    """Quantidade de jobs aguardando nas filas das faixas AD e RPA."""
+    return faixa_ad.profundidade() + faixa_rpa.profundidade()
+
+
+def aguardar_jobs_em_andamento(timeout=None):
+    """Recusa novos webhooks e aguarda os jobs em andamento terminarem.
+    
+    Retorna a quantidade de jobs que ainda estavam em execução ao fim do prazo.
+    """
+    servidor_encerrando.set()
+    
+    with _condicao_jobs:
+        logger.info(f"[ENCERRANDO] Aguardando {len(jobs_em_andamento)} job(s) em andamento...")
+        _condicao_jobs.wait_for(lambda: not jobs_em_andamento, timeout)
+        restantes = len(jobs_em_andamento)
+    
+    if restantes:
+        logger.warning(f"[AVISO] {restantes} job(s) ainda em execução ao encerrar")
+    
+    return restantes
 
 
 def _obter_email_usuario(resultado_ad, dados, cpf):
@@ -707,14 +1419,15 @@ def _obter_email_usuario(resultado_ad, dados, cpf):
     
     if not email:
         try:
-            email = consultar_email_por_cpf(cpf)
+            with span('ad.email'):
+                email = consultar_email_por_cpf(cpf)
         except Exception:
             email = dados.get('email')
     
     return email
 
 
-def _executar_rpas(email_usuario, cpf, nome_completo=None):
+def _executar_rpas(identificacao):
     """Executa todos os RPAs ativos e retorna o resultado consolidado."""
     resultado = {
         'total_sistemas': 0,
@@ -724,6 +1437,10 @@ def _executar_rpas(email_usuario, cpf, nome_completo=None):
         'status_geral': 'sucesso'
     }
     
+    _publicar_rpas_distribuidos(
+        [s for s, c in SISTEMAS_CONFIG.items() if c['ativo']], identificacao
+    )
+    
     for sistema_id, config in SISTEMAS_CONFIG.items():
         if not config['ativo']:
             continue
@@ -731,7 +1448,7 @@ def _executar_rpas(email_usuario, cpf, nome_completo=None):
         resultado['total_sistemas'] += 1
         logger.info(f"[PROC] Processando {config['nome']}...")
         
-        resultado_rpa = executar_sistema_rpa(sistema_id, email_usuario, cpf, nome_completo)
+        resultado_rpa = executar_sistema_rpa(sistema_id, identificacao)
         resultado['detalhes'].append(resultado_rpa)
         
         if resultado_rpa['status'] == 'sucesso':
@@ -747,7 +1464,7 @@ def _executar_rpas(email_usuario, cpf, nome_completo=None):
     return resultado
 
 
-def _executar_rpas_somente_cpf(cpf, nome_completo=None):
+def _executar_rpas_somente_cpf(identificacao):
     """Executa apenas os RPAs que não requerem AD (usam somente CPF)."""
     resultado = {
         'total_sistemas': 0,
@@ -759,6 +1476,11 @@ def _executar_rpas_somente_cpf(cpf, nome_completo=None):
         'status_geral': 'parcial'  # Sempre parcial pois não processou todos
     }
     
+    _publicar_rpas_distribuidos(
+        [s for s, c in SISTEMAS_CONFIG.items() if c['ativo'] and not c.get('requer_ad', True)],
+        identificacao
+    )
+    
     for sistema_id, config in SISTEMAS_CONFIG.items():
         if not config['ativo']:
             continue
@@ -773,13 +1495,20 @@ def _executar_rpas_somente_cpf(cpf, nome_completo=None):
                 'motivo': 'Requer dados do Active Directory'
             })
             logger.info(f"[SKIP] {config['nome']} requer AD - pulando...")
+            eventos_jobs.publicar(
+                job_id_atual.get(), 'rpa_concluido', sistema=sistema_id, nome=config['nome'], status='skipped'
+            )
+            if job_id_atual.get():
+                historico.registrar_tentativa(
+                    job_id_atual.get(), sistema_id, identificacao['cpf'], resultado['sistemas_pulados'][-1]
+                )
             continue
         
         # Sistema não requer AD, pode executar com CPF
         resultado['total_sistemas'] += 1
         logger.info(f"[PROC] Processando {config['nome']} (somente CPF)...")
         
-        resultado_rpa = executar_sistema_rpa(sistema_id, None, cpf, nome_completo)
+        resultado_rpa = executar_sistema_rpa(sistema_id, identificacao)
         resultado['detalhes'].append(resultado_rpa)
         
         if resultado_rpa['status'] == 'sucesso':
@@ -790,18 +1519,185 @@ def _executar_rpas_somente_cpf(cpf, nome_completo=None):
     return resultado
 
 
+def consultar_status_ad(cpf):
+    """Lê o status da conta do usuário no AD (somente leitura)."""
+    conn = _criar_conexao_ad()
+    
+    try:
+        search_filter = f"(&(objectClass=user)(employeeID={cpf}))"
+        attributes = [
+            'userAccountControl', 'sAMAccountName', 'displayName', 'cn', 'mail', 'userPrincipalName',
+            'givenName', 'sn'
+        ]
+        
+        with span('ad.busca', somente_leitura=True):
+            conn.search(BASE_DN, search_filter, attributes=attributes)
+        
+        if not conn.entries:
+            return {'status': 'nao_encontrado'}
+        
+        usuario = conn.entries[0]
+        uac = int(usuario.userAccountControl.value or 0)
+        
+        return {
+            'status': 'inativo' if uac & UAC_CONTA_DESATIVADA else 'ativo',
+            'login': str(usuario.sAMAccountName.value),
+            'nome': str(usuario.displayName.value) if usuario.displayName else str(usuario.cn.value),
+            'email': _extrair_email(usuario),
+            'upn': usuario.userPrincipalName.value if usuario.userPrincipalName else None,
+            'primeiro_nome': usuario.givenName.value if usuario.givenName else None,
+            'sobrenome': usuario.sn.value if usuario.sn else None,
+            'userAccountControl': uac
+        }
+        
+    finally:
+        conn.unbind()
+
+
+def consultar_status_sistema(sistema_id, identificacao, timeout):
+    """Executa o RPA do sistema no modo --status (somente leitura)."""
+    config = SISTEMAS_CONFIG[sistema_id]
+    inicio = time.monotonic()
+    
+    with contexto_log(sistema=sistema_id), span('rpa.status', sistema=sistema_id):
+        cmd = _montar_comando_rpa(sistema_id, config, identificacao, somente_status=True)
+        if cmd is None:
+            return {
+                'sistema': config['nome'],
+                'status': 'nao_executado',
+                'motivo': f"Identificação do usuário sem {config['argumentos'][0]}"
+            }
+        
+        detalhes = {}
+        try:
+            execucao = _executar_subprocesso_rpa(
+                sistema_id, cmd, min(timeout, config['timeout']), espera_admissao=timeout
+            )
+            status = RPA_CODIGOS_STATUS.get(execucao.codigo, 'erro')
+            if execucao.resultado.get('conta'):
+                detalhes['conta'] = execucao.resultado['conta']
+            if status == 'erro':
+                detalhes['erro'] = execucao.mensagem_erro()
+        except (subprocess.TimeoutExpired, TimeoutError):
+            status = 'timeout'
+    
+    logger.info(f"[AUDITORIA] {config['nome']}: {status}")
+    
+    return {
+        'sistema': config['nome'],
+        'status': status,
+        'duracao_segundos': round(time.monotonic() - inicio, 2),
+        **detalhes
+    }
+
+
+def auditar_acessos(cpf, email_usuario=None, nome_completo=None, prazo=AUDITORIA_PRAZO):
+    """Consulta, em paralelo e sem alterar nada, o status do usuário no AD e em cada sistema.
+    
+    Sistemas que usam somente CPF começam junto com o AD; os demais começam assim
+    que o AD informa o email. O que não terminar dentro do prazo fica como 'timeout'.
+    """
+    inicio = time.monotonic()
+    limite = inicio + prazo
+    
+    def restante():
+        return max(1, limite - time.monotonic())
+    
+    def submeter(funcao, *args):
+        # Cada tarefa herda o contexto de log (job_id) da requisição
+        return executor.submit(contextvars.copy_context().run, funcao, *args)
+    
+    sistemas = {
+        sid: cfg for sid, cfg in SISTEMAS_CONFIG.items()
+        if cfg['ativo'] and os.path.exists(cfg['script'])
+    }
+    
+    executor = ThreadPoolExecutor(max_workers=len(sistemas) + 1, thread_name_prefix='auditoria')
+    futuros = {}
+    resultados = {}
+    
+    try:
+        futuro_ad = submeter(consultar_status_ad, cpf)
+        
+        identificacao = montar_identificacao(cpf, email_usuario, dados={'nome': nome_completo})
+        for sid, cfg in sistemas.items():
+            if not cfg.get('requer_ad', True):
+                futuros[sid] = submeter(consultar_status_sistema, sid, identificacao, restante())
+        
+        try:
+            resultado_ad = futuro_ad.result(timeout=restante())
+        except Exception as erro:
+            resultado_ad = {'status': 'erro', 'erro': str(erro)}
+        
+        email_usuario = email_usuario or resultado_ad.get('email')
+        identificacao = montar_identificacao(cpf, email_usuario, resultado_ad, {'nome': nome_completo})
+        
+        for sid, cfg in sistemas.items():
+            if sid in futuros:
+                continue
+            if not email_usuario:
+                resultados[sid] = {
+                    'sistema': cfg['nome'],
+                    'status': 'nao_executado',
+                    'motivo': 'Email não encontrado no AD'
+                }
+                continue
+            futuros[sid] = submeter(consultar_status_sistema, sid, identificacao, restante())
+        
+        wait(futuros.values(), timeout=max(0, limite - time.monotonic()))
+        
+        for sid, futuro in futuros.items():
+            if not futuro.done():
+                resultados[sid] = {'sistema': SISTEMAS_CONFIG[sid]['nome'], 'status': 'timeout'}
+                continue
+            try:
+                resultados[sid] = futuro.result()
+            except Exception as erro:
+                resultados[sid] = {'sistema': SISTEMAS_CONFIG[sid]['nome'], 'status': 'erro', 'erro': str(erro)}
+    finally:
+        executor.shutdown(wait=False)
+    
+    todos = [resultado_ad] + list(resultados.values())
+    
+    return {
+        'cpf': cpf,
+        'possui_acesso_ativo': any(r.get('status') == 'ativo' for r in todos),
+        'inconclusivos': [
+            r.get('sistema', 'Active Directory') for r in todos
+            if r.get('status') in ('erro', 'timeout')
+        ],
+        'ad': resultado_ad,
+        'sistemas': resultados,
+        'duracao_segundos': round(time.monotonic() - inicio, 2)
+    }
+
+
 @app.route('/status', methods=['GET'])
 def status():
     """Retorna o status do servidor."""
+    with _condicao_jobs:
+        jobs_ativos = len(jobs_em_andamento)
+    
     return jsonify({
-        'status': 'online',
+        'status': 'encerrando' if servidor_encerrando.is_set() else 'online',
         'servico': 'Integração Solides - AD + Sistemas',
         'versao': '2.4',
         'timestamp': datetime.now().isoformat(),
+        'pid': os.getpid(),
+        'jobs_em_andamento': jobs_ativos,
+        'duplicatas': registro_duplicatas.estatisticas(),
         'endpoints': {
             '/webhook/solides': 'POST - Webhook principal',
             '/consulta-ad': 'POST - Consultar usuário no AD',
             '/sistemas/status': 'GET - Status dos sistemas RPA',
+            '/ad/cache': 'GET - Contadores do cache de consultas AD',
+            '/ad/desativar-lote': 'POST - Desativa uma lista de CPFs no AD',
+            '/pipeline/status': 'GET - Filas das faixas AD e RPA e admissão por memória',
+            '/jobs': 'GET - Estado resumido dos jobs recentes',
+            '/jobs/<id>/events': 'GET - Progresso do job em tempo real (SSE)',
+            '/auditoria/<cpf>': 'GET - Auditoria de acessos (somente leitura)',
+            '/historico': 'GET - Histórico dos desligamentos (filtros e paginação)',
+            '/historico/exportar': 'GET - Exporta o histórico em CSV ou NDJSON',
             '/status': 'GET - Status do serviço'
         }
     })
@@ -828,6 +1724,296 @@ def status_sistemas():
     })
 
 
+@app.route('/pipeline/status', methods=['GET'])
+def status_pipeline():
+    """Retorna a profundidade e os contadores das faixas do pipeline."""
+    with _condicao_jobs:
+        jobs = [
+            {'job_id': job['job_id'], 'cpf': job['cpf'], 'etapa': job['etapa'], 'recebido_em': job['recebido_em']}
+            for job in jobs_em_andamento.values()
+        ]
+    
+    return jsonify({
+        'backlog': backlog_pipeline(),
+        'backlog_maximo': PIPELINE_BACKLOG_MAXIMO,
+        'faixas': {
+            'ad': faixa_ad.estatisticas(),
+            'rpa': faixa_rpa.estatisticas()
+        },
+        'admissao_rpa': admissao_rpa.estatisticas(),
+        'limites_rpa': limites_rpa.estatisticas(),
+        'aquecimento_rpa': {**aquecimento_rpa.estatisticas(), **_vagas_aquecimento},
+        'processos_rpa': coletor_orfaos.estatisticas(),
+        'rastreio': exportador_spans.estatisticas(),
+        'fila_distribuida': {
+            **fila_rpa.estatisticas(),
+            'trabalhador_local': trabalhador_rpa_local.estatisticas()
+        } if RPA_DISTRIBUIDO else None,
+        'jobs_em_andamento': jobs
+    })
+
+
+@app.route('/jobs', methods=['GET'])
+def listar_jobs():
+    """Estado resumido dos jobs recentes (etapa, AD, cada sistema e email)."""
+    recusa = _consulta_nao_autorizada()
+    if recusa:
+        return recusa
+    
+    somente_ativos = request.args.get('ativos', '').lower() in ('1', 'true')
+    
+    return jsonify({
+        'pid': os.getpid(),
+        'eventos': eventos_jobs.estatisticas(),
+        'jobs': eventos_jobs.estados(somente_ativos)
+    })
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def obter_job(job_id):
+    """Estado resumido de um job."""
+    recusa = _consulta_nao_autorizada()
+    if recusa:
+        return recusa
+    
+    estado = eventos_jobs.estado(job_id)
+    if estado is None:
+        # Job de outro worker (ou já descartado do barramento): vale o histórico compartilhado
+        estado = _estado_job_historico(job_id)
+    if estado is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(estado)
+
+
+def _estado_job_historico(job_id):
+    """Estado do job a partir do histórico compartilhado, ou None se desconhecido."""
+    try:
+        job = historico.obter_job(job_id)
+    except sqlite3.Error as erro:
+        logger.warning(f"[HISTORICO] Falha ao consultar o job {job_id}: {erro}")
+        return None
+    if job is None:
+        return None
+    # Os mesmos dados do barramento: email e contas de cada sistema ficam só no /historico (com secret)
+    return {
+        'job_id': job_id,
+        'cpf': job['cpf'],
+        'colaborador': job['colaborador'],
+        'recebido_em': job['recebido_em'],
+        'finalizado': job['status_geral'] != 'em_andamento',
+        'status_geral': job['status_geral'],
+        'status_ad': job['status_ad'],
+        'duracao_segundos': job['duracao_segundos'],
+        'sistemas': [
+            {campo: tentativa[campo] for campo in ('sistema', 'nome', 'status', 'duracao_segundos', 'erro')}
+            for tentativa in job['sistemas']
+        ],
+        'origem': 'historico'
+    }
+
+
+def _eventos_job_historico(job_id, ultimo_id):
+    """Eventos SSE de um job de outro worker, montados a partir do histórico.
+    
+    Cada sistema concluído vira um rpa_concluido (id = ordem de conclusão) e o
+    fim do job um concluido. O histórico é consultado a cada EVENTOS_SSE_SONDAGEM s.
+    """
+    limite = time.monotonic() + EVENTOS_SSE_DURACAO_MAXIMA
+    ultimo_envio = time.monotonic()
+    yield f"retry: {EVENTOS_SSE_HEARTBEAT * 1000}\n\n"
+    
+    while time.monotonic() < limite:
+        estado = _estado_job_historico(job_id)
+        if estado is None:
+            return
+        
+        eventos = [
+            {'id': indice, 'job_id': job_id, 'tipo': 'rpa_concluido', 'sistema': tentativa['sistema'],
+             'nome': tentativa['nome'], 'status': tentativa['status'],
+             'duracao_segundos': tentativa['duracao_segundos'], 'erro': tentativa['erro']}
+            for indice, tentativa in enumerate(estado['sistemas'], 1)
+        ]
+        if estado['finalizado']:
+            eventos.append({'id': len(eventos) + 1, 'job_id': job_id, 'tipo': 'concluido',
+                            'status_geral': estado['status_geral'], 'duracao_segundos': estado['duracao_segundos']})
+        
+        for evento in eventos:
+            if evento['id'] > ultimo_id:
+                ultimo_id = evento['id']
+                ultimo_envio = time.monotonic()
+                yield f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+        if estado['finalizado']:
+            return
+        
+        if time.monotonic() - ultimo_envio >= EVENTOS_SSE_HEARTBEAT:
+            ultimo_envio = time.monotonic()
+            yield ": heartbeat\n\n"
+        time.sleep(EVENTOS_SSE_SONDAGEM)
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def eventos_job(job_id):
+    """Stream SSE com os eventos do job até a conclusão.
+    
+    Reconexões com o header Last-Event-ID continuam de onde pararam.
+    """
+    recusa = _consulta_nao_autorizada()
+    if recusa:
+        return recusa
+    
+    try:
+        ultimo_id = int(request.headers.get('Last-Event-ID') or request.args.get('desde') or 0)
+    except ValueError:
+        ultimo_id = 0
+    
+    if not eventos_jobs.existe(job_id):
+        if _estado_job_historico(job_id) is None:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        return Response(
+            stream_with_context(_eventos_job_historico(job_id, ultimo_id)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    def gerar(ultimo_id):
+        limite = time.monotonic() + EVENTOS_SSE_DURACAO_MAXIMA
+        yield f"retry: {EVENTOS_SSE_HEARTBEAT * 1000}\n\n"
+        
+        while time.monotonic() < limite:
+            eventos = eventos_jobs.eventos_desde(job_id, ultimo_id, timeout=EVENTOS_SSE_HEARTBEAT)
+            if eventos is None:
+                return
+            
+            if not eventos:
+                estado = eventos_jobs.estado(job_id)
+                if estado is None or estado['finalizado']:
+                    return
+                # Comentário SSE: mantém a conexão viva através de proxies
+                yield ": heartbeat\n\n"
+                continue
+            
+            for evento in eventos:
+                ultimo_id = evento['id']
+                yield f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+                if evento['tipo'] == 'concluido':
+                    return
+    
+    return Response(
+        stream_with_context(gerar(ultimo_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _consulta_nao_autorizada():
+    """Resposta 401 se o X-Webhook-Secret não conferir: rotas que expõem CPF, nome e email."""
+    secret_recebido = request.headers.get('X-Webhook-Secret')
+    if WEBHOOK_SECRET and secret_recebido != WEBHOOK_SECRET:
+        logger.warning(f"[AVISO] Consulta rejeitada ({request.path}) - Secret inválido")
+        return jsonify({'error': 'Secret inválido'}), 401
+    return None
+
+
+@app.route('/auditoria/<cpf>', methods=['GET'])
+def auditoria_acessos(cpf):
+    """Informa, sem alterar nada, se o usuário ainda possui acesso ativo em algum sistema."""
+    # Antes de qualquer sonda: cada auditoria consulta o AD e faz login em todos os sistemas
+    recusa = _consulta_nao_autorizada()
+    if recusa:
+        return recusa
+    
+    cpf = limpar_cpf(cpf)
+    if not cpf or len(cpf) != 11:
+        return jsonify({'error': 'CPF inválido'}), 400
+    
+    job_id = novo_job_id()
+    with contexto_log(job_id=job_id), span('auditoria', pai=request.headers.get('traceparent'), job_id=job_id):
+        logger.info(f"[AUDITORIA] Iniciando auditoria de acessos para CPF: {cpf}")
+        
+        try:
+            resultado = auditar_acessos(
+                cpf,
+                email_usuario=request.args.get('email'),
+                nome_completo=request.args.get('nome')
+            )
+        except Exception as e:
+            logger.error(f"[ERRO] Erro na auditoria: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+        
+        logger.info(f"[AUDITORIA] Concluída em {resultado['duracao_segundos']}s")
+        return jsonify(resultado)
+
+
+def _filtros_historico():
+    """Filtros do histórico a partir da query string (CPF normalizado)."""
+    filtros = {
+        nome: request.args.get(nome)
+        for nome in ('sistema', 'status', 'status_ad', 'classe_erro', 'job_id', 'desde', 'ate')
+    }
+    if request.args.get('cpf'):
+        filtros['cpf'] = limpar_cpf(request.args['cpf'])
+    return filtros
+
+
+@app.route('/historico', methods=['GET'])
+@app.route('/historico/<tabela>', methods=['GET'])
+def consultar_historico(tabela='jobs'):
+    """Histórico paginado: /historico (jobs com os sistemas) ou /historico/tentativas.
+    
+    Filtros: cpf, sistema, status, classe_erro, job_id, desde e ate (AAAA-MM-DD).
+    Paginação: limite e cursor (proximo_cursor da página anterior).
+    """
+    recusa = _consulta_nao_autorizada()
+    if recusa:
+        return recusa
+    
+    try:
+        pagina = historico.consultar(
+            tabela, _filtros_historico(),
+            limite=request.args.get('limite', PAGINA_PADRAO),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(pagina)
+
+
+@app.route('/historico/resumo', methods=['GET'])
+def resumo_historico():
+    """Tentativas por sistema e status, com durações e erros por classe."""
+    recusa = _consulta_nao_autorizada()
+    if recusa:
+        return recusa
+    
+    try:
+        return jsonify(historico.resumo(_filtros_historico()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/historico/exportar', methods=['GET'])
+def exportar_historico():
+    """Exporta o histórico filtrado em CSV ou NDJSON (tabela=jobs|tentativas), em streaming."""
+    recusa = _consulta_nao_autorizada()
+    if recusa:
+        return recusa
+    
+    formato = request.args.get('formato', 'ndjson')
+    tabela = request.args.get('tabela', 'jobs')
+    
+    try:
+        linhas = historico.exportar(tabela, _filtros_historico(), formato)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return Response(
+        stream_with_context(linhas),
+        mimetype='text/csv' if formato == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=historico-{tabela}.{formato}'}
+    )
+
+
 @app.route('/consulta-ad', methods=['POST'])
 def consulta_ad():
     """Consulta informações de um usuário no Active Directory."""
@@ -840,54 +2026,127 @@ def consulta_ad():
         if not login:
             return jsonify({'error': 'Informe o login (sAMAccountName)'}), 400
         
-        conn = _criar_conexao_ad()
-        logger.info("[OK] Conectado com sucesso no AD")
+        if not _semaforo_consulta_ad.acquire(timeout=AD_CONSULTA_ESPERA):
+            logger.warning("[AVISO] Limite de consultas simultâneas ao AD atingido")
+            resposta = jsonify({'error': 'Muitas consultas simultâneas ao AD, tente novamente'})
+            return resposta, 503, {'Retry-After': '1'}
         
         try:
-            search_filter = f"(&(objectClass=user)(sAMAccountName={login}))"
-            attributes = [
-                'cn', 'displayName', 'givenName', 'sn', 'sAMAccountName',
-                'mail', 'employeeID', 'employeeNumber', 'department',
-                'title', 'telephoneNumber', 'memberOf'
-            ]
-            
-            conn.search(BASE_DN, search_filter, attributes=attributes)
-            
-            if not conn.entries:
-                return jsonify({
-                    'error': 'Usuário não encontrado',
-                    'login_buscado': login,
-                    'base_dn': BASE_DN
-                }), 404
-            
-            usuario = conn.entries[0]
-            logger.info("[OK] Usuário encontrado!")
-            
-            return jsonify({
-                'success': True,
-                'informacoes_principais': {
-                    'nome_completo': str(usuario.displayName.value) if usuario.displayName else str(usuario.cn.value),
-                    'email': str(usuario.mail.value) if usuario.mail else None,
-                    'employee_id': _obter_employee_id(usuario),
-                    'login': str(usuario.sAMAccountName.value),
-                    'primeiro_nome': str(usuario.givenName.value) if usuario.givenName else None,
-                    'sobrenome': str(usuario.sn.value) if usuario.sn else None,
-                    'departamento': str(usuario.department.value) if usuario.department else None,
-                    'cargo': str(usuario.title.value) if usuario.title else None,
-                    'telefone': str(usuario.telephoneNumber.value) if usuario.telephoneNumber else None,
-                    'dn': str(usuario.entry_dn)
-                },
-                'total_encontrados': len(conn.entries)
-            })
-            
+            resultado = cache_consultas_ad.obter_ou_carregar(
+                _chave_cache_login(login),
+                lambda: consultar_usuario_por_login(login)
+            )
         finally:
-            conn.unbind()
+            _semaforo_consulta_ad.release()
+        
+        if resultado is None:
+            return jsonify({
+                'error': 'Usuário não encontrado',
+                'login_buscado': login,
+                'base_dn': BASE_DN
+            }), 404
+        
+        return jsonify({'success': True, **resultado})
         
     except Exception as e:
         logger.error(f"[ERRO] Erro na consulta AD: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/ad/desativar-lote', methods=['POST'])
+def desativar_lote_ad():
+    """Desativa no AD uma lista de CPFs (desligamentos em massa), somente no AD."""
+    secret_recebido = request.headers.get('X-Webhook-Secret')
+    if WEBHOOK_SECRET and secret_recebido != WEBHOOK_SECRET:
+        logger.warning("[AVISO] Desativação em lote rejeitada - Secret inválido")
+        return jsonify({'error': 'Secret inválido'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    cpfs = data.get('cpfs')
+    
+    if not isinstance(cpfs, list) or not cpfs:
+        return jsonify({'error': 'Informe a lista de CPFs em "cpfs"'}), 400
+    
+    if len(cpfs) > AD_LOTE_MAXIMO:
+        return jsonify({'error': f'Máximo de {AD_LOTE_MAXIMO} CPFs por requisição'}), 400
+    
+    with contexto_log(job_id=novo_job_id()):
+        inicio = time.monotonic()
+        
+        try:
+            resultados = desativar_usuarios_em_lote(cpfs)
+        except Exception as e:
+            logger.error(f"[ERRO] Erro na desativação em lote: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+        
+        resumo = {}
+        for resultado in resultados:
+            resumo[resultado['status']] = resumo.get(resultado['status'], 0) + 1
+        
+        duracao = round(time.monotonic() - inicio, 2)
+        logger.info(f"[OK] Desativação em lote concluída em {duracao}s: {resumo}")
+        
+        return jsonify({
+            'total': len(resultados),
+            'resumo': resumo,
+            'duracao_segundos': duracao,
+            'resultados': resultados
+        })
+
+
+@app.route('/ad/cache', methods=['GET'])
+def status_cache_ad():
+    """Retorna os contadores do cache de consultas ao AD."""
+    return jsonify(cache_consultas_ad.estatisticas())
+
+
+@app.route('/rpa/navegador', methods=['GET'])
+def status_cache_navegador():
+    """Retorna o tamanho e a taxa de acerto do cache em disco dos navegadores dos RPAs."""
+    return jsonify(rpa_navegador.estatisticas())
+
+
+def consultar_usuario_por_login(login):
+    """Busca no AD os atributos principais de um usuário pelo login."""
+    conn = _criar_conexao_ad()
+    logger.info("[OK] Conectado com sucesso no AD")
+    
+    try:
+        search_filter = f"(&(objectClass=user)(sAMAccountName={login}))"
+        attributes = [
+            'cn', 'displayName', 'givenName', 'sn', 'sAMAccountName',
+            'mail', 'employeeID', 'employeeNumber', 'department',
+            'title', 'telephoneNumber', 'memberOf'
+        ]
+        
+        conn.search(BASE_DN, search_filter, attributes=attributes)
+        
+        if not conn.entries:
+            return None
+        
+        usuario = conn.entries[0]
+        logger.info("[OK] Usuário encontrado!")
+        
+        return {
+            'informacoes_principais': {
+                'nome_completo': str(usuario.displayName.value) if usuario.displayName else str(usuario.cn.value),
+                'email': str(usuario.mail.value) if usuario.mail else None,
+                'employee_id': _obter_employee_id(usuario),
+                'login': str(usuario.sAMAccountName.value),
+                'primeiro_nome': str(usuario.givenName.value) if usuario.givenName else None,
+                'sobrenome': str(usuario.sn.value) if usuario.sn else None,
+                'departamento': str(usuario.department.value) if usuario.department else None,
+                'cargo': str(usuario.title.value) if usuario.title else None,
+                'telefone': str(usuario.telephoneNumber.value) if usuario.telephoneNumber else None,
+                'dn': str(usuario.entry_dn)
+            },
+            'total_encontrados': len(conn.entries)
+        }
+        
+    finally:
+        conn.unbind()
+
+
 def _obter_employee_id(usuario):
     """Obtém o employeeID ou employeeNumber do usuário."""
     if usuario.employeeID:
@@ -900,16 +2159,30 @@ def _obter_employee_id(usuario):
 @app.route('/webhook/solides', methods=['POST'])
 def webhook_solides():
     """Recebe e processa webhooks de demissão do Solides."""
+    job_id = novo_job_id()
+    
+    with contexto_log(job_id=job_id), span('webhook', pai=request.headers.get('traceparent'), job_id=job_id):
+        return _receber_webhook_solides(job_id)
+
+
+def _receber_webhook_solides(job_id):
+    """Valida o webhook e inicia o job de demissão em background."""
     try:
         logger.info("[WEBHOOK] Webhook recebido do Solides")
         
+        if servidor_encerrando.is_set():
+            logger.warning("[AVISO] Webhook recusado - servidor em encerramento")
+            return jsonify({'status': 'erro', 'motivo': 'Servidor em encerramento'}), 503, {'Retry-After': '30'}
+        
         secret_recebido = request.headers.get('X-Webhook-Secret')
         if WEBHOOK_SECRET and secret_recebido != WEBHOOK_SECRET:
             logger.warning("[AVISO] Webhook rejeitado - Secret inválido")
             return jsonify({'status': 'erro', 'motivo': 'Secret inválido'}), 401
         
         data = request.get_json()
-        logger.info(f"Body: {json.dumps(data, indent=2)}")
+        payload_log = resumir_payload(data)
+        if payload_log is not None:
+            logger.info(f"Body: {payload_log}")
         
         acao = data.get('acao')
         dados = data.get('dados', {})
@@ -926,24 +2199,40 @@ def webhook_solides():
         if not cpf or len(cpf) != 11:
             return jsonify({'status': 'erro', 'motivo': 'CPF inválido'}), 400
         
-        if _cpf_ja_processado(cpf):
+        backlog = backlog_pipeline()
+        if backlog >= PIPELINE_BACKLOG_MAXIMO:
+            logger.warning(f"[AVISO] Webhook recusado - backlog do pipeline em {backlog}")
+            resposta = jsonify({
+                'status': 'erro',
+                'motivo': 'Fila de processamento cheia, tente novamente mais tarde',
+                'backlog': backlog
+            })
+            return resposta, 429, {'Retry-After': str(PIPELINE_RETRY_AFTER)}
+        
+        chaves_duplicata = _reivindicar_cpf(cpf, data)
+        if chaves_duplicata is None:
             return jsonify({
                 'status': 'ignorado',
                 'motivo': 'CPF já processado recentemente',
                 'cpf': cpf
             })
         
-        cpfs_processados[cpf] = {'timestamp': datetime.now(), 'processando': True}
-        
         logger.info(f"🚨 DEMISSÃO DETECTADA! CPF: {cpf} - {dados.get('nome')}")
         
-        thread = threading.Thread(target=processar_demissao_async, args=(dados, cpf))
-        thread.daemon = True
-        thread.start()
+        try:
+            job = iniciar_job_demissao(dados, cpf, job_id, chaves_duplicata)
+        except Exception:
+            # Sem job não há quem finalize: o bloqueio passa a contar o TTL já
+            registro_duplicatas.finalizar(chaves_duplicata)
+            raise
         
         return jsonify({
             'status': 'aceito',
             'mensagem': 'Webhook recebido. Processamento iniciado em background.',
+            'job_id': job_id,
+            'trace_id': job['span'].trace_id,
+            'eventos': f"/jobs/{job_id}/events",
+            'backlog': backlog,
             'cpf': cpf,
             'colaborador': dados.get('nome')
         })
@@ -953,23 +2242,27 @@ def webhook_solides():
         return jsonify({'status': 'erro', 'erro': str(error)}), 500
 
 
-def _cpf_ja_processado(cpf):
-    """Verifica se o CPF já foi processado recentemente."""
-    if cpf not in cpfs_processados:
-        return False
+def _reivindicar_cpf(cpf, payload):
+    """Reivindica o CPF (e opcionalmente o hash do payload) de forma atômica.
+    
+    Retorna as chaves reivindicadas, ou None se for uma duplicata recente.
+    """
+    chaves = [(cpf, TEMPO_BLOQUEIO_DUPLICATA)]
+    if DUPLICATAS_CHAVE_PAYLOAD:
+        chaves.append((chave_payload(payload), DUPLICATAS_TTL_PAYLOAD))
     
-    ultimo = cpfs_processados[cpf]
-    tempo_desde = (datetime.now() - ultimo['timestamp']).total_seconds()
+    reivindicado, tempo_desde = registro_duplicatas.reivindicar(chaves)
     
-    if tempo_desde < TEMPO_BLOQUEIO_DUPLICATA:
+    if not reivindicado:
         logger.warning(f"[AVISO] CPF {cpf} já processado há {tempo_desde:.0f}s. Ignorando duplicata.")
-        return True
+        return None
     
-    return False
+    return chaves
 
 
 if __name__ == '__main__':
-    PORT = 3000
+    # Servidor de desenvolvimento. Em produção use: gunicorn -c gunicorn.conf.py server:app
+    PORT = int(os.getenv('PORT', 3000))
     
     print("=" * 60)
     print("🚀 SERVIDOR DE INTEGRAÇÃO SOLIDES")
@@ -980,4 +2273,4 @@ if __name__ == '__main__':
     print(f"📊 Status:   http://localhost:{PORT}/status")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=PORT, debug=True)
+    app.run(host='0.0.0.0', port=PORT, debug=os.getenv('SERVER_DEBUG', '').lower() in ('1', 'true'))